@@ -1,15 +1,15 @@
-import requests
-from bs4 import BeautifulSoup
-import sqlite3
-import hashlib
 import re
+import sys
 from collections import deque
-import time
 import os
-from urllib.parse import urljoin, urlparse
-import langdetect
-# Optional: For PDF extraction (install pdfplumber)
-import pdfplumber
+from urllib.parse import urlparse
+from page_pipeline import fetch_page  # Page step of crawl_runner's stages, looked up on this module
+from crawl_state import CrawlStateStore, link_priority, ARTICLE_FLUSH_ROWS, ARTICLE_FLUSH_SECONDS
+from near_dup import NEAR_DUP_SIMILARITY
+from language_check import LanguageDetector
+from crawl_metrics import StageClock
+from keyword_matcher import KeywordMatcher
+from crawl_runner import run_crawl, build_parser, run_options
 
 # Define agronomy categories (per Miro board: exact sequence starts here)
 CATEGORIES = {
@@ -19,6 +19,10 @@ CATEGORIES = {
     'Market Trends': ['market', 'trends', 'price', 'trade', 'economy', 'production', 'export'],
     'Plantation Management': ['plantation', 'management', 'yield', 'pests', 'irrigation', 'soil', 'farm']
 }
+# Compiled once: one word-bounded pass over the text counts every keyword occurrence
+CATEGORY_MATCHER = KeywordMatcher(CATEGORIES)
+# Seeded, bounded-input language detection with a per-prefix verdict cache
+LANGUAGE_DETECTOR = LanguageDetector()
 
 # Reputable domains for source credibility (whitelist from researched seeds)
 REPUTABLE_DOMAINS = {
@@ -134,128 +138,56 @@ SEED_URLS = [
 'https://pmc.ncbi.nlm.nih.gov/articles/PMC9183044/'
 ]
 
-# Oil palm keywords for link filtering (to maximize relevant scraping)
+# Oil palm keywords for link prioritization (best-first frontier; maximizes relevant scraping)
 OIL_PALM_KEYWORDS = ['oil palm', 'palm oil', 'elaeis guineensis', 'plantation', 'cultivation', 'processing']
 
 # DB setup
 DB_PATH = r"C:\Users\Roy\Documents\DBOilPalmmiro\oilpalmdbmiro.db"
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    # Pending queue: id, url, depth (FIFO via id)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS pending_urls (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            url TEXT UNIQUE,
-            depth INTEGER DEFAULT 0
-        )
-    ''')
-    # Visited URLs
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS visited_urls (
-            url TEXT PRIMARY KEY
-        )
-    ''')
-    # Articles (categorized storage)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS articles (
-            url TEXT PRIMARY KEY,
-            title TEXT,
-            content TEXT,
-            category TEXT,
-            scraped_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            hash TEXT UNIQUE  -- For dedup
-        )
-    ''')
-    conn.commit()
-    conn.close()
+os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+
+# Crawl state (pending/visited/articles) on one long-lived connection; opened by init_db()
+STATE = None
+
+def init_db(url_index='set', near_dup_similarity=NEAR_DUP_SIMILARITY,
+            flush_rows=ARTICLE_FLUSH_ROWS, flush_interval=ARTICLE_FLUSH_SECONDS, fts=False, content_codec='plain'):
+    global STATE
+    if STATE is None:
+        STATE = CrawlStateStore(DB_PATH, index_mode=url_index, near_dup_similarity=near_dup_similarity,
+                                flush_rows=flush_rows, flush_interval=flush_interval, fts=fts,
+                                content_codec=content_codec)
+    return STATE
+
+def close_db():
+    global STATE
+    if STATE is not None:
+        STATE.close()
+        STATE = None
 
 def add_seeds():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    for url in SEED_URLS:
-        if not is_visited(url):
-            cursor.execute("INSERT OR IGNORE INTO pending_urls (url, depth) VALUES (?, 0)", (url,))
-    conn.commit()
-    conn.close()
-
-def is_visited(url):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT url FROM visited_urls WHERE url = ?", (url,))
-    result = cursor.fetchone()
-    conn.close()
-    return result is not None
+    priorities = {url: link_priority(url, keywords=OIL_PALM_KEYWORDS) for url in SEED_URLS}
+    STATE.add_pending(SEED_URLS, 0, priorities)
 
-def add_to_pending(urls, current_depth, max_depth=float(3)):
+def add_to_pending(urls, current_depth, max_depth=float(3), anchors=None, parent_score=0):
     if current_depth >= max_depth:
         return
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    # Filter: Same/reputable domain + oil palm keywords
+    keep = []
     for url in urls:
         parsed = urlparse(url)
         domain = parsed.netloc.lower()
-        # Filter: Same/reputable domain + oil palm keywords
         if domain in REPUTABLE_DOMAINS or any(seed_domain in domain for seed_domain in REPUTABLE_DOMAINS):
-            if not is_visited(url):
-                cursor.execute("INSERT OR IGNORE INTO pending_urls (url, depth) VALUES (?, ?)", (url, current_depth + 1))
-    conn.commit()
-    conn.close()
-
-def get_next_pending():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT url, depth FROM pending_urls ORDER BY id ASC LIMIT 1")
-    result = cursor.fetchone()
-    if result:
-        url, depth = result
-        cursor.execute("DELETE FROM pending_urls WHERE url = ?", (url,))
-        conn.commit()
-        conn.close()
-        return url, depth
-    else:
-        # If no result, commit any potential changes (none in this case) and close
-        conn.commit()
-        conn.close()
-        return None, None # Return a tuple that can be safely unpacked
-
-def mark_visited(url):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("INSERT OR IGNORE INTO visited_urls (url) VALUES (?)", (url,))
-    conn.commit()
-    conn.close()
-
-# Web Crawl & Extract Raw Data (HTML/PDF)
-def fetch_raw_data(url):
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-    try:
-        time.sleep(1)  # Polite delay
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        if url.lower().endswith('.pdf'):
-            # Optional PDF: Uncomment if pdfplumber installed
-            # with pdfplumber.open(io.BytesIO(response.content)) as pdf:
-            #     text = '\n'.join(page.extract_text() or '' for page in pdf.pages)
-            # return {'title': '', 'raw_text': text}
-            return {'title': '', 'raw_text': ''}  # Skip PDF for simple
-        soup = BeautifulSoup(response.text, 'lxml')
-        title = soup.title.string.strip() if soup.title else ''
-        # Extract raw text (body, ignore scripts/styles)
-        for script in soup(["script", "style"]):
-            script.decompose()
-        raw_text = soup.get_text()
-        return {'title': title, 'raw_text': raw_text}
-    except Exception as e:
-        print(f"Fetch error for {url}: {e}")
-        return None
+            keep.append(url)
+    # Best-first: score each link from its URL, anchor text and the parent page
+    anchors = anchors or {}
+    priorities = {url: link_priority(url, anchors.get(url, ''), parent_score, OIL_PALM_KEYWORDS) for url in keep}
+    STATE.add_pending(keep, current_depth + 1, priorities)
 
 # Preprocess Data: Clean & Normalize
 def preprocess_data(raw_data):
     if not raw_data or not raw_data['raw_text']:
         return ''
+    if raw_data.get('normalized'):
+        return raw_data['raw_text']  # Cleaned during extraction (page_pipeline streaming path)
     text = raw_data['raw_text']
     # Clean: Remove extra whitespace, non-alpha, normalize
     text = re.sub(r'\s+', ' ', text)  # Normalize spaces
@@ -264,38 +196,37 @@ def preprocess_data(raw_data):
     return text
 
 # Automated Classification (NLP-based: keyword scoring)
-def classify_text(text):
-    scores = {cat: sum(1 for kw in kws if kw in text) for cat, kws in CATEGORIES.items()}
+def category_scores(text):
+    # Keyword frequency per category (whole words only)
+    return CATEGORY_MATCHER.scores(text)
+
+def classify_text(text, scores=None):
+    if scores is None:
+        scores = category_scores(text)
     max_score = max(scores.values())
     if max_score == 0:
         return 'Uncategorized'
     return max(cat for cat, score in scores.items() if score == max_score)
 
 # Quality Assurance Layer
-def quality_assurance(url, title, content):
+def quality_assurance(url, title, content, declared_lang=None, clock=None):
+    """
+    Content checks; no DB access, so safe in the CPU process pool. Returns (ok, reason).
+    With a StageClock the language and domain checks are timed (qa.language, qa.domain).
+    """
+    clock = clock or StageClock()
     # Language check
-    try:
-        lang = langdetect.detect(content)
-        if lang != 'en':
-            print(f"Flagged: Non-English ({lang}) for {url}")
-            return False, 'Language'
-    except:
-        pass  # Assume English if detect fails
-
-    # Deduplication (hash content)
-    content_hash = hashlib.md5(content.encode()).hexdigest()
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT hash FROM articles WHERE hash = ?", (content_hash,))
-    if cursor.fetchone():
-        print(f"Flagged: Duplicate for {url}")
-        conn.close()
-        return False, 'Duplicate'
-    conn.close()
+    with clock('qa.language'):
+        lang = LANGUAGE_DETECTOR.detect(url, content, declared_lang)
+    if lang and lang != 'en':  # None = undetectable, assume English
+        print(f"Flagged: Non-English ({lang}) for {url}")
+        return False, 'Language'
 
     # Source credibility
-    domain = urlparse(url).netloc.lower()
-    if domain not in REPUTABLE_DOMAINS:
+    with clock('qa.domain'):
+        domain = urlparse(url).netloc.lower()
+        credible = domain in REPUTABLE_DOMAINS
+    if not credible:
         print(f"Flagged: Low credibility domain {domain} for {url}")
         return False, 'Source'
 
@@ -307,81 +238,31 @@ def quality_assurance(url, title, content):
         print(f"Flagged: Too short for {url}")
         return False, 'Short'
 
-    return True, content_hash
-
-# Store in Single DB & Categorize
-def store_article(url, title, content, category, content_hash):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO articles (url, title, content, category, hash)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (url, title, content, category, content_hash))
-    conn.commit()
-    conn.close()
-    print(f"Stored: {title[:50]}... in {category}")
-
-# Main Pipeline (exact Miro sequence)
-def main():
-    init_db()
-    add_seeds()
-    processed_count = 0
-    max_items = float('inf')  # Optional cap; set to float('inf') for unlimited
-
-    while True:
-        try:
-            next_url, depth = get_next_pending()
-            if next_url is None:
-                print("Queue empty. Scraping complete.")
-                break
-            if is_visited(next_url):
-                continue
-
-            print(f"Processing: {next_url} (depth {depth})")
-            mark_visited(next_url)
-
-            # Extract Raw Data
-            raw_data = fetch_raw_data(next_url)
-            if not raw_data:
-                continue
-
-            # Preprocess Data
-            content = preprocess_data(raw_data)
-
-            # Automated Classification
-            category = classify_text(content)
-
-            # Quality Assurance (Delete/Flag if fails)
-            meets_standards, result = quality_assurance(next_url, raw_data['title'], content)
-            if not meets_standards:
-                print(f"Deleted/Flagged: {result} for {next_url}")
-                continue
+    return True, None
 
-            # Data Meets Standards? Yes → Store
-            store_article(next_url, raw_data['title'], content, category, result)
-            processed_count += 1
-
-           # Add new links to pending (crawl continuation)
-            soup = BeautifulSoup(requests.get(next_url).text, 'lxml')
-            raw_links = [a.get('href') for a in soup.find_all('a', href=True) if a.get('href')]
-            # Normalize links by removing fragments (#) and remove duplicates from the page
-            clean_links = {urljoin(next_url, link).split('#')[0] for link in raw_links}
-            add_to_pending(list(clean_links), depth)
+def duplicate_check(url, content_hash, fingerprint):
+    """Dedup against stored articles (DB reads; runs on the writer). Returns (ok, reason)."""
+    # Deduplication (hash content)
+    if STATE.hash_exists(content_hash):
+        print(f"Flagged: Duplicate for {url}")
+        return False, 'Duplicate'
 
-            if processed_count >= max_items:
-                print(f"Reached max items ({max_items}). Stopping.")
-                break
+    # Near-duplicate (SimHash): mirrors, syndicated copies, pages differing only by a date or sidebar
+    near = STATE.near_duplicate_of(fingerprint, exclude_url=url)
+    if near:
+        print(f"Flagged: Near-duplicate of {near} for {url}")
+        return False, 'Near-duplicate'
 
-            time.sleep(2)  # Delay for politeness
+    return True, None
 
-        except KeyboardInterrupt:
-            print("\nInterrupted. Progress saved to DB. Rerun to resume.")
-            break
-        except Exception as e:
-            print(f"Error: {e}")
-            continue
+# Store in Single DB & Categorize
+def store_article(url, title, content, category, content_hash, fingerprint=None):
+    STATE.store_article(url, title, content, category, content_hash, fingerprint)
+    print(f"Stored: {title[:50]}... in {category}")
 
-    print(f"Total processed: {processed_count}")
+# Main Pipeline (page stages, run loop and CLI flags: crawl_runner.py; it calls the page steps above)
+def main(**options):
+    run_crawl(sys.modules[__name__], **options)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(**run_options(build_parser("Oil palm scraper.").parse_args()))
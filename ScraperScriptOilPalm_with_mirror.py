@@ -1,18 +1,21 @@
 # ScraperScriptOilPalm.py
-import requests
-from bs4 import BeautifulSoup
 import sqlite3
-import hashlib
 import re
+import sys
 from collections import deque, defaultdict
-import time
 import os
-from urllib.parse import urljoin, urlparse
-import langdetect
-import argparse
-# Optional: For PDF extraction (install pdfplumber)
-import pdfplumber
+import threading
+from urllib.parse import urlparse
 import json
+from page_pipeline import fetch_page  # Page step of crawl_runner's stages, looked up on this module
+from crawl_state import CrawlStateStore, link_priority, ARTICLE_FLUSH_ROWS, ARTICLE_FLUSH_SECONDS
+from near_dup import NEAR_DUP_SIMILARITY
+from language_check import LanguageDetector
+from crawl_metrics import StageClock
+from search_index import enable_fts, has_fts
+from content_codec import ContentCodec, ensure_schema, register_functions, copy_dictionaries
+from keyword_matcher import KeywordMatcher
+from crawl_runner import run_crawl, build_parser, run_options
 
 # -------------------- Your original config --------------------
 CATEGORIES = {
@@ -22,6 +25,10 @@ CATEGORIES = {
     'Market Trends': ['market', 'trends', 'price', 'trade', 'economy', 'production', 'export'],
     'Plantation Management': ['plantation', 'management', 'yield', 'pests', 'irrigation', 'soil', 'farm']
 }
+# Compiled once: one word-bounded pass over the text counts every keyword occurrence
+CATEGORY_MATCHER = KeywordMatcher(CATEGORIES)
+# Seeded, bounded-input language detection with a per-prefix verdict cache
+LANGUAGE_DETECTOR = LanguageDetector()
 
 REPUTABLE_DOMAINS = {
     'eos.com', 'ourworldindata.org', 'iucn.org', 'farmonaut.com', 'cabiagbio.biomedcentral.com',
@@ -36,16 +43,21 @@ SEED_URLS = [
     # ... (kept as in your original list) ...
 ]
 
+# Oil palm keywords for link prioritization (best-first frontier)
 OIL_PALM_KEYWORDS = ['oil palm', 'palm oil', 'elaeis guineensis', 'plantation', 'cultivation', 'processing']
 
 DB_PATH = r"C:\Users\Roy\Documents\DBOilPalmmiro\oilpalmdbmiro.db"
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
 
 # -------------------- New: category DB mirroring support --------------------
 # Cache of open category DB connections: category_name -> {'conn': sqlite3.Connection, 'path': path}
 _CATEGORY_DB_CACHE = {}
 # Whether to mirror to per-category DBs; set by CLI flag
 MIRROR_CATEGORY_DBS = False
+# Serializes category DB writes when the concurrent engine runs store_article on worker threads
+_CATEGORY_DB_LOCK = threading.Lock()
+# Whether category DBs get the full-text index too; set by --fts
+FTS_INDEX = False
 
 def sanitize_filename(name: str) -> str:
     """Make a safe filename for category DBs."""
@@ -70,11 +82,12 @@ def _open_category_db(category_name: str):
     fname = sanitize_filename(category_name) + ".db"
     folder = os.path.dirname(DB_PATH) or "."
     out_path = os.path.join(folder, fname)
-    conn = sqlite3.connect(out_path)
+    conn = sqlite3.connect(out_path, check_same_thread=False)
     # performance pragmas (safe)
     conn.execute("PRAGMA journal_mode = WAL;")
     conn.execute("PRAGMA synchronous = NORMAL;")
     conn.execute("PRAGMA foreign_keys = OFF;")
+    conn.execute("PRAGMA recursive_triggers = ON;")
     # Ensure articles table schema exists (match source)
     conn.execute('''
         CREATE TABLE IF NOT EXISTS articles (
@@ -83,10 +96,15 @@ def _open_category_db(category_name: str):
             content TEXT,
             category TEXT,
             scraped_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            hash TEXT UNIQUE
+            hash TEXT UNIQUE,
+            codec TEXT
         )
     ''')
     conn.commit()
+    ensure_schema(conn)
+    register_functions(conn)
+    if FTS_INDEX or has_fts(conn):
+        enable_fts(conn, compressed=STATE is not None and STATE.codec.tag is not None)
     _CATEGORY_DB_CACHE[key] = {'conn': conn, 'path': out_path}
     return conn
 
@@ -100,258 +118,181 @@ def _close_all_category_dbs():
             pass
     _CATEGORY_DB_CACHE.clear()
 
-# -------------------- original DB setup --------------------
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS pending_urls (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            url TEXT UNIQUE,
-            depth INTEGER DEFAULT 0
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS visited_urls (
-            url TEXT PRIMARY KEY
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS articles (
-            url TEXT PRIMARY KEY,
-            title TEXT,
-            content TEXT,
-            category TEXT,
-            scraped_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            hash TEXT UNIQUE  -- For dedup
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-# -------------------- helpers (unchanged) --------------------
+def _move_mirrored_articles(conn, changes):
+    """After a reclassify chunk: move each relabelled article to its new category DB."""
+    codec = ContentCodec(conn)
+    for _rowid, url, old, new in changes:
+        row = conn.execute("SELECT url, title, content, codec, category, scraped_date, hash FROM articles WHERE url = ?",
+                           (url,)).fetchone()
+        if row is None:
+            continue
+        try:
+            with _CATEGORY_DB_LOCK:
+                old_conn = _open_category_db(old if old and str(old).strip() else 'Uncategorized')
+                old_conn.execute("DELETE FROM articles WHERE url = ?", (url,))
+                old_conn.commit()
+                new_conn = _open_category_db(new)
+                copy_dictionaries(codec, new_conn, [row[3]])
+                new_conn.execute('''
+                    INSERT OR REPLACE INTO articles (url, title, content, codec, category, scraped_date, hash)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', row)
+                new_conn.commit()
+        except Exception as e:
+            print(f"Error moving {url} from category DB '{old}' to '{new}': {e}")
+
+# -------------------- original DB setup (now one persistent connection) --------------------
+# Crawl state (pending/visited/articles) on one long-lived connection; opened by init_db()
+STATE = None
+
+def init_db(url_index='set', near_dup_similarity=NEAR_DUP_SIMILARITY,
+            flush_rows=ARTICLE_FLUSH_ROWS, flush_interval=ARTICLE_FLUSH_SECONDS, fts=False, content_codec='plain'):
+    global STATE
+    if STATE is None:
+        STATE = CrawlStateStore(DB_PATH, index_mode=url_index, near_dup_similarity=near_dup_similarity,
+                                flush_rows=flush_rows, flush_interval=flush_interval, fts=fts,
+                                content_codec=content_codec)
+    return STATE
+
+def close_db():
+    global STATE
+    if STATE is not None:
+        STATE.close()
+        STATE = None
+
+# -------------------- helpers --------------------
 def add_seeds():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    for url in SEED_URLS:
-        if not is_visited(url):
-            cursor.execute("INSERT OR IGNORE INTO pending_urls (url, depth) VALUES (?, 0)", (url,))
-    conn.commit()
-    conn.close()
-
-def is_visited(url):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT url FROM visited_urls WHERE url = ?", (url,))
-    result = cursor.fetchone()
-    conn.close()
-    return result is not None
+    priorities = {url: link_priority(url, keywords=OIL_PALM_KEYWORDS) for url in SEED_URLS}
+    STATE.add_pending(SEED_URLS, 0, priorities)
 
-def add_to_pending(urls, current_depth, max_depth=float(3)):
+def add_to_pending(urls, current_depth, max_depth=float(3), anchors=None, parent_score=0):
     if current_depth >= max_depth:
         return
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    keep = []
     for url in urls:
         parsed = urlparse(url)
         domain = parsed.netloc.lower()
         if domain in REPUTABLE_DOMAINS or any(seed_domain in domain for seed_domain in REPUTABLE_DOMAINS):
-            if not is_visited(url):
-                cursor.execute("INSERT OR IGNORE INTO pending_urls (url, depth) VALUES (?, ?)", (url, current_depth + 1))
-    conn.commit()
-    conn.close()
-
-def get_next_pending():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT url, depth FROM pending_urls ORDER BY id ASC LIMIT 1")
-    result = cursor.fetchone()
-    if result:
-        url, depth = result
-        cursor.execute("DELETE FROM pending_urls WHERE url = ?", (url,))
-        conn.commit()
-        conn.close()
-        return url, depth
-    else:
-        conn.commit()
-        conn.close()
-        return None, None
-
-def mark_visited(url):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("INSERT OR IGNORE INTO visited_urls (url) VALUES (?)", (url,))
-    conn.commit()
-    conn.close()
-
-# -------------------- Web fetch & preprocess (unchanged) --------------------
-def fetch_raw_data(url):
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-    try:
-        time.sleep(1)
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        if url.lower().endswith('.pdf'):
-            return {'title': '', 'raw_text': ''}
-        soup = BeautifulSoup(response.text, 'lxml')
-        title = soup.title.string.strip() if soup.title else ''
-        for script in soup(["script", "style"]):
-            script.decompose()
-        raw_text = soup.get_text()
-        return {'title': title, 'raw_text': raw_text}
-    except Exception as e:
-        print(f"Fetch error for {url}: {e}")
-        return None
+            keep.append(url)
+    # Best-first: score each link from its URL, anchor text and the parent page
+    anchors = anchors or {}
+    priorities = {url: link_priority(url, anchors.get(url, ''), parent_score, OIL_PALM_KEYWORDS) for url in keep}
+    STATE.add_pending(keep, current_depth + 1, priorities)
 
+# -------------------- Preprocess (fetching lives in page_pipeline.py) --------------------
 def preprocess_data(raw_data):
     if not raw_data or not raw_data['raw_text']:
         return ''
+    if raw_data.get('normalized'):
+        return raw_data['raw_text']  # Cleaned during extraction (page_pipeline streaming path)
     text = raw_data['raw_text']
     text = re.sub(r'\s+', ' ', text)
     text = re.sub(r'[^\w\s\.\,\!\?]', '', text)
     text = text.strip().lower()
     return text
 
-def classify_text(text):
-    scores = {cat: sum(1 for kw in kws if kw in text) for cat, kws in CATEGORIES.items()}
+def category_scores(text):
+    # Keyword frequency per category (whole words only)
+    return CATEGORY_MATCHER.scores(text)
+
+def classify_text(text, scores=None):
+    if scores is None:
+        scores = category_scores(text)
     max_score = max(scores.values())
     if max_score == 0:
         return 'Uncategorized'
     return max(cat for cat, score in scores.items() if score == max_score)
 
-def quality_assurance(url, title, content):
-    try:
-        lang = langdetect.detect(content)
-        if lang != 'en':
-            print(f"Flagged: Non-English ({lang}) for {url}")
-            return False, 'Language'
-    except:
-        pass
-    content_hash = hashlib.md5(content.encode()).hexdigest()
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT hash FROM articles WHERE hash = ?", (content_hash,))
-    if cursor.fetchone():
-        print(f"Flagged: Duplicate for {url}")
-        conn.close()
-        return False, 'Duplicate'
-    conn.close()
-    domain = urlparse(url).netloc.lower()
-    if domain not in REPUTABLE_DOMAINS:
+def quality_assurance(url, title, content, declared_lang=None, clock=None):
+    """
+    Content checks; no DB access, so safe in the CPU process pool. Returns (ok, reason).
+    With a StageClock the language and domain checks are timed (qa.language, qa.domain).
+    """
+    clock = clock or StageClock()
+    with clock('qa.language'):
+        lang = LANGUAGE_DETECTOR.detect(url, content, declared_lang)
+    if lang and lang != 'en':  # None = undetectable, assume English
+        print(f"Flagged: Non-English ({lang}) for {url}")
+        return False, 'Language'
+    with clock('qa.domain'):
+        domain = urlparse(url).netloc.lower()
+        credible = domain in REPUTABLE_DOMAINS
+    if not credible:
         print(f"Flagged: Low credibility domain {domain} for {url}")
         return False, 'Source'
     if len(content) < 100:
         print(f"Flagged: Too short for {url}")
         return False, 'Short'
-    return True, content_hash
+    return True, None
+
+def duplicate_check(url, content_hash, fingerprint):
+    """Dedup against stored articles (DB reads; runs on the writer). Returns (ok, reason)."""
+    if STATE.hash_exists(content_hash):
+        print(f"Flagged: Duplicate for {url}")
+        return False, 'Duplicate'
+    # Near-duplicate (SimHash): mirrors, syndicated copies, pages differing only by a date or sidebar
+    near = STATE.near_duplicate_of(fingerprint, exclude_url=url)
+    if near:
+        print(f"Flagged: Near-duplicate of {near} for {url}")
+        return False, 'Near-duplicate'
+    return True, None
 
 # -------------------- Modified storage: mirror to category DBs --------------------
-def store_article(url, title, content, category, content_hash):
+def store_article(url, title, content, category, content_hash, fingerprint=None):
     """
-    Store into the main DB and (optionally) also into a per-category DB file.
+    Store into the main DB and (optionally) also into a per-category DB file;
+    the mirror copy is written with each group commit by _mirror_articles.
     """
-    # store in main DB (unchanged behavior)
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO articles (url, title, content, category, hash)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (url, title, content, category, content_hash))
-    conn.commit()
-    conn.close()
+    # store in main DB (buffered; written by the next group commit)
+    STATE.store_article(url, title, content, category, content_hash, fingerprint)
     print(f"Stored: {title[:50]}... in main DB as {category}")
 
-    # Mirror to per-category DBs if enabled
-    if not MIRROR_CATEGORY_DBS:
-        return
-
-    # Ensure category value exists
-    if not category or str(category).strip() == '':
-        cat_name = 'Uncategorized'
-    else:
-        cat_name = category
-
-    try:
-        cat_conn = _open_category_db(cat_name)
-        # Insert into category DB's articles table
-        cat_cursor = cat_conn.cursor()
-        cat_cursor.execute('''
-            INSERT OR REPLACE INTO articles (url, title, content, category, hash)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (url, title, content, category, content_hash))
-        cat_conn.commit()
-        print(f"Mirrored: {title[:50]}... -> {sanitize_filename(cat_name)}.db")
-    except Exception as e:
-        print(f"Error mirroring to category DB '{cat_name}': {e}")
-
-# -------------------- Main pipeline (slight change: close category DBs on exit) --------------------
-def main(mirror_category_dbs=False):
-    global MIRROR_CATEGORY_DBS
-    MIRROR_CATEGORY_DBS = mirror_category_dbs
-
-    init_db()
-    add_seeds()
-    processed_count = 0
-    max_items = float('inf')
-
-    while True:
+def _mirror_articles(rows):
+    """
+    Flush hook: copy a committed batch of articles [(url, title, content, codec, category, hash)]
+    into the per-category DBs, one transaction per category DB. Content is copied as stored.
+    """
+    by_category = {}
+    for row in rows:
+        category = row[4]
+        # Ensure category value exists
+        cat_name = 'Uncategorized' if not category or str(category).strip() == '' else category
+        by_category.setdefault(cat_name, []).append(row)
+
+    for cat_name, cat_rows in by_category.items():
         try:
-            next_url, depth = get_next_pending()
-            if next_url is None:
-                print("Queue empty. Scraping complete.")
-                break
-            if is_visited(next_url):
-                continue
-
-            print(f"Processing: {next_url} (depth {depth})")
-            mark_visited(next_url)
-
-            raw_data = fetch_raw_data(next_url)
-            if not raw_data:
-                continue
-
-            content = preprocess_data(raw_data)
-            category = classify_text(content)
-
-            meets_standards, result = quality_assurance(next_url, raw_data['title'], content)
-            if not meets_standards:
-                print(f"Deleted/Flagged: {result} for {next_url}")
-                continue
-
-            store_article(next_url, raw_data['title'], content, category, result)
-            processed_count += 1
-
-            # Continue crawl: extract links, add them to pending
-            try:
-                page = requests.get(next_url, timeout=10)
-                soup = BeautifulSoup(page.text, 'lxml')
-                raw_links = [a.get('href') for a in soup.find_all('a', href=True) if a.get('href')]
-                clean_links = {urljoin(next_url, link).split('#')[0] for link in raw_links}
-                add_to_pending(list(clean_links), depth)
-            except Exception as e:
-                # If fetching links fails, skip adding new links for this page
-                pass
-
-            if processed_count >= max_items:
-                print(f"Reached max items ({max_items}). Stopping.")
-                break
-
-            time.sleep(2)
-
-        except KeyboardInterrupt:
-            print("\nInterrupted. Progress saved to DB. Rerun to resume.")
-            break
+            with _CATEGORY_DB_LOCK:
+                cat_conn = _open_category_db(cat_name)
+                with cat_conn:
+                    copy_dictionaries(STATE.codec, cat_conn, [row[3] for row in cat_rows])
+                    cat_conn.executemany('''
+                        INSERT OR REPLACE INTO articles (url, title, content, codec, category, hash)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', cat_rows)
+            print(f"Mirrored: {len(cat_rows)} article(s) -> {sanitize_filename(cat_name)}.db")
         except Exception as e:
-            print(f"Error: {e}")
-            continue
+            print(f"Error mirroring to category DB '{cat_name}': {e}")
 
-    # close any open category DBs
-    _close_all_category_dbs()
-    print(f"Total processed: {processed_count}")
+# -------------------- Main pipeline (crawl_runner.py) + category DB hooks --------------------
+def main(mirror_category_dbs=False, fts=False, **options):
+    """
+    run_crawl() with this script's page steps; with mirror_category_dbs, each
+    flushed batch is mirrored and --reclassify moves relabelled articles.
+    """
+    global MIRROR_CATEGORY_DBS, FTS_INDEX
+    MIRROR_CATEGORY_DBS = mirror_category_dbs
+    FTS_INDEX = fts
+    try:
+        run_crawl(sys.modules[__name__], fts=fts,
+                  flush_hook=_mirror_articles if mirror_category_dbs else None,
+                  on_reclassify=_move_mirrored_articles if mirror_category_dbs else None, **options)
+    finally:
+        # after close_db() (final article flush, which also writes the mirrors): close the category DBs
+        _close_all_category_dbs()
 
 # -------------------- CLI entry --------------------
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Oil palm scraper with optional per-category DB mirroring.")
+    parser = build_parser("Oil palm scraper with optional per-category DB mirroring.")
     parser.add_argument('--mirror-category-dbs', action='store_true', help='Also write each saved article into a per-category DB file (one DB per category).')
     args = parser.parse_args()
-    main(mirror_category_dbs=args.mirror_category_dbs)
+    main(mirror_category_dbs=args.mirror_category_dbs, **run_options(args))
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""
+bench_crawl.py
+
+Offline crawl benchmark: runs a scraper's main() against a synthetic oil-palm
+corpus served from local HTTP servers, so changes can be measured without
+hitting real sites or their rate limits.
+
+The corpus is generated from --seed (every run with the same settings sees
+the same pages):
+ - HTML articles spread over --hosts stand-in hosts, one local server each so
+   per-host politeness works as on the real REPUTABLE_DOMAINS; pages link
+   across hosts and every article is reachable within the crawl depth
+ - PDF reports (small generated PDFs, extracted by pdf_extract)
+ - exact duplicates and near-duplicates of other articles, non-English pages
+   and links to hosts outside the whitelist
+ - English articles served with a charset nobody knows (BAD_CHARSET); every
+   one of them must still be stored, the report flags any that were lost
+
+Reported, and saved as JSON with --out: pages/sec, stored articles/sec,
+latency percentiles per stage (fetch, preprocess, classify, qa, dedup, store,
+enqueue), QA rejections, DB bytes on disk and peak RSS. --compare prints the
+change against an earlier JSON file and exits with status 1 if a metric got
+worse by more than REGRESSION_THRESHOLD (status 1 as well if a bad-charset
+page was lost).
+
+Stages are timed by wrapping the script's functions in this process; with
+--cpu-workers the preprocess/classify/qa stages run in the process pool and
+are not timed.
+
+Usage examples:
+    python bench_crawl.py --out before.json
+    python bench_crawl.py --out after.json --compare before.json
+    python bench_crawl.py --script ScraperScriptOilPalm_with_mirror --mirror-category-dbs --workers 8 --cpu-workers 4
+    python bench_crawl.py --pages 3000 --hosts 12 --keep
+"""
+
+import argparse
+import contextlib
+import functools
+import glob
+import http.server
+import importlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS comes from psutil if it is installed
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# ----------------- Config -----------------
+BENCH_SCRIPTS = ('ScraperScriptOilPalm', 'ScraperScriptOilPalm_with_mirror')
+BENCH_PAGES = 500
+BENCH_HOSTS = 6
+BENCH_SEED = 1
+# Share of the corpus that is PDF / exact duplicate / near-duplicate / non-English / bad charset
+PDF_SHARE = 0.03
+DUPLICATE_SHARE = 0.05
+NEAR_DUPLICATE_SHARE = 0.05
+NON_ENGLISH_SHARE = 0.05
+BAD_CHARSET_SHARE = 0.02
+BAD_CHARSET = 'bogus-xyz'
+# Extra random links per page (on top of the links that make every page reachable)
+CROSS_LINKS = 4
+# Per-host delay for the run (the real default would make a local benchmark mostly sleep)
+BENCH_HOST_DELAY = 0.01
+# add_to_pending's default max_depth: the corpus keeps every page within it
+CRAWL_DEPTH = 3
+# --compare flags a metric that got worse by more than this fraction
+REGRESSION_THRESHOLD = 0.10
+# ------------------------------------------
+
+STAGES = [
+    # (stage, function in the scraper script)
+    ('fetch', 'fetch_page'),          # download + streaming HTML parse
+    ('preprocess', 'preprocess_data'),
+    ('classify', 'category_scores'),
+    ('qa', 'quality_assurance'),
+    ('dedup', 'duplicate_check'),
+    ('store', 'store_article'),
+    ('enqueue', 'add_to_pending'),
+]
+
+ENGLISH_WORDS = (
+    "the of and to in is that for on with as by are this from at which be an was it "
+    "oil palm plantation smallholder yield fruit bunch mill harvest soil growers estate "
+    "production export price market trade demand supply cultivation planting seedlings "
+    "fertilizer irrigation pests processing extraction refining crude kernel effluent "
+    "deforestation biodiversity peat carbon emissions sustainability certification climate "
+    "management labour farm land hectares report study data growth region tropical"
+).split()
+NON_ENGLISH_WORDS = {
+    'id': ("kelapa sawit perkebunan dan yang di untuk dengan adalah ini dari dalam tidak akan pada juga "
+           "petani hasil panen tanah harga pasar produksi minyak pabrik pengolahan lingkungan hutan").split(),
+    'es': ("la el de que y en los del se las por un para con una su al lo como palma aceite "
+           "plantación cultivo producción mercado precio agricultores suelo cosecha bosque").split(),
+}
+
+def _sentence(rnd, words, topic_words, n):
+    picked = [rnd.choice(topic_words) if rnd.random() < 0.25 else rnd.choice(words) for _ in range(n)]
+    return ' '.join(picked).capitalize() + '.'
+
+def _paragraphs(rnd, words, topic_words, n_words):
+    out, left = [], n_words
+    while left > 0:
+        n = min(left, rnd.randint(12, 30))
+        out.append(_sentence(rnd, words, topic_words, n))
+        left -= n
+    return [' '.join(out[i:i + 5]) for i in range(0, len(out), 5)]
+
+def make_pdf(title, text, width=90):
+    """A minimal one-page PDF (Helvetica text lines, Title in the Info dictionary)."""
+    def esc(s):
+        return s.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    lines, line = [], ''
+    for word in text.split():
+        if len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = ''
+        line = f"{line} {word}".strip()
+    lines.append(line)
+    ops = ['BT', '/F1 9 Tf', '11 TL', '40 800 Td']
+    ops += [f'({esc(ln)}) Tj T*' for ln in lines[:70]]
+    ops.append('ET')
+    stream = '\n'.join(ops).encode('latin-1', 'replace')
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>',
+        b'<< /Length ' + str(len(stream)).encode() + b' >>\nstream\n' + stream + b'\nendstream',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+        f'<< /Title ({esc(title)}) >>'.encode('latin-1', 'replace'),
+    ]
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f'{i} 0 obj\n'.encode() + obj + b'\nendobj\n'
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    out += ''.join(f'{off:010d} 00000 n \n' for off in offsets).encode()
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R /Info 6 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return bytes(out)
+
+def _html(title, paragraphs, links, lang=None):
+    lang_attr = f' lang="{lang}"' if lang else ''
+    body = ''.join(f'<p>{p}</p>' for p in paragraphs)
+    nav = ''.join(f'<a href="{href}">{anchor}</a> ' for href, anchor in links)
+    return (f'<!DOCTYPE html><html{lang_attr}><head><meta charset="utf-8"><title>{title}</title>'
+            f'<style>body{{font-family:sans-serif}}</style></head><body>'
+            f'<nav><a href="/">Home</a> <a href="/about.html">About</a></nav>'
+            f'<article><h1>{title}</h1>{body}</article><aside>Related: {nav}</aside>'
+            f'<script>var tracking = true;</script></body></html>').encode('utf-8')
+
+def build_corpus(n_pages, n_hosts, categories, seed=BENCH_SEED):
+    """
+    Plan of the synthetic site: ({host index: {path: (content_type, body)}},
+    seed (host, path) list, {kind: count}). Pages form a tree (fan-out sized
+    so every page is within CRAWL_DEPTH of the root) plus random cross links;
+    special pages (PDFs, duplicates, non-English) are leaves.
+    """
+    rnd = random.Random(seed)
+    fanout = max(2, math.ceil(n_pages ** (1.0 / CRAWL_DEPTH)) + 1)
+    host_of = [0] + [rnd.randrange(n_hosts) for _ in range(n_pages - 1)]
+    leaves = [k for k in range(n_pages) if k * fanout + 1 >= n_pages]
+    rnd.shuffle(leaves)
+    kinds = {}
+    for kind, share in (('pdf', PDF_SHARE), ('duplicate', DUPLICATE_SHARE),
+                        ('near_duplicate', NEAR_DUPLICATE_SHARE), ('non_english', NON_ENGLISH_SHARE),
+                        ('bad_charset', BAD_CHARSET_SHARE)):
+        for _ in range(int(n_pages * share)):
+            if leaves:
+                kinds[leaves.pop()] = kind
+    cat_names = list(categories)
+    topic = [cat_names[rnd.randrange(len(cat_names))] for _ in range(n_pages)]
+
+    def path_of(k):
+        kind = kinds.get(k, 'html')
+        if kind == 'pdf':
+            return f'/reports/oil-palm-report-{k}.pdf'
+        if kind == 'non_english':
+            return f'/intl/berita-sawit-{k}.html'
+        if kind == 'bad_charset':
+            return f'/archive/{topic[k].lower().replace(" ", "-")}-{k}.html'
+        return f'/articles/{topic[k].lower().replace(" ", "-")}-{k}.html'
+
+    def url_of(k, from_host):
+        # Same-host links are relative, cross-host links absolute ({host} filled in at serve time)
+        return path_of(k) if host_of[k] == from_host else f'{{host{host_of[k]}}}{path_of(k)}'
+
+    sites = defaultdict(dict)
+    plans = {}
+    counts = Counter()
+    for k in range(n_pages):
+        kind = kinds.get(k, 'html')
+        h = host_of[k]
+        keywords = [w for kw in categories[topic[k]] for w in kw.split()]
+        children = range(k * fanout + 1, min(n_pages, k * fanout + fanout + 1))
+        targets = list(children) + [rnd.randrange(n_pages) for _ in range(CROSS_LINKS)]
+        title = f"Oil palm {topic[k].lower()} update {k}"
+        if kind in ('duplicate', 'near_duplicate'):
+            # Syndicated copy of another article (same text and links); whichever is crawled second is rejected
+            original = rnd.randrange(max(1, k // 2))
+            while original in kinds and original > 0:
+                original -= 1
+            title, paragraphs, targets = plans[original]
+            paragraphs = list(paragraphs)
+            if kind == 'near_duplicate':
+                paragraphs[0] = f"Updated {rnd.randint(1, 28)} March 2024. " + paragraphs[0]
+        elif kind == 'non_english':
+            lang = rnd.choice(sorted(NON_ENGLISH_WORDS))
+            words = NON_ENGLISH_WORDS[lang]
+            paragraphs = _paragraphs(rnd, words, words, rnd.randint(300, 700))
+        else:
+            paragraphs = _paragraphs(rnd, ENGLISH_WORDS, keywords, rnd.randint(300, 900))
+        plans.setdefault(k, (title, paragraphs, targets))
+
+        links = [(url_of(t, h), f"{topic[t]} oil palm article {t}") for t in targets]
+        links.append(('http://ads.example.invalid/track', 'Sponsored'))
+        if kind == 'pdf':
+            body = make_pdf(title, ' '.join(paragraphs))
+            sites[h][path_of(k)] = ('application/pdf', body)
+        else:
+            if kind == 'non_english':
+                declared = lang if rnd.random() < 0.5 else None
+            else:
+                declared = 'en' if rnd.random() < 0.5 else None
+            charset = BAD_CHARSET if kind == 'bad_charset' else 'utf-8'
+            sites[h][path_of(k)] = (f'text/html; charset={charset}', (title, paragraphs, links, declared))
+        counts[kind] += 1
+
+    for h in range(n_hosts):
+        sites[h]['/robots.txt'] = ('text/plain', b'User-agent: *\nDisallow: /private/\n')
+    seeds = [(host_of[0], path_of(0))]
+    for h in range(n_hosts):
+        first = next((k for k in range(n_pages) if host_of[k] == h and k not in kinds), None)
+        if first is not None and first != 0:
+            seeds.append((h, path_of(first)))
+    return sites, seeds, dict(counts)
+
+class _CorpusHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        entry = self.server.pages.get(self.path.split('?')[0])
+        if entry is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        content_type, body = entry
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def serve_corpus(sites):
+    """Start one local server per host; returns (servers, {host index: 'http://127.0.0.1:port'})."""
+    servers, bases = [], {}
+    for h in sorted(sites):
+        srv = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _CorpusHandler)
+        srv.daemon_threads = True
+        bases[h] = f'http://127.0.0.1:{srv.server_port}'
+        servers.append(srv)
+    placeholders = {f'host{h}': base for h, base in bases.items()}
+    for srv, h in zip(servers, sorted(sites)):
+        pages = {}
+        for path, (content_type, body) in sites[h].items():
+            if isinstance(body, tuple):
+                title, paragraphs, links, declared = body
+                links = [(href.format_map(placeholders), anchor) for href, anchor in links]
+                body = _html(title, paragraphs, links, declared)
+            pages[path] = (content_type, body)
+        srv.pages = pages
+        threading.Thread(target=srv.serve_forever, name=f'bench-host-{h}', daemon=True).start()
+    return servers, bases
+
+class StageTimer:
+    """Latency samples per stage, taken by wrapping module functions for the duration of a run."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.rejections = Counter()
+        self._patched = []
+
+    def wrap(self, module, name, stage):
+        fn = getattr(module, name)
+        samples = self.samples[stage]
+        rejections = self.rejections
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - start)
+            if stage in ('qa', 'dedup') and result and not result[0]:
+                rejections[result[1]] += 1
+            return result
+
+        self._patched.append((module, name, fn))
+        setattr(module, name, timed)
+
+    def restore(self):
+        for module, name, fn in reversed(self._patched):
+            setattr(module, name, fn)
+        self._patched = []
+
+    def report(self):
+        out = {}
+        for stage, _ in STAGES:
+            ms = sorted(s * 1000.0 for s in self.samples.get(stage, ()))
+            if not ms:
+                continue
+            pick = lambda q: ms[min(len(ms) - 1, int(len(ms) * q))]
+            out[stage] = {'count': len(ms), 'total_ms': round(sum(ms), 3), 'mean_ms': round(sum(ms) / len(ms), 3),
+                          'p50_ms': round(pick(0.50), 3), 'p90_ms': round(pick(0.90), 3),
+                          'p99_ms': round(pick(0.99), 3), 'max_ms': round(ms[-1], 3)}
+        return out
+
+def peak_rss():
+    """(this process, finished child processes) peak resident set size in bytes; None where unknown."""
+    if resource is not None:
+        scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is bytes on macOS, KiB on Linux
+        return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss), None
+    return None, None
+
+def load_script(name, db_path):
+    """Import a scraper script as a module and point it at db_path."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    module = importlib.import_module(name)
+    module.DB_PATH = db_path
+    return module
+
+def run(script, pages=BENCH_PAGES, hosts=BENCH_HOSTS, seed=BENCH_SEED, keep=False, verbose=False, **main_kwargs):
+    """Generate and serve the corpus, crawl it once with `script`, return the results dict."""
+    main_kwargs.setdefault('host_delay', BENCH_HOST_DELAY)
+    out_dir = tempfile.mkdtemp(prefix='bench_crawl_')
+    db_path = os.path.join(out_dir, 'bench.db')
+    m = load_script(script, db_path)
+    sites, seeds, corpus = build_corpus(pages, hosts, m.CATEGORIES, seed)
+    servers, bases = serve_corpus(sites)
+    m.REPUTABLE_DOMAINS = {base.split('://', 1)[1] for base in bases.values()}
+    m.SEED_URLS = [bases[h] + path for h, path in seeds]
+
+    timer = StageTimer()
+    for stage, name in STAGES:
+        timer.wrap(m, name, stage)
+    log = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(log):
+            m.main(**main_kwargs)
+        elapsed = time.perf_counter() - start
+    finally:
+        timer.restore()
+        for srv in servers:
+            srv.shutdown()
+            srv.server_close()
+
+    conn = sqlite3.connect(db_path)
+    fetched = conn.execute("SELECT COUNT(*) FROM visited_urls").fetchone()[0]
+    stored = conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+    bad_charset_stored = conn.execute("SELECT COUNT(*) FROM articles WHERE url LIKE '%/archive/%'").fetchone()[0]
+    conn.close()
+    db_files = {os.path.basename(p): os.path.getsize(p) for p in sorted(glob.glob(os.path.join(out_dir, '*.db*')))}
+    rss, rss_children = peak_rss()
+    results = {
+        'script': script,
+        'when': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'pages': pages, 'hosts': hosts, 'seed': seed, **main_kwargs},
+        'corpus': corpus,
+        'elapsed_s': round(elapsed, 3),
+        'pages_fetched': fetched,
+        'pages_per_sec': round(fetched / elapsed, 2),
+        'articles_stored': stored,
+        'articles_per_sec': round(stored / elapsed, 2),
+        'bad_charset_stored': bad_charset_stored,
+        'rejections': dict(timer.rejections),
+        'stages': timer.report(),
+        'db_bytes': sum(db_files.values()),
+        'db_files': db_files,
+        'peak_rss_bytes': rss,
+        'peak_rss_children_bytes': rss_children,
+    }
+    if keep:
+        results['output_dir'] = out_dir
+    else:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return results
+
+def _metrics(results):
+    # (name, value, True if higher is better)
+    yield 'pages_per_sec', results.get('pages_per_sec'), True
+    yield 'articles_per_sec', results.get('articles_per_sec'), True
+    yield 'db_bytes', results.get('db_bytes'), False
+    yield 'peak_rss_bytes', results.get('peak_rss_bytes'), False
+    for stage, stats in results.get('stages', {}).items():
+        for key in ('p50_ms', 'p99_ms'):
+            yield f'{stage}.{key}', stats.get(key), False
+
+def compare(results, baseline):
+    """Print each metric against `baseline`; returns the names of the ones that regressed."""
+    before = {name: value for name, value, _ in _metrics(baseline)}
+    regressed = []
+    print(f"\nCompared with {baseline.get('script')} run of {baseline.get('when')}:")
+    for name, value, higher_better in _metrics(results):
+        old = before.get(name)
+        if value is None or not old:
+            continue
+        change = (value - old) / old
+        worse = -change if higher_better else change
+        flag = ''
+        if worse > REGRESSION_THRESHOLD:
+            flag = '  <-- REGRESSION'
+            regressed.append(name)
+        print(f"  {name:<22} {old:>14,.2f} -> {value:>14,.2f}  ({change:+.1%}){flag}")
+    return regressed
+
+def print_report(r):
+    print(f"{r['script']}: {r['pages_fetched']} page(s) fetched, {r['articles_stored']} stored in {r['elapsed_s']:.1f}s")
+    print(f"  corpus: {', '.join(f'{k} {v}' for k, v in sorted(r['corpus'].items()))}")
+    print(f"  throughput: {r['pages_per_sec']:.1f} pages/sec, {r['articles_per_sec']:.1f} articles/sec")
+    bad = r['corpus'].get('bad_charset', 0)
+    if bad:
+        lost = bad - r.get('bad_charset_stored', 0)
+        print(f"  charset={BAD_CHARSET} pages stored: {bad - lost}/{bad}" + (f"  <-- {lost} LOST" if lost else ''))
+    if r['rejections']:
+        print(f"  rejected: {', '.join(f'{k} {v}' for k, v in sorted(r['rejections'].items()))}")
+    for stage, s in r['stages'].items():
+        print(f"  {stage:<10} n={s['count']:<6} mean {s['mean_ms']:8.2f} ms | p50 {s['p50_ms']:8.2f} | "
+              f"p90 {s['p90_ms']:8.2f} | p99 {s['p99_ms']:8.2f} | max {s['max_ms']:8.2f}")
+    print(f"  DB bytes: {r['db_bytes'] / 1e6:.2f} MB in {len(r['db_files'])} file(s)")
+    if r['peak_rss_bytes']:
+        print(f"  peak RSS: {r['peak_rss_bytes'] / 1e6:.1f} MB"
+              + (f" (child processes {r['peak_rss_children_bytes'] / 1e6:.1f} MB)" if r['peak_rss_children_bytes'] else ''))
+    if 'output_dir' in r:
+        print(f"  DBs kept in {r['output_dir']}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark a crawl against a local synthetic oil-palm corpus.")
+    parser.add_argument('--script', choices=BENCH_SCRIPTS, default=BENCH_SCRIPTS[0], help='Scraper whose main() is run')
+    parser.add_argument('--pages', type=int, default=BENCH_PAGES, help='Pages in the synthetic corpus')
+    parser.add_argument('--hosts', type=int, default=BENCH_HOSTS, help='Stand-in hosts the pages are spread over')
+    parser.add_argument('--seed', type=int, default=BENCH_SEED, help='Corpus generator seed')
+    parser.add_argument('--workers', type=int, default=4, help='Passed to main(): concurrent fetches')
+    parser.add_argument('--cpu-workers', type=int, default=0, help='Passed to main(): staged-mode CPU processes')
+    parser.add_argument('--host-delay', type=float, default=BENCH_HOST_DELAY, help='Passed to main(): per-host delay (seconds)')
+    parser.add_argument('--mirror-category-dbs', action='store_true', help='Passed to main() of the mirror script')
+    parser.add_argument('--fts', action='store_true', help='Passed to main(): keep the full-text index')
+    parser.add_argument('--content-codec', default='plain', help='Passed to main(): article storage codec')
+    parser.add_argument('--no-pdf', action='store_true', help='Passed to main(): skip PDF extraction')
+    parser.add_argument('--out', help='Write the results to this JSON file', default=None)
+    parser.add_argument('--compare', help='Earlier results JSON to compare against', default=None)
+    parser.add_argument('--keep', action='store_true', help='Keep the benchmark DBs (their folder is printed)')
+    parser.add_argument('--verbose', action='store_true', help="Show the scraper's own output")
+    args = parser.parse_args()
+    if args.mirror_category_dbs and args.script != 'ScraperScriptOilPalm_with_mirror':
+        parser.error("--mirror-category-dbs needs --script ScraperScriptOilPalm_with_mirror")
+
+    main_kwargs = {'workers': args.workers, 'cpu_workers': args.cpu_workers, 'host_delay': args.host_delay,
+                   'fts': args.fts, 'content_codec': args.content_codec, 'pdf': not args.no_pdf}
+    if args.mirror_category_dbs:
+        main_kwargs['mirror_category_dbs'] = True
+    results = run(args.script, args.pages, args.hosts, args.seed, keep=args.keep, verbose=args.verbose, **main_kwargs)
+    print_report(results)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.out}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(results, baseline):
+            sys.exit(1)
+    if results['bad_charset_stored'] < results['corpus'].get('bad_charset', 0):
+        sys.exit(1)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+bench_extract.py
+
+Micro-benchmark: BeautifulSoup extraction vs the streaming lxml extractor.
+
+Runs both HTML paths over saved pages and reports per-page timings:
+ - soup:   response.text decode (charset guessing when the header has none)
+           + parse_html() + the preprocess_data() regex/lower passes
+ - stream: parse_html_fast() on the raw bytes (text comes out normalized)
+
+Saved pages come from the response cache (http_cache.db, written by the
+crawler) and/or a folder of .html files.
+
+Usage examples:
+    python bench_extract.py --cache "C:\\Users\\Roy\\Documents\\DBOilPalmmiro\\http_cache.db"
+    python bench_extract.py --dir saved_pages --repeat 5
+"""
+
+import argparse
+import glob
+import os
+import re
+import sqlite3
+import statistics
+import sys
+import time
+import zlib
+
+import requests
+from requests.utils import get_encoding_from_headers
+
+from page_pipeline import parse_html, parse_html_fast
+
+# ----------------- Config -----------------
+DEFAULT_LIMIT = 500
+DEFAULT_REPEAT = 3
+# ------------------------------------------
+
+def load_pages(cache_path=None, folder=None, limit=DEFAULT_LIMIT):
+    """[(url, content_type, body bytes)] of saved HTML pages."""
+    pages = []
+    if cache_path:
+        conn = sqlite3.connect(cache_path)
+        rows = conn.execute(
+            "SELECT url, content_type, body FROM responses WHERE content_type LIKE '%html%' LIMIT ?", (limit,))
+        pages.extend((url, ct or 'text/html', zlib.decompress(body)) for url, ct, body in rows)
+        conn.close()
+    if folder:
+        for path in sorted(glob.glob(os.path.join(folder, '*.htm*')))[:max(0, limit - len(pages))]:
+            with open(path, 'rb') as f:
+                pages.append(('file:///' + os.path.abspath(path).replace('\\', '/'), 'text/html', f.read()))
+    return pages
+
+def soup_path(url, content_type, body):
+    # What fetch_page used to do: requests decodes, BeautifulSoup parses, preprocess_data cleans
+    response = requests.models.Response()
+    response._content = body
+    response.headers['Content-Type'] = content_type
+    response.encoding = get_encoding_from_headers(response.headers)
+    page = parse_html(response.text, url)
+    text = re.sub(r'\s+', ' ', page['raw_text'])
+    text = re.sub(r'[^\w\s\.\,\!\?]', '', text)
+    return text.strip().lower(), page['links']
+
+def stream_path(url, content_type, body):
+    page = parse_html_fast(body, url, content_type)
+    return page['raw_text'], page['links']
+
+def _time(fn, pages, repeat):
+    per_page = []
+    for url, ct, body in pages:
+        best = float('inf')
+        for _ in range(repeat):
+            t = time.perf_counter()
+            fn(url, ct, body)
+            best = min(best, time.perf_counter() - t)
+        per_page.append(best * 1000.0)
+    return per_page
+
+def _report(name, ms):
+    ordered = sorted(ms)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"  {name:<7} total {sum(ms):9.1f} ms | mean {statistics.mean(ms):7.2f} ms | "
+          f"p50 {statistics.median(ms):7.2f} ms | p95 {p95:7.2f} ms")
+
+def main(cache_path, folder, limit, repeat):
+    pages = load_pages(cache_path, folder, limit)
+    if not pages:
+        print("No saved HTML pages found (use --cache and/or --dir).")
+        sys.exit(1)
+    size = sum(len(b) for _, _, b in pages)
+    print(f"{len(pages)} page(s), {size / 1e6:.1f} MB, best of {repeat} run(s) per page")
+
+    soup_ms = _time(soup_path, pages, repeat)
+    stream_ms = _time(stream_path, pages, repeat)
+    _report('soup', soup_ms)
+    _report('stream', stream_ms)
+    print(f"  speedup {sum(soup_ms) / sum(stream_ms):.1f}x")
+
+    # Sanity check: both paths should find the same links and roughly the same words
+    same_links = sum(1 for url, ct, body in pages if soup_path(url, ct, body)[1] == stream_path(url, ct, body)[1])
+    overlap = []
+    for url, ct, body in pages:
+        a = set(soup_path(url, ct, body)[0].split())
+        b = set(stream_path(url, ct, body)[0].split())
+        if a or b:
+            overlap.append(len(a & b) / len(a | b))
+    print(f"  identical link lists: {same_links}/{len(pages)}; "
+          f"mean word-set overlap: {statistics.mean(overlap) if overlap else 1.0:.2f} (stream skips <nav> text and keeps words in adjacent tags apart)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark HTML extraction paths on saved pages.")
+    parser.add_argument('--cache', help='Response cache DB (http_cache.db) to read saved pages from', default=None)
+    parser.add_argument('--dir', help='Folder of saved .html files', default=None)
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT, help='Maximum number of pages to benchmark')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Runs per page (best time is kept)')
+    args = parser.parse_args()
+    main(args.cache, args.dir, args.limit, args.repeat)
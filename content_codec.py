@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+content_codec.py
+
+Optional compressed storage for articles.content.
+
+A row's `codec` column says how its `content` is stored:
+ - NULL      plain TEXT (the original format; old rows stay readable as-is)
+ - 'zlib'    zlib-compressed UTF-8, as a BLOB
+ - 'zstd:ID' zstd-compressed UTF-8 using the trained dictionary ID from the
+             content_dicts table (IDs are content hashes, so dictionaries can
+             be copied between DBs without clashing)
+ - 'zstd'    zstd without a dictionary
+
+Readers go through ContentCodec.decode() in Python, or through the SQL
+function content_text(content, codec) that register_functions() installs on
+a connection (used by reclassify, the near-duplicate index and, once a DB
+holds compressed rows, the full-text index triggers). The md5 `hash` column is always computed on the plain text.
+
+zstd needs the optional `zstandard` package; zlib is always available.
+
+Migrating an existing DB (re-encodes every row, in batches):
+    python content_codec.py --db "C:\\Users\\Roy\\Documents\\DBOilPalmmiro\\oilpalmdbmiro.db" --codec zstd --train-dict
+    python content_codec.py --db "C:\\path\\to\\Processing.db" --codec zlib --vacuum
+    python content_codec.py --db "C:\\path\\to\\oilpalmdbmiro.db" --codec plain
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # Optional: only needed for --content-codec zstd
+    zstandard = None
+
+# ----------------- Config -----------------
+DEFAULT_DB_PATH = r"C:/Users/Roy/Documents/DBOilPalmmiro/oilpalmdbmiro.db"
+CONTENT_CODECS = ('plain', 'zlib', 'zstd')
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10
+# Dictionary training: target size and how many stored articles to sample
+ZSTD_DICT_SIZE = 112_640
+ZSTD_DICT_SAMPLES = 5000
+# Fewer stored articles than this and no dictionary is trained (zstd without one is used)
+ZSTD_MIN_TRAIN_SAMPLES = 200
+MIGRATE_BATCH = 500
+# ------------------------------------------
+
+CONTENT_DICTS_TABLE = 'content_dicts'
+
+def ensure_schema(conn):
+    """Add the codec column to an articles table that predates it, and the dictionary table."""
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(articles)")}
+    if cols and 'codec' not in cols:
+        conn.execute("ALTER TABLE articles ADD COLUMN codec TEXT")
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {CONTENT_DICTS_TABLE} (
+            id TEXT PRIMARY KEY,
+            data BLOB,
+            created TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+def _load_dicts(conn):
+    try:
+        return {dict_id: bytes(data) for dict_id, data in conn.execute(f"SELECT id, data FROM {CONTENT_DICTS_TABLE}")}
+    except sqlite3.OperationalError:  # DB without the table: no dictionaries
+        return {}
+
+class ContentCodec:
+    """
+    Encoder/decoder bound to one connection's dictionaries.
+    `codec` is the format new content is written in ('plain', 'zlib' or 'zstd').
+    """
+
+    def __init__(self, conn, codec='plain'):
+        if codec not in CONTENT_CODECS:
+            raise ValueError(f"Unknown content codec: {codec!r} (expected one of {CONTENT_CODECS})")
+        if codec == 'zstd' and zstandard is None:
+            raise ValueError("content codec 'zstd' needs the zstandard package (pip install zstandard)")
+        self.conn = conn
+        self.codec = codec
+        self.dicts = _load_dicts(conn)
+        self._decompressors = {}
+        self._compressor = None
+        self.tag = None if codec == 'plain' else codec
+        if codec == 'zstd':
+            # Newest trained dictionary, if any
+            row = None
+            if self.dicts:
+                row = conn.execute(f"SELECT id FROM {CONTENT_DICTS_TABLE} ORDER BY created DESC, rowid DESC LIMIT 1").fetchone()
+            self._use_dict(row[0] if row else None)
+
+    def _use_dict(self, dict_id):
+        if dict_id is None:
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+            self.tag = 'zstd'
+        else:
+            zdict = zstandard.ZstdCompressionDict(self.dicts[dict_id])
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=zdict)
+            self.tag = f'zstd:{dict_id}'
+
+    def train_dictionary(self, samples):
+        """Train a zstd dictionary on `samples` (texts), store it and compress with it from now on. Returns its ID."""
+        data = zstandard.train_dictionary(ZSTD_DICT_SIZE, [s.encode('utf-8') for s in samples]).as_bytes()
+        dict_id = hashlib.sha1(data).hexdigest()[:16]
+        with self.conn:
+            self.conn.execute(f"INSERT OR IGNORE INTO {CONTENT_DICTS_TABLE} (id, data) VALUES (?, ?)", (dict_id, data))
+        self.dicts[dict_id] = data
+        self._use_dict(dict_id)
+        return dict_id
+
+    def encode(self, text):
+        """Plain text -> (value for the content column, value for the codec column)."""
+        if self.tag is None or text is None:
+            return text, None
+        raw = text.encode('utf-8')
+        if self.tag == 'zlib':
+            return zlib.compress(raw, ZLIB_LEVEL), 'zlib'
+        return self._compressor.compress(raw), self.tag
+
+    def decode(self, value, codec):
+        """(content, codec) as stored -> plain text."""
+        if codec is None or value is None:
+            return value
+        if codec == 'zlib':
+            return zlib.decompress(value).decode('utf-8')
+        if codec.startswith('zstd'):
+            if zstandard is None:
+                raise ValueError("this DB has zstd-compressed content; install the zstandard package to read it")
+            d = self._decompressors.get(codec)
+            if d is None:
+                dict_id = codec.partition(':')[2]
+                if dict_id and dict_id not in self.dicts:
+                    self.dicts.update(_load_dicts(self.conn))
+                zdict = zstandard.ZstdCompressionDict(self.dicts[dict_id]) if dict_id else None
+                d = self._decompressors[codec] = (zstandard.ZstdDecompressor(dict_data=zdict) if zdict
+                                                  else zstandard.ZstdDecompressor())
+            return d.decompress(value).decode('utf-8')
+        raise ValueError(f"Unknown content codec in DB: {codec!r}")
+
+    def dictionary_for(self, codec):
+        """(id, data) of the dictionary a codec tag refers to, or None."""
+        dict_id = (codec or '').partition(':')[2]
+        return (dict_id, self.dicts[dict_id]) if dict_id in self.dicts else None
+
+def train_from_db(conn, codec, limit=ZSTD_DICT_SAMPLES, min_samples=ZSTD_MIN_TRAIN_SAMPLES):
+    """
+    Train `codec`'s zstd dictionary on a random sample of the stored articles
+    (content_text() must be registered). Returns the dictionary ID, or None if
+    there are fewer than `min_samples` articles.
+    """
+    samples = [row[0] for row in conn.execute(
+        "SELECT content_text(content, codec) FROM articles WHERE content IS NOT NULL ORDER BY RANDOM() LIMIT ?",
+        (limit,))]
+    if len(samples) < min_samples:
+        return None
+    return codec.train_dictionary(samples)
+
+def register_functions(conn, codec=None):
+    """Install content_text(content, codec) on `conn`; returns the ContentCodec used to decode."""
+    codec = codec or ContentCodec(conn)
+    conn.create_function('content_text', 2, codec.decode, deterministic=True)
+    return codec
+
+def copy_dictionaries(codec, conn, tags):
+    """Make sure `conn`'s DB holds the dictionaries that codec tags `tags` refer to (for mirrors)."""
+    wanted = [codec.dictionary_for(tag) for tag in set(tags) if tag and ':' in tag]
+    wanted = [d for d in wanted if d]
+    if wanted:
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {CONTENT_DICTS_TABLE} (
+                id TEXT PRIMARY KEY,
+                data BLOB,
+                created TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.executemany(f"INSERT OR IGNORE INTO {CONTENT_DICTS_TABLE} (id, data) VALUES (?, ?)", wanted)
+
+def migrate(db_path, codec_name, train_dict=False, vacuum=False, batch=MIGRATE_BATCH):
+    """Re-encode every article in `db_path` with `codec_name`. Returns {'rows', 'before', 'after', 'seconds'}."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("PRAGMA recursive_triggers = ON;")
+    ensure_schema(conn)
+    codec = ContentCodec(conn, codec_name)
+    register_functions(conn, codec)
+    start = time.perf_counter()
+    before = conn.execute("SELECT COALESCE(SUM(LENGTH(CAST(content AS BLOB))), 0) FROM articles").fetchone()[0]
+    if train_dict and codec_name == 'zstd':
+        dict_id = train_from_db(conn, codec)
+        if dict_id is None:
+            print(f"Fewer than {ZSTD_MIN_TRAIN_SAMPLES} articles: compressing without a dictionary.")
+        else:
+            print(f"Trained zstd dictionary {dict_id}")
+    # Compressed rows need the full-text triggers that decode through content_text()
+    fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'articles_fts'").fetchone() is not None
+    if fts:
+        from search_index import enable_fts  # search_index imports this module
+        enable_fts(conn, compressed=codec.tag is not None)
+    rows = 0
+    last = 0
+    try:
+        while True:
+            chunk = conn.execute("SELECT rowid, content, codec FROM articles WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                                 (last, batch)).fetchall()
+            if not chunk:
+                break
+            last = chunk[-1][0]
+            updates = []
+            for rowid, value, old in chunk:
+                if old == codec.tag and (old is not None or not isinstance(value, bytes)):
+                    continue  # already in the target format
+                updates.append((*codec.encode(codec.decode(value, old)), rowid))
+            if updates:
+                with conn:
+                    conn.executemany("UPDATE articles SET content = ?, codec = ? WHERE rowid = ?", updates)
+                rows += len(updates)
+            print(f"[content] {rows} row(s) re-encoded (rowid {last})")
+        after = conn.execute("SELECT COALESCE(SUM(LENGTH(CAST(content AS BLOB))), 0) FROM articles").fetchone()[0]
+        if fts and codec.tag is None:
+            enable_fts(conn)  # all plain again: back to triggers other tools can run
+        if vacuum:
+            print("[content] VACUUM...")
+            conn.execute("VACUUM")
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'articles_fts'").fetchone():
+                # VACUUM may renumber rowids; the full-text index is keyed by rowid
+                with conn:
+                    conn.execute("INSERT INTO articles_fts (articles_fts) VALUES ('rebuild')")
+    finally:
+        conn.close()
+    return {'rows': rows, 'before': before, 'after': after, 'seconds': time.perf_counter() - start}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert stored article content to another storage codec.")
+    parser.add_argument('--db', help='Main DB or a category DB', default=DEFAULT_DB_PATH)
+    parser.add_argument('--codec', choices=CONTENT_CODECS, required=True, help='Target format')
+    parser.add_argument('--train-dict', action='store_true', help='zstd: train a dictionary on the stored articles first')
+    parser.add_argument('--vacuum', action='store_true', help='VACUUM afterwards to give the freed pages back to the OS')
+    args = parser.parse_args()
+    if not os.path.isfile(args.db):
+        print("ERROR: DB not found:", args.db)
+        sys.exit(1)
+    try:
+        stats = migrate(args.db, args.codec, train_dict=args.train_dict, vacuum=args.vacuum)
+    except ValueError as e:
+        print("ERROR:", e)
+        sys.exit(1)
+    print(f"Re-encoded {stats['rows']} article(s) in {stats['seconds']:.1f}s: content "
+          f"{stats['before'] / 1e6:.1f} MB -> {stats['after'] / 1e6:.1f} MB")
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+crawl_engine.py
+
+Concurrent fetch engine shared by ScraperScriptOilPalm.py and
+ScraperScriptOilPalm_with_mirror.py.
+
+Keeps up to N URLs in flight on a thread pool while a per-host token-bucket
+limiter (politeness.py) spaces out requests to the same host. A host that is
+cooling down does not hold up the rest of the frontier: its URLs are parked
+and the next URL for a different host is dispatched instead, so crawl time
+grows with the number of domains rather than the total number of pages.
+With --workers 1 this is still one request at a time, but without the old
+global sleeps between unrelated hosts.
+"""
+
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
+
+from politeness import HostRateLimiter
+from page_pipeline import pop_last_response
+
+# ----------------- Config -----------------
+# Minimum seconds between two requests to the same host (raised by a site's
+# robots.txt Crawl-delay). Matches the old serial loop (1s before each fetch +
+# 2s after each stored page).
+DEFAULT_HOST_DELAY = 3.0
+
+# How many URLs per worker may be parked while their host is busy/cooling down.
+# Bounds memory when the frontier is dominated by a single host.
+DEFERRED_PER_WORKER = 50
+
+# Print a throughput line every N finished URLs
+REPORT_EVERY = 25
+
+# While the frontier is empty but later pipeline stages may still add links,
+# re-check it this often (seconds)
+BUSY_POLL = 0.1
+# ------------------------------------------
+
+def host_of(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+class CrawlRate:
+    """Counts finished/stored URLs and reports pages/sec."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.done = 0
+        self.stored = 0
+
+    def record(self, stored):
+        self.done += 1
+        if stored:
+            self.stored += 1
+
+    def record_stored(self):
+        # Staged pipeline: pages are stored by the writer, after the fetch finished
+        self.stored += 1
+
+    def elapsed(self):
+        return max(time.monotonic() - self.started, 1e-9)
+
+    def summary(self):
+        secs = self.elapsed()
+        return (f"{self.done} URLs ({self.done / secs:.2f} pages/sec), "
+                f"{self.stored} stored ({self.stored / secs:.2f}/sec) in {secs:.1f}s")
+
+def run_concurrent(claim_next, process_url, workers, host_delay=DEFAULT_HOST_DELAY,
+                   max_items=float('inf'), rate=None, finish=None, robots=None, busy=None):
+    """
+    Crawl with `workers` requests in flight.
+
+    claim_next()            -> (url, depth) or (None, None) when the queue is empty
+    process_url(url, depth) -> True if the page was stored
+    finish(url)             -> called on the worker once a URL is done, whatever the outcome
+    robots                  -> optional politeness.RobotsCache; disallowed URLs are skipped
+    busy()                  -> True while later stages (staged_pipeline) may still add links;
+                               an empty frontier is then polled instead of ending the crawl
+
+    Runs until the queue is drained and nothing is in flight, or `max_items`
+    pages were stored. Fetches still in flight at that point are waited for,
+    so nothing touches the caller's DB after this returns (only Ctrl+C
+    abandons them). Returns the CrawlRate with the final counts.
+    """
+    rate = rate or CrawlRate()
+    limiter = HostRateLimiter(host_delay)
+
+    def task(url, depth):
+        try:
+            # robots.txt is fetched here, on the worker, while the host is marked busy
+            if robots is not None and not robots.allowed(url):
+                print(f"Skipped (robots.txt Disallow): {url}")
+                return False, None, None
+            stored = process_url(url, depth)
+            status, retry_after = pop_last_response()
+            return stored, status, retry_after
+        finally:
+            if finish is not None:
+                finish(url)
+
+    deferred = deque()
+    max_deferred = max(1, workers) * DEFERRED_PER_WORKER
+    in_flight = {}
+    queue_empty = False
+
+    def pick_ready():
+        # Oldest parked URL whose host is free goes first
+        now = time.monotonic()
+        for i, (url, depth) in enumerate(deferred):
+            if limiter.wait_time(host_of(url), now) == 0:
+                del deferred[i]
+                return url, depth
+        # Otherwise pull from the frontier, parking URLs for busy hosts
+        nonlocal queue_empty
+        while not queue_empty and len(deferred) < max_deferred:
+            url, depth = claim_next()
+            if url is None:
+                queue_empty = True
+                break
+            if limiter.wait_time(host_of(url), now) == 0:
+                return url, depth
+            deferred.append((url, depth))
+        return None, None
+
+    def collect(fut):
+        url, host = in_flight.pop(fut)
+        status = retry_after = None
+        try:
+            stored, status, retry_after = fut.result()
+        except Exception as e:
+            print(f"Error: {e}")
+            stored = False
+        crawl_delay = robots.crawl_delay(url) if robots is not None else None
+        limiter.release(host, status, retry_after, crawl_delay)
+        rate.record(bool(stored))
+        if rate.done % REPORT_EVERY == 0:
+            print(f"[rate] {rate.summary()} | in flight: {len(in_flight)}, parked: {len(deferred)}")
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    interrupted = False
+    try:
+        while rate.stored < max_items:
+            while len(in_flight) < workers:
+                url, depth = pick_ready()
+                if url is None:
+                    break
+                host = host_of(url)
+                limiter.acquire(host)
+                in_flight[executor.submit(task, url, depth)] = (url, host)
+
+            if not in_flight:
+                if not deferred:
+                    if busy is not None and busy():
+                        # Pages still being analyzed/written may queue more links
+                        time.sleep(BUSY_POLL)
+                        queue_empty = False
+                        continue
+                    # Frontier drained and no fetch left that could add links
+                    print("Queue empty. Scraping complete.")
+                    break
+                now = time.monotonic()
+                time.sleep(min(limiter.wait_time(host_of(u), now) for u, _ in deferred))
+                continue
+
+            # Wake up on the first finished fetch, or when a parked host cools down
+            timeout = None
+            if deferred and len(in_flight) < workers:
+                now = time.monotonic()
+                timeout = min(limiter.wait_time(host_of(u), now) for u, _ in deferred)
+                timeout = None if timeout == float('inf') else timeout
+            if queue_empty and len(in_flight) < workers and busy is not None and busy():
+                # Idle capacity: look at the frontier again soon
+                timeout = BUSY_POLL if timeout is None else min(timeout, BUSY_POLL)
+                queue_empty = False
+            finished, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                collect(fut)
+                # The finished page may have added links to the frontier
+                queue_empty = False
+
+        if rate.stored >= max_items:
+            print(f"Reached max items ({max_items}). Stopping.")
+        if in_flight:
+            # Let them finish storing before the caller flushes and closes the DB
+            print(f"Waiting for {len(in_flight)} fetch(es) still in flight...")
+            for fut in wait(list(in_flight)).done:
+                collect(fut)
+    except KeyboardInterrupt:
+        interrupted = True
+        raise
+    finally:
+        executor.shutdown(wait=not interrupted, cancel_futures=True)
+    return rate
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+crawl_metrics.py
+
+Stage timings and counters for a crawl run, with periodic snapshots.
+
+CrawlMetrics collects, thread-safely and in constant memory per series:
+ - timers per pipeline stage (fetch, parse, preprocess, classify, qa and its
+   qa.language / qa.domain checks, dedup, store, enqueue) and per fetched
+   domain: count, total, max and a fixed-bucket histogram that p50/p90/p99
+   are read from
+ - counters: pages fetched, bytes downloaded, fetch errors, 304s, articles
+   stored, QA rejections by reason
+ - gauges sampled at snapshot time: the frontier size, per crawl depth
+
+StageClock times the CPU stages inside analyze_page(). Its timings travel
+back with the result (also from the --cpu-workers process pool) and are
+added to the run's metrics by the writer.
+
+Every `interval` seconds, and once more when the run ends, a snapshot is
+written:
+ - METRICS_JSON and METRICS_PROM (Prometheus textfile-collector format) in
+   the metrics folder, each replaced atomically
+ - the crawl_stats table of the main DB: one row per series and run,
+   updated in place (CrawlStateStore.save_stats)
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# ----------------- Config -----------------
+# Seconds between snapshots (0 = only the final one)
+METRICS_INTERVAL = 30.0
+METRICS_JSON = 'crawl_metrics.json'
+METRICS_PROM = 'crawl_metrics.prom'
+# Prefix of every Prometheus metric name
+PROM_PREFIX = 'oilpalm_crawl_'
+# Histogram bucket upper bounds (seconds); percentiles are interpolated within a bucket
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+                   float('inf'))
+QUANTILES = (0.5, 0.9, 0.99)
+# ------------------------------------------
+
+class _Timer:
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket holding the q-th observation
+        target = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, n in zip(LATENCY_BUCKETS, self.buckets):
+            if n and seen + n >= target:
+                upper = min(bound, self.max)
+                return lower + (max(upper, lower) - lower) * (target - seen) / n
+            seen += n
+            lower = bound
+        return self.max
+
+class StageClock:
+    """
+    Per-page stage timings as a plain dict (picklable, so it can come back from
+    a pool worker):  with clock('parse'): ...  ->  clock.timings['parse'].
+    """
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def __call__(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0.0) + time.perf_counter() - start
+
+def _label_text(labels):
+    return ','.join(f'{k}={v}' for k, v in labels)
+
+def _prom_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    esc = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{esc(v)}"' for k, v in pairs) + '}'
+
+# Table in the main DB the snapshots are saved to (see CrawlStateStore.save_stats)
+CRAWL_STATS_TABLE = 'crawl_stats'
+
+class CrawlMetrics:
+    """Timers, counters and gauges of one crawl run."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.run = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started))
+        self._lock = threading.Lock()
+        self._timers = {}       # (name, labels) -> _Timer
+        self._counters = {}     # (name, labels) -> value
+        self._frontier = None
+        self._depths = set()
+        self._save = None
+        self.out_dir = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---- recording ----
+    def observe(self, stage, seconds):
+        self._observe('stage_seconds', (('stage', stage),), seconds)
+
+    def _observe(self, name, labels, seconds):
+        key = (name, labels)
+        with self._lock:
+            timer = self._timers.get(key)
+            if timer is None:
+                timer = self._timers[key] = _Timer()
+            timer.add(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def add_timings(self, timings):
+        """Merge a StageClock's timings (one page)."""
+        for stage, seconds in timings.items():
+            self.observe(stage, seconds)
+
+    def count(self, name, n=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def record_fetch(self, url, page, seconds):
+        """One fetch_page() call: stage and per-domain latency, bytes, outcome."""
+        self.observe('fetch', seconds)
+        self._observe('domain_fetch_seconds', (('domain', urlparse(url).netloc.lower()),), seconds)
+        if page is None:
+            self.count('fetch_errors')
+            return
+        self.count('pages_fetched')
+        self.count('bytes_downloaded', page.get('bytes', 0))
+        if page.get('not_modified'):
+            self.count('not_modified')
+
+    # ---- snapshots ----
+    def rows(self):
+        """Every series as a dict: kind, name, labels, value, count, max, p50, p90, p99."""
+        out = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                out.append({'kind': 'counter', 'name': name, 'labels': labels, 'value': value})
+            for (name, labels), t in sorted(self._timers.items()):
+                row = {'kind': 'timer', 'name': name, 'labels': labels, 'value': t.total, 'count': t.count,
+                       'max': t.max}
+                for q in QUANTILES:
+                    row[f'p{round(q * 100)}'] = t.quantile(q)
+                out.append(row)
+        if self._frontier is not None:
+            try:
+                by_depth = self._frontier()
+            except Exception as e:
+                print(f"Metrics: could not read the frontier: {e}")
+                by_depth = {}
+            out.append({'kind': 'gauge', 'name': 'frontier_urls', 'labels': (), 'value': sum(by_depth.values())})
+            # Depths that emptied since an earlier snapshot are reported as 0, not left stale
+            self._depths.update(by_depth)
+            for depth in sorted(self._depths):
+                n = by_depth.get(depth, 0)
+                out.append({'kind': 'gauge', 'name': 'frontier_urls_by_depth', 'labels': (('depth', depth),),
+                            'value': n})
+        return out
+
+    def to_prometheus(self, rows):
+        lines = []
+        typed = set()
+        for row in rows:
+            name = PROM_PREFIX + row['name']
+            if row['kind'] == 'counter':
+                name += '_total'
+            kind = {'timer': 'summary'}.get(row['kind'], row['kind'])
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} {kind}')
+            if row['kind'] == 'timer':
+                for q in QUANTILES:
+                    lines.append(f"{name}{_prom_labels(row['labels'], [('quantile', q)])} {row[f'p{round(q * 100)}']:.6f}")
+                lines.append(f"{name}_sum{_prom_labels(row['labels'])} {row['value']:.6f}")
+                lines.append(f"{name}_count{_prom_labels(row['labels'])} {row['count']}")
+            else:
+                lines.append(f"{name}{_prom_labels(row['labels'])} {row['value']}")
+        return '\n'.join(lines) + '\n'
+
+    def write_snapshot(self):
+        """Write the JSON / Prometheus files and the crawl_stats rows now."""
+        rows = self.rows()
+        if self.out_dir:
+            snapshot = {'run': self.run, 'updated': time.strftime('%Y-%m-%d %H:%M:%S'),
+                        'elapsed_seconds': round(time.time() - self.started, 3),
+                        'series': [dict(row, labels=dict(row['labels'])) for row in rows]}
+            for fname, text in ((METRICS_JSON, json.dumps(snapshot, indent=2)),
+                                (METRICS_PROM, self.to_prometheus(rows))):
+                path = os.path.join(self.out_dir, fname)
+                try:
+                    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                        f.write(text)
+                    os.replace(path + '.tmp', path)  # readers never see a half-written file
+                except OSError as e:
+                    print(f"Metrics: could not write {path}: {e}")
+        if self._save is not None:
+            try:
+                self._save(self.run, [(row['kind'], row['name'], _label_text(row['labels']), row['value'],
+                                       row.get('count'), row.get('max'), row.get('p50'), row.get('p90'),
+                                       row.get('p99')) for row in rows])
+            except Exception as e:
+                print(f"Metrics: could not save crawl_stats: {e}")
+
+    def start(self, out_dir=None, interval=METRICS_INTERVAL, save=None, frontier=None):
+        """
+        Snapshot every `interval` seconds until stop(). save(run, rows) stores
+        the crawl_stats rows; frontier() returns {depth: pending URLs}.
+        """
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self._save = save
+        self._frontier = frontier
+        if interval and interval > 0:
+            self._thread = threading.Thread(target=self._loop, args=(interval,), name='metrics', daemon=True)
+            self._thread.start()
+
+    def _loop(self, interval):
+        while not self._stop.wait(interval):
+            self.write_snapshot()
+
+    def stop(self):
+        """Stop the snapshot thread and write the final snapshot."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.write_snapshot()
+
+    def summary(self):
+        """One line: each stage's share of the measured time, with mean and p90."""
+        with self._lock:
+            stages = [(labels[0][1], t) for (name, labels), t in self._timers.items() if name == 'stage_seconds']
+        total = sum(t.total for stage, t in stages if '.' not in stage) or 1e-9
+        stages.sort(key=lambda item: -item[1].total)
+        return ' | '.join(f"{stage} {t.total / total:.0%} ({t.total / t.count * 1000:.1f} ms avg, "
+                          f"p90 {t.quantile(0.9) * 1000:.1f} ms)" for stage, t in stages)
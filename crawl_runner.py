@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+crawl_runner.py
+
+The crawl run shared by ScraperScriptOilPalm.py and
+ScraperScriptOilPalm_with_mirror.py: the page stages, the body of main() and
+the command-line flags.
+
+The scripts keep their config (CATEGORIES, REPUTABLE_DOMAINS, SEED_URLS,
+DB_PATH) and the page steps (fetch_page, preprocess_data, category_scores,
+classify_text, quality_assurance, duplicate_check, store_article,
+add_to_pending, init_db/close_db). The stages look those up on the script
+module at call time, so a script, or bench_crawl.py timing them, can replace
+any of them.
+
+ - analyze_page(script_name, url, depth, page): parse -> preprocess ->
+   classify -> content QA. Top-level and DB-free, so the --cpu-workers
+   process pool can run it (the script is imported by name in the worker).
+ - CrawlRun: the run's response cache, PDF pool and metrics, plus the stages
+   that use them (write_page, process_url, fetch_for_pipeline).
+ - run_crawl(script, ...): main() of both scripts. The mirror script passes
+   its per-category DB hooks (flush_hook, on_reclassify).
+ - build_parser() / run_options(): the shared flags and their main() kwargs.
+"""
+
+import argparse
+import functools
+import hashlib
+import importlib
+import os
+import sys
+import time
+
+from crawl_engine import run_concurrent, CrawlRate, DEFAULT_HOST_DELAY
+from page_pipeline import parse_fetched, HEADERS
+from pdf_extract import PdfExtractor, PDF_WORKERS, PDF_MAX_PAGES, PDF_MAX_BYTES, PDF_TIMEOUT
+from politeness import RobotsCache
+from response_cache import ResponseCache, CACHE_FILENAME, DEFAULT_MAX_BYTES
+from crawl_state import URL_INDEX_MODES, ARTICLE_FLUSH_ROWS, ARTICLE_FLUSH_SECONDS
+from content_codec import CONTENT_CODECS
+from near_dup import simhash, NEAR_DUP_SIMILARITY
+from staged_pipeline import StagedPipeline
+from crawl_metrics import CrawlMetrics, StageClock, METRICS_INTERVAL
+from run_profiler import RunProfiler, PROFILE_MODES, PROFILE_PAGES, PROFILE_DIRNAME
+from reclassify import reclassify_articles, RECLASSIFY_CHUNK
+
+# ----------------- Config -----------------
+# Optional cap on stored articles per run; float('inf') = unlimited
+MAX_ITEMS = float('inf')
+# ------------------------------------------
+
+def script_module(name):
+    """The scraper script module `name`; imported on first use (e.g. in a CPU pool worker)."""
+    module = sys.modules.get(name)
+    return module if module is not None else importlib.import_module(name)
+
+# CPU stage: Preprocess -> Classify -> Quality Assurance (no DB access; runs in the process pool with --cpu-workers)
+def analyze_page(script_name, url, depth, page):
+    script = script_module(script_name)
+    clock = StageClock()
+    with clock('parse'):
+        page = parse_fetched(page)  # Raw HTML from the staged fetch is parsed here
+
+    # Preprocess Data
+    with clock('preprocess'):
+        content = script.preprocess_data(page)
+
+    # Automated Classification
+    with clock('classify'):
+        scores = script.category_scores(content)
+        category = script.classify_text(content, scores)
+
+    # Quality Assurance (Delete/Flag if fails)
+    with clock('qa'):
+        meets_standards, reason = script.quality_assurance(url, page['title'], content, page.get('lang'), clock)
+    return {
+        'url': url, 'depth': depth, 'title': page['title'], 'content': content, 'category': category,
+        'parent_score': max(scores.values()), 'links': page['links'], 'anchors': page['anchors'],
+        'rejected': None if meets_standards else reason,
+        'content_hash': hashlib.md5(content.encode()).hexdigest(),
+        'fingerprint': simhash(content) if meets_standards else None,
+        'timings': clock.timings,
+    }
+
+class CrawlRun:
+    """
+    One crawl of a scraper script: the response cache, the PDF extraction pool
+    and the metrics it fetches and writes with, and the page stages using them.
+    """
+
+    def __init__(self, script, follow_rejected_links=False, cache=None, pdf=None):
+        self.script = script
+        self.follow_rejected_links = follow_rejected_links
+        self.cache = cache
+        self.pdf = pdf
+        self.metrics = CrawlMetrics()
+        # Picklable, so the --cpu-workers pool can run it
+        self.analyze_page = functools.partial(analyze_page, script.__name__)
+
+    # Writer stage: Deduplication -> Store -> enqueue links (all DB writes); returns True if stored
+    def write_page(self, result):
+        script, metrics = self.script, self.metrics
+        url, depth = result['url'], result['depth']
+        metrics.add_timings(result['timings'])
+        reason = result['rejected']
+        if reason is None:
+            with metrics.timer('dedup'):
+                _, reason = script.duplicate_check(url, result['content_hash'], result['fingerprint'])
+        if reason:
+            print(f"Deleted/Flagged: {reason} for {url}")
+            metrics.count('rejected', reason=reason)
+            if self.follow_rejected_links:
+                with metrics.timer('enqueue'):
+                    script.add_to_pending(result['links'], depth, anchors=result['anchors'],
+                                          parent_score=result['parent_score'])
+            return False
+
+        # Data Meets Standards? Yes → Store
+        with metrics.timer('store'):
+            script.store_article(url, result['title'], result['content'], result['category'],
+                                 result['content_hash'], result['fingerprint'])
+        metrics.count('articles_stored')
+
+        # Add new links to pending (crawl continuation)
+        with metrics.timer('enqueue'):
+            script.add_to_pending(result['links'], depth, anchors=result['anchors'], parent_score=result['parent_score'])
+        return True
+
+    # One URL through the pipeline (exact Miro sequence); returns True if stored
+    def process_url(self, next_url, depth):
+        print(f"Processing: {next_url} (depth {depth})")
+
+        # Extract Raw Data (single download + single parse; outlinks come along)
+        start = time.perf_counter()
+        page = self.script.fetch_page(next_url, cache=self.cache, pdf=self.pdf)
+        self.metrics.record_fetch(next_url, page, time.perf_counter() - start)
+        if not page:
+            return False
+        if page.get('not_modified'):
+            # 304: unchanged since the cached copy, nothing to parse/classify/store
+            print(f"Not modified: {next_url}")
+            return False
+        return self.write_page(self.analyze_page(next_url, depth, page))
+
+    # Fetch stage of --cpu-workers mode: download only; parsing happens in the CPU pool
+    def fetch_for_pipeline(self, next_url, depth):
+        print(f"Processing: {next_url} (depth {depth})")
+        start = time.perf_counter()
+        page = self.script.fetch_page(next_url, cache=self.cache, pdf=self.pdf, parse=False)
+        self.metrics.record_fetch(next_url, page, time.perf_counter() - start)
+        if page and page.get('not_modified'):
+            print(f"Not modified: {next_url}")
+            return None
+        return page
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+        if self.pdf is not None:
+            self.pdf.close()
+            self.pdf = None
+
+# Main Pipeline
+def run_crawl(script, workers=1, host_delay=DEFAULT_HOST_DELAY, follow_rejected_links=False, url_index='set',
+              ignore_robots=False, http_cache=True, cache_max_mb=DEFAULT_MAX_BYTES // (1024 * 1024), recrawl=False,
+              pdf=True, pdf_workers=PDF_WORKERS, pdf_max_pages=PDF_MAX_PAGES, pdf_max_mb=PDF_MAX_BYTES // (1024 * 1024),
+              pdf_timeout=PDF_TIMEOUT, reclassify=False, reclassify_workers=1,
+              near_dup_similarity=NEAR_DUP_SIMILARITY, rebuild_near_dup_index=False,
+              cpu_workers=0, flush_rows=ARTICLE_FLUSH_ROWS, flush_interval=ARTICLE_FLUSH_SECONDS, fts=False,
+              content_codec='plain', metrics_interval=METRICS_INTERVAL, metrics_dir=None,
+              profile=False, profile_window=PROFILE_PAGES, profile_mode='cprofile', profile_dir=None,
+              flush_hook=None, on_reclassify=None):
+    """
+    Crawl with `script`'s config and page steps (or relabel its articles with --reclassify).
+    flush_hook(rows) runs after each article group commit; on_reclassify(conn, changes)
+    after each reclassified chunk.
+    """
+    db_dir = os.path.dirname(script.DB_PATH) or "."
+    if reclassify:
+        # Offline: relabel stored articles with the current CATEGORIES, no crawling
+        stats = reclassify_articles(script.DB_PATH, script.CATEGORIES, chunk_size=RECLASSIFY_CHUNK,
+                                    workers=reclassify_workers, on_changes=on_reclassify)
+        print(f"Reclassified: {stats['changed']} of {stats['scanned']} article(s) changed category in {stats['seconds']:.1f}s")
+        return
+    state = script.init_db(url_index=url_index, near_dup_similarity=near_dup_similarity,
+                           flush_rows=flush_rows, flush_interval=flush_interval, fts=fts, content_codec=content_codec)
+    if flush_hook is not None:
+        state.add_flush_hook(flush_hook)
+    if rebuild_near_dup_index:
+        state.near_dups.catch_up(rebuild=True)
+    script.add_seeds()
+    crawl = CrawlRun(script, follow_rejected_links)
+    if http_cache:
+        crawl.cache = ResponseCache(os.path.join(db_dir, CACHE_FILENAME), max_bytes=int(cache_max_mb * 1024 * 1024))
+    if pdf:
+        crawl.pdf = PdfExtractor(workers=pdf_workers, max_pages=pdf_max_pages,
+                                 max_bytes=int(pdf_max_mb * 1024 * 1024), timeout=pdf_timeout)
+    if recrawl:
+        print(f"Recrawl: re-queued {state.requeue_articles()} stored article URL(s) for revalidation")
+    rate = CrawlRate()
+
+    # One scheduler for every run: per-host token buckets + robots.txt instead of global sleeps
+    robots = None if ignore_robots else RobotsCache(headers=HEADERS)
+    # Stage timings, counters and the frontier size, snapshotted to crawl_stats and the metrics files
+    metrics = crawl.metrics
+    metrics.start(metrics_dir or db_dir, metrics_interval, save=state.save_stats, frontier=state.frontier_by_depth)
+    print(f"Crawling with {workers} worker(s), {host_delay}s base per-host delay"
+          f"{', robots.txt ignored' if ignore_robots else ''}")
+    # --profile: the page stages are wrapped only for this run; the first profile_window pages are profiled
+    fetch_fn, write_fn, process_fn = crawl.fetch_for_pipeline, crawl.write_page, crawl.process_url
+    profiler = None
+    if profile:
+        profiler = RunProfiler(profile_dir or os.path.join(db_dir, PROFILE_DIRNAME),
+                               profile_window, profile_mode, unit='pages')
+        fetch_fn, write_fn, process_fn = (profiler.wrap(fetch_fn, count=False),
+                                          profiler.wrap(write_fn), profiler.wrap(process_fn))
+        profiler.start()
+    pipeline = None
+    try:
+        if cpu_workers > 0:
+            # Staged: fetch threads -> CPU process pool -> one writer; the writer completes URLs
+            pipeline = StagedPipeline(fetch_fn, crawl.analyze_page, write_fn, state.complete,
+                                      cpu_workers, fetch_workers=workers, rate=rate)
+            run_concurrent(state.claim_next_pending, pipeline.fetch_stage, workers,
+                           host_delay=host_delay, max_items=MAX_ITEMS, rate=rate,
+                           finish=pipeline.finish, robots=robots, busy=pipeline.busy)
+        else:
+            # Leased URLs are completed (visited + dequeued) by finish= whatever the outcome
+            run_concurrent(state.claim_next_pending, process_fn, workers,
+                           host_delay=host_delay, max_items=MAX_ITEMS, rate=rate,
+                           finish=state.complete, robots=robots)
+    except KeyboardInterrupt:
+        print("\nInterrupted. Progress saved to DB. Rerun to resume.")
+    finally:
+        if pipeline is not None:
+            pipeline.close()
+            print(f"Stages: {pipeline.summary()}")
+        state.flush()  # URLs of buffered articles leave the frontier with this commit
+        metrics.stop()
+        print(f"Stage times: {metrics.summary()}")
+        if profiler is not None:
+            profiler.stop()
+
+    script.close_db()  # final article flush (and flush hooks)
+    crawl.close()
+    print(f"Total processed: {rate.stored}")
+    print(f"Throughput: {rate.summary()}")
+
+def build_parser(description):
+    """Argument parser with every run_crawl() flag; a script adds its own flags on top."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--workers', type=int, default=1, help='Number of concurrent fetches (default 1 = one request at a time).')
+    parser.add_argument('--host-delay', type=float, default=DEFAULT_HOST_DELAY, help='Minimum seconds between requests to the same host (raised by robots.txt Crawl-delay).')
+    parser.add_argument('--follow-rejected-links', action='store_true', help='Also queue links found on pages rejected by quality assurance.')
+    parser.add_argument('--url-index', choices=URL_INDEX_MODES, default='set', help="In-memory visited/pending index: 'set' (exact) or 'bloom' (compact, SQLite confirms hits).")
+    parser.add_argument('--ignore-robots', action='store_true', help='Do not fetch or obey robots.txt (Disallow / Crawl-delay).')
+    parser.add_argument('--no-http-cache', action='store_true', help='Disable the on-disk response cache and conditional (ETag/Last-Modified) requests.')
+    parser.add_argument('--cache-max-mb', type=float, default=DEFAULT_MAX_BYTES // (1024 * 1024), help='Size cap for the response cache (compressed MB); least recently used entries are evicted.')
+    parser.add_argument('--recrawl', action='store_true', help='Re-queue every stored article so it is revalidated (unchanged pages answer 304 and are skipped).')
+    parser.add_argument('--no-pdf', action='store_true', help='Skip PDF text extraction (PDFs then yield no text and are rejected by quality assurance).')
+    parser.add_argument('--pdf-workers', type=int, default=PDF_WORKERS, help='Processes in the PDF extraction pool.')
+    parser.add_argument('--pdf-max-pages', type=int, default=PDF_MAX_PAGES, help='Only extract the first N pages of each PDF.')
+    parser.add_argument('--pdf-max-mb', type=float, default=PDF_MAX_BYTES // (1024 * 1024), help='Skip PDFs larger than this many MB (download is aborted).')
+    parser.add_argument('--pdf-timeout', type=float, default=PDF_TIMEOUT, help='Seconds allowed per PDF before its worker is killed.')
+    parser.add_argument('--reclassify', action='store_true', help='Offline: re-score every stored article with the current CATEGORIES and update changed rows, then exit (no crawling).')
+    parser.add_argument('--reclassify-workers', type=int, default=1, help='Processes used to score articles with --reclassify.')
+    parser.add_argument('--near-dup-similarity', type=float, default=NEAR_DUP_SIMILARITY, help='Reject pages at least this similar (SimHash, 0.8-1.0) to a stored article.')
+    parser.add_argument('--rebuild-near-dup-index', action='store_true', help='Recompute the near-duplicate fingerprints of all stored articles before crawling.')
+    parser.add_argument('--flush-rows', type=int, default=ARTICLE_FLUSH_ROWS, help='Group commit: write stored articles in batches of N rows (1 = commit each article).')
+    parser.add_argument('--flush-interval', type=float, default=ARTICLE_FLUSH_SECONDS, help='Group commit: longest a stored article waits before its batch is written (seconds).')
+    parser.add_argument('--fts', action='store_true', help='Keep an FTS5 full-text index of stored articles (query it with search_index.py). With --content-codec zlib/zstd its triggers need content_text(), so other SQLite tools can no longer delete or update articles.')
+    parser.add_argument('--content-codec', choices=CONTENT_CODECS, default='plain', help='Store new article text compressed (zlib, or zstd with a trained dictionary; needs the zstandard package). Other SQLite tools then show content as bytes, and with --fts cannot edit articles; content_codec.py --codec plain converts back.')
+    parser.add_argument('--metrics-interval', type=float, default=METRICS_INTERVAL, help='Seconds between metrics snapshots (crawl_stats table, crawl_metrics.json/.prom); 0 = only at the end.')
+    parser.add_argument('--metrics-dir', default=None, help='Folder for crawl_metrics.json / crawl_metrics.prom (default: next to the DB; point a Prometheus textfile collector here).')
+    parser.add_argument('--profile', action='store_true', help='Profile the first --profile-window pages (cProfile or stack sampling, plus tracemalloc) and write reports.')
+    parser.add_argument('--profile-window', type=int, default=PROFILE_PAGES, help='Pages to profile with --profile; the rest of the run is not profiled.')
+    parser.add_argument('--profile-mode', choices=PROFILE_MODES, default='cprofile', help="'cprofile' (exact call counts, slower) or 'sample' (low-overhead wall-clock stack samples of every thread).")
+    parser.add_argument('--profile-dir', default=None, help=f'Folder for the profile reports (default: {PROFILE_DIRNAME}/ next to the DB).')
+    parser.add_argument('--cpu-workers', type=int, default=0, help='Staged mode: parse/classify/QA in a pool of N processes, with one writer thread for SQLite (0 = do it on the fetch threads).')
+    return parser
+
+def run_options(args):
+    """run_crawl() keyword arguments from build_parser()'s parsed flags."""
+    return dict(workers=args.workers, host_delay=args.host_delay, follow_rejected_links=args.follow_rejected_links,
+                url_index=args.url_index, ignore_robots=args.ignore_robots, http_cache=not args.no_http_cache,
+                cache_max_mb=args.cache_max_mb, recrawl=args.recrawl, pdf=not args.no_pdf,
+                pdf_workers=args.pdf_workers, pdf_max_pages=args.pdf_max_pages, pdf_max_mb=args.pdf_max_mb,
+                pdf_timeout=args.pdf_timeout, reclassify=args.reclassify, reclassify_workers=args.reclassify_workers,
+                near_dup_similarity=args.near_dup_similarity, rebuild_near_dup_index=args.rebuild_near_dup_index,
+                cpu_workers=args.cpu_workers, flush_rows=args.flush_rows, flush_interval=args.flush_interval,
+                fts=args.fts, content_codec=args.content_codec, metrics_interval=args.metrics_interval,
+                metrics_dir=args.metrics_dir, profile=args.profile, profile_window=args.profile_window,
+                profile_mode=args.profile_mode, profile_dir=args.profile_dir)
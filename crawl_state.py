@@ -0,0 +1,637 @@
+#!/usr/bin/env python3
+"""
+crawl_state.py
+
+Persistent crawl-state store for the scraper entry points.
+
+CrawlStateStore owns one long-lived SQLite connection to the main DB and
+exposes the visited / pending / articles operations as methods, instead of
+every helper opening, committing and closing its own connection. The DB runs
+in WAL mode with synchronous=NORMAL (the same pragmas _open_category_db uses
+for the mirrors), so a commit no longer forces an fsync.
+
+Every statement is issued with fixed SQL text, so sqlite3's per-connection
+statement cache keeps them prepared across calls. A lock serializes access
+when the concurrent engine calls in from worker threads.
+
+The frontier is leased in batches: lease_pending() flips up to K rows to
+status='leased' in one transaction, and a row is only deleted by complete()
+once its URL has been processed and marked visited. A crash in between leaves
+the row leased; the next run starts by putting every lease back, so no URL is
+lost. Leases never expire during a run: there is one crawler per DB, so an
+old lease is this process's own work (parked behind a slow host, or still
+being fetched), and handing it out again would fetch the URL twice.
+
+The frontier is best-first: each pending row carries a priority (see
+link_priority), and leases go out highest priority first, then shallowest
+depth, round-robin across domains within a tie.
+
+URLs are canonicalized (url_canon.py) before they are queued or looked up,
+and visited_urls / pending_urls are keyed by the canonical URL's 64-bit
+fingerprint (an INTEGER, not a TEXT index). visited_urls holds only the
+fingerprints; pending_urls keeps the URL text because it is fetched from
+there. DBs with the older TEXT-keyed tables are converted on open.
+
+Membership checks (is this URL visited / already queued?) are answered from an
+in-memory UrlIndex of fingerprints loaded at startup and kept in sync on
+writes. In 'set' mode the index is exact; in 'bloom' mode it is a Bloom filter
+with bounded memory, and a "maybe" answer is confirmed against SQLite, which
+stays authoritative.
+
+Stored articles are also fingerprinted into a banded SimHash index
+(near_dup.NearDupIndex) in the same DB; articles stored before it existed are
+fingerprinted at startup.
+
+Article content is stored in the format chosen by content_codec ('plain',
+'zlib' or 'zstd', see content_codec.py); rows in any format stay readable and
+the SQL function content_text() is registered on the connection.
+
+Run metrics (crawl_metrics.py) are saved to the crawl_stats table through
+save_stats(); frontier_by_depth() feeds its frontier gauge.
+
+With fts=True the articles are also kept in an FTS5 full-text index
+(search_index.articles_fts, maintained by triggers).
+
+Articles are group-committed: store_article() buffers the row and flush()
+writes the whole buffer (articles, fingerprints, and the visited marks of
+those URLs) in one transaction, every flush_rows articles or flush_interval
+seconds, and always on close(). Flush hooks (the per-category mirrors) get
+the same rows right after each commit. Until then the duplicate checks also
+look at the buffer, and a buffered URL stays leased in pending_urls, so a
+crash loses no accepted article: its URL is simply crawled again.
+"""
+
+import hashlib
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import deque, defaultdict, Counter
+from itertools import groupby
+from urllib.parse import urlparse
+
+from near_dup import NearDupIndex, NEAR_DUP_SIMILARITY, hamming
+from search_index import enable_fts, has_fts
+from content_codec import ContentCodec, ensure_schema, register_functions, train_from_db
+from url_canon import canonical_fingerprint, url_fingerprint
+
+# ----------------- Config -----------------
+# Size of sqlite3's per-connection prepared statement cache
+CACHED_STATEMENTS = 256
+
+# URL index modes: 'set' = exact Python set, 'bloom' = compact Bloom filter
+URL_INDEX_MODES = ('set', 'bloom')
+# Bloom filter sizing: expected URLs and target false-positive rate.
+# The filter is sized to at least 2x the rows found at startup.
+BLOOM_CAPACITY = 2_000_000
+BLOOM_ERROR_RATE = 0.01
+
+# Rows per fetchmany() when loading the index at startup
+LOAD_BATCH = 10000
+
+# Frontier leasing: URLs leased per transaction
+LEASE_BATCH = 50
+
+# Best-first frontier: weight of a keyword hit in the URL / anchor text, cap on
+# the parent page's category score, and how many top rows a lease looks at to
+# spread a batch across domains.
+URL_HIT_WEIGHT = 3
+ANCHOR_HIT_WEIGHT = 3
+PARENT_SCORE_CAP = 6
+FAIRNESS_WINDOW = 4
+
+# Group commit: articles per flush, and the longest a stored article may wait
+# in the buffer (seconds). flush_rows=1 commits every article on its own.
+ARTICLE_FLUSH_ROWS = 50
+ARTICLE_FLUSH_SECONDS = 2.0
+# ------------------------------------------
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+def _token_text(s):
+    # "/Oil-Palm_plantation?id=3" -> " oil palm plantation id 3 " (padded for whole-word matching)
+    return ' ' + ' '.join(_TOKEN_RE.findall(s.lower())) + ' '
+
+def link_priority(url, anchor_text='', parent_score=0, keywords=()):
+    """
+    Best-first score for a frontier URL: keyword hits in the URL path/query and
+    in the anchor text, plus the parent page's category score (capped).
+    Integer-valued so equal scores tie and the depth/domain tie-breakers apply.
+    """
+    parsed = urlparse(url)
+    url_text = _token_text(parsed.path + ' ' + parsed.query)
+    anchor = _token_text(anchor_text) if anchor_text else ''
+    url_hits = sum(1 for kw in keywords if _token_text(kw) in url_text)
+    anchor_hits = sum(1 for kw in keywords if anchor and _token_text(kw) in anchor)
+    return (URL_HIT_WEIGHT * url_hits + ANCHOR_HIT_WEIGHT * anchor_hits
+            + min(int(parent_score), PARENT_SCORE_CAP))
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over 64-bit URL fingerprints (~1.2 bytes per entry
+    at 1% error). Never gives false negatives; positives must be confirmed elsewhere.
+    """
+
+    def __init__(self, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        capacity = max(1, int(capacity))
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing (Kirsch-Mitzenmacher) from one 128-bit digest
+        d = hashlib.blake2b(key.to_bytes(8, 'little', signed=True), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], 'little')
+        h2 = int.from_bytes(d[8:], 'little') | 1
+        m = self.num_bits
+        return [(h1 + i * h2) % m for i in range(self.num_hashes)]
+
+    def add(self, key):
+        bits = self.bits
+        for pos in self._positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def __len__(self):
+        return self.count
+
+class UrlIndex:
+    """
+    In-memory URL membership index (of url_canon fingerprints).
+
+    mode='set'   exact; a hit is final.
+    mode='bloom' compact; a miss is final, a hit is only "maybe" (self.exact is False).
+    """
+
+    def __init__(self, mode='set', capacity=BLOOM_CAPACITY):
+        if mode not in URL_INDEX_MODES:
+            raise ValueError(f"Unknown URL index mode: {mode!r} (expected one of {URL_INDEX_MODES})")
+        self.mode = mode
+        self.exact = mode == 'set'
+        self._items = set() if self.exact else BloomFilter(capacity)
+
+    def add(self, fp):
+        self._items.add(fp)
+
+    def discard(self, fp):
+        # Bloom filters can't delete; the stale "maybe" is resolved by the SQLite fallback
+        if self.exact:
+            self._items.discard(fp)
+
+    def __contains__(self, fp):
+        return fp in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+PENDING_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS pending_urls (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fp INTEGER UNIQUE,
+        url TEXT,
+        depth INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'pending',
+        lease_expires REAL,
+        priority REAL DEFAULT 0
+    )
+'''
+
+VISITED_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS visited_urls (
+        fp INTEGER PRIMARY KEY
+    )
+'''
+
+SCHEMA = [
+    # Pending queue: id, URL fingerprint (url_canon), url, depth, priority (best-first, FIFO via id on ties),
+    # lease status (lease_expires is no longer set; kept for older DBs)
+    PENDING_TABLE_SQL,
+    # Visited URLs: fingerprints only
+    VISITED_TABLE_SQL,
+    # Articles (categorized storage)
+    '''
+    CREATE TABLE IF NOT EXISTS articles (
+        url TEXT PRIMARY KEY,
+        title TEXT,
+        content TEXT,
+        category TEXT,
+        scraped_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        hash TEXT UNIQUE  -- For dedup
+    )
+    ''',
+    # Run metrics (crawl_metrics.py): latest value of every series, per run
+    '''
+    CREATE TABLE IF NOT EXISTS crawl_stats (
+        run TEXT,
+        kind TEXT,
+        name TEXT,
+        labels TEXT,
+        value REAL,
+        count INTEGER,
+        max REAL,
+        p50 REAL,
+        p90 REAL,
+        p99 REAL,
+        updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (run, kind, name, labels)
+    )
+    ''',
+]
+
+class CrawlStateStore:
+    """One long-lived connection to the main crawl DB."""
+
+    def __init__(self, db_path, index_mode='set', near_dup_similarity=NEAR_DUP_SIMILARITY,
+                 flush_rows=ARTICLE_FLUSH_ROWS, flush_interval=ARTICLE_FLUSH_SECONDS, fts=False,
+                 content_codec='plain'):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False,
+                                    cached_statements=CACHED_STATEMENTS)
+        self.conn.execute("PRAGMA journal_mode = WAL;")
+        self.conn.execute("PRAGMA synchronous = NORMAL;")
+        # INSERT OR REPLACE must fire delete triggers (full-text index sync)
+        self.conn.execute("PRAGMA recursive_triggers = ON;")
+        self._leased = deque()
+        # URLs handed out per domain this run (fairness tie-breaker)
+        self._served = Counter()
+        with self._lock, self.conn:
+            for stmt in SCHEMA:
+                self.conn.execute(stmt)
+            self._migrate_pending()
+            self._migrate_url_keys()
+            # Single crawler per DB: leases left by a previous run are stale
+            self.conn.execute("UPDATE pending_urls SET status = 'pending', lease_expires = NULL WHERE status = 'leased'")
+        ensure_schema(self.conn)
+        self.codec = ContentCodec(self.conn, content_codec)
+        register_functions(self.conn, self.codec)
+        if content_codec == 'zstd' and self.codec.tag == 'zstd':
+            # No dictionary yet: train one if enough articles are stored already
+            dict_id = train_from_db(self.conn, self.codec)
+            if dict_id:
+                print(f"Trained zstd content dictionary {dict_id}")
+        if fts or has_fts(self.conn):
+            # Also upgrades an index created by an older version
+            with self._lock:
+                enable_fts(self.conn, compressed=self.codec.tag is not None)
+        self._load_index(index_mode)
+        self.near_dups = NearDupIndex(self.conn, self._lock, near_dup_similarity)
+        # Group commit buffer: url -> (title, content, category, hash, fingerprint)
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_interval = flush_interval
+        self._buffer = {}
+        self._buffered_hashes = {}
+        self._buffer_since = None
+        self._deferred = set()        # fingerprints of URLs completed while their article is still buffered
+        self._flush_hooks = []
+        self.flushes = 0
+        self._closed = threading.Event()
+        self._flusher = None
+        if self.flush_rows > 1 and flush_interval and flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_timer, name='article-flusher', daemon=True)
+            self._flusher.start()
+
+    def _migrate_pending(self):
+        # Older DBs have pending_urls without the lease columns
+        cols = {row[1] for row in self.conn.execute("PRAGMA table_info(pending_urls)")}
+        if 'status' not in cols:
+            self.conn.execute("ALTER TABLE pending_urls ADD COLUMN status TEXT DEFAULT 'pending'")
+        if 'lease_expires' not in cols:
+            self.conn.execute("ALTER TABLE pending_urls ADD COLUMN lease_expires REAL")
+        if 'priority' not in cols:
+            self.conn.execute("ALTER TABLE pending_urls ADD COLUMN priority REAL DEFAULT 0")
+        self.conn.execute("DROP INDEX IF EXISTS idx_pending_status")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_priority ON pending_urls (status, priority DESC, depth, id)")
+
+    def _migrate_url_keys(self):
+        # Older DBs key visited_urls / pending_urls by the URL text: rebuild both keyed by fingerprint
+        if 'fp' not in {row[1] for row in self.conn.execute("PRAGMA table_info(visited_urls)")}:
+            self.conn.execute("ALTER TABLE visited_urls RENAME TO visited_urls_old")
+            self.conn.execute(VISITED_TABLE_SQL)
+            cur = self.conn.execute("SELECT url FROM visited_urls_old")
+            n = 0
+            while True:
+                rows = cur.fetchmany(LOAD_BATCH)
+                if not rows:
+                    break
+                self.conn.executemany("INSERT OR IGNORE INTO visited_urls (fp) VALUES (?)",
+                                      [(url_fingerprint(url),) for (url,) in rows])
+                n += len(rows)
+            self.conn.execute("DROP TABLE visited_urls_old")
+            print(f"URL keys: {n} visited URL(s) converted to fingerprints")
+        if 'fp' not in {row[1] for row in self.conn.execute("PRAGMA table_info(pending_urls)")}:
+            self.conn.execute("ALTER TABLE pending_urls RENAME TO pending_urls_old")
+            self.conn.execute(PENDING_TABLE_SQL)
+            # Highest priority first, so URLs that canonicalize alike keep the best score
+            cur = self.conn.execute("SELECT url, depth, status, lease_expires, priority FROM pending_urls_old "
+                                    "ORDER BY priority DESC, id ASC")
+            n = 0
+            while True:
+                rows = cur.fetchmany(LOAD_BATCH)
+                if not rows:
+                    break
+                batch = []
+                for url, *rest in rows:
+                    canonical, fp = canonical_fingerprint(url)
+                    batch.append((fp, canonical, *rest))
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO pending_urls (fp, url, depth, status, lease_expires, priority) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", batch)
+                n += len(rows)
+            self.conn.execute("DROP TABLE pending_urls_old")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_priority ON pending_urls (status, priority DESC, depth, id)")
+            print(f"URL keys: {n} pending URL(s) canonicalized and keyed by fingerprint")
+
+    def _load_index(self, mode):
+        """
+        Build the in-memory fingerprint indexes: `visited` over visited_urls,
+        and `known` over visited_urls + pending_urls (everything ever queued or fetched).
+        """
+        n_visited = self.conn.execute("SELECT COUNT(*) FROM visited_urls").fetchone()[0]
+        n_pending = self.conn.execute("SELECT COUNT(*) FROM pending_urls").fetchone()[0]
+        self.visited = UrlIndex(mode, capacity=max(BLOOM_CAPACITY, 2 * n_visited))
+        self.known = UrlIndex(mode, capacity=max(BLOOM_CAPACITY, 2 * (n_visited + n_pending)))
+        self.index_fallbacks = 0
+        for table, targets in (("visited_urls", (self.visited, self.known)), ("pending_urls", (self.known,))):
+            cur = self.conn.execute(f"SELECT fp FROM {table}")
+            while True:
+                rows = cur.fetchmany(LOAD_BATCH)
+                if not rows:
+                    break
+                for (fp,) in rows:
+                    for idx in targets:
+                        idx.add(fp)
+        print(f"URL index ({mode}): {n_visited} visited, {n_pending} pending loaded")
+
+    # ---- visited ----
+    def is_visited(self, url):
+        return self._is_visited_fp(url_fingerprint(url))
+
+    def _is_visited_fp(self, fp):
+        with self._lock:
+            if fp in self._deferred:
+                return True
+            if fp not in self.visited:
+                return False
+            if self.visited.exact:
+                return True
+            # Bloom hit: confirm against the authoritative table
+            self.index_fallbacks += 1
+            row = self.conn.execute("SELECT 1 FROM visited_urls WHERE fp = ?", (fp,)).fetchone()
+        return row is not None
+
+    def mark_visited(self, url):
+        fp = url_fingerprint(url)
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO visited_urls (fp) VALUES (?)", (fp,))
+            self.visited.add(fp)
+            self.known.add(fp)
+
+    # ---- pending ----
+    def is_known(self, url):
+        """True if `url` was already visited or is waiting in pending_urls."""
+        return self._is_known_fp(url_fingerprint(url))
+
+    def _is_known_fp(self, fp):
+        with self._lock:
+            if fp not in self.known:
+                return False
+            if self.known.exact:
+                return True
+            self.index_fallbacks += 1
+            row = self.conn.execute(
+                "SELECT 1 FROM visited_urls WHERE fp = ? UNION ALL SELECT 1 FROM pending_urls WHERE fp = ?",
+                (fp, fp)).fetchone()
+        return row is not None
+
+    def add_pending(self, urls, depth, priorities=None):
+        """
+        Queue `urls` that were never visited or queued, at `depth`, with one executemany.
+        URLs are canonicalized first, and queued in canonical form.
+        `priorities` maps url -> score; a URL already waiting in the queue is
+        bumped if it is rediscovered with a higher score.
+        """
+        priorities = priorities or {}
+        with self._lock, self.conn:
+            new, bump = {}, []
+            for url in dict.fromkeys(urls):
+                canonical, fp = canonical_fingerprint(url)
+                score = priorities.get(url, 0)
+                if fp in new:
+                    # Two spellings of one URL in the same batch: keep the better score
+                    if score > new[fp][3]:
+                        new[fp] = (fp, canonical, depth, score)
+                elif not self._is_known_fp(fp):
+                    new[fp] = (fp, canonical, depth, score)
+                elif score > 0 and not self._is_visited_fp(fp):
+                    bump.append((score, fp, score))
+            if new:
+                self.conn.executemany("INSERT OR IGNORE INTO pending_urls (fp, url, depth, priority) VALUES (?, ?, ?, ?)",
+                                      list(new.values()))
+                for fp in new:
+                    self.known.add(fp)
+            if bump:
+                self.conn.executemany("UPDATE pending_urls SET priority = ? WHERE fp = ? AND priority < ?", bump)
+        return len(new)
+
+    def lease_pending(self, k=LEASE_BATCH):
+        """
+        Lease up to `k` URLs in one transaction, best-first: highest priority,
+        then shallowest depth, then round-robin across domains (least served first).
+        Returns [(url, depth, fp), ...]; rows stay in pending_urls until complete().
+        """
+        with self._lock, self.conn:
+            rows = self.conn.execute("SELECT id, url, depth, priority, fp FROM pending_urls WHERE status = 'pending' "
+                                     "ORDER BY priority DESC, depth ASC, id ASC LIMIT ?",
+                                     (k * FAIRNESS_WINDOW,)).fetchall()
+            picked = self._pick_fair(rows, k)
+            if picked:
+                self.conn.executemany("UPDATE pending_urls SET status = 'leased' WHERE id = ?",
+                                      [(row[0],) for row in picked])
+        return [(url, depth, fp) for _, url, depth, _, fp in picked]
+
+    def _pick_fair(self, rows, k):
+        # rows are ordered by (priority DESC, depth, id); within each equal
+        # (priority, depth) group take one URL per domain in turn, least-served domain first
+        picked = []
+        for _, group in groupby(rows, key=lambda r: (r[3], r[2])):
+            by_domain = defaultdict(deque)
+            for row in group:
+                by_domain[urlparse(row[1]).netloc.lower()].append(row)
+            while by_domain and len(picked) < k:
+                for domain in sorted(by_domain, key=lambda d: self._served[d]):
+                    picked.append(by_domain[domain].popleft())
+                    self._served[domain] += 1
+                    if not by_domain[domain]:
+                        del by_domain[domain]
+                    if len(picked) >= k:
+                        break
+            if len(picked) >= k:
+                break
+        return picked
+
+    def claim_next_pending(self):
+        """Next leased URL that has not been visited yet; leases a new batch when the buffer runs dry."""
+        with self._lock:
+            while True:
+                if not self._leased:
+                    self._leased.extend(self.lease_pending())
+                    if not self._leased:
+                        return None, None  # Return a tuple that can be safely unpacked
+                url, depth, fp = self._leased.popleft()
+                if not self._is_visited_fp(fp):
+                    return url, depth
+                self._complete_fp(url, fp)
+
+    def complete(self, url):
+        """URL processed (stored, rejected or failed): mark visited and drop its lease, atomically."""
+        self._complete_fp(url, url_fingerprint(url))
+
+    def _complete_fp(self, url, fp):
+        with self._lock:
+            if url in self._buffer:
+                # Marked visited in the same transaction that writes its article
+                self._deferred.add(fp)
+                self.visited.add(fp)
+                self.known.add(fp)
+                return
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO visited_urls (fp) VALUES (?)", (fp,))
+            self.conn.execute("DELETE FROM pending_urls WHERE fp = ?", (fp,))
+            self.visited.add(fp)
+            self.known.add(fp)
+
+    def requeue_articles(self):
+        """
+        Put every stored article's URL back in the queue (at depth 0) so a
+        recrawl revalidates it. Returns the number of URLs queued.
+        """
+        with self._lock, self.conn:
+            keys = {fp: canonical for canonical, fp in
+                    (canonical_fingerprint(row[0]) for row in self.conn.execute("SELECT url FROM articles"))}
+            self.conn.executemany("DELETE FROM visited_urls WHERE fp = ?", [(fp,) for fp in keys])
+            self.conn.executemany("INSERT OR IGNORE INTO pending_urls (fp, url, depth) VALUES (?, ?, 0)",
+                                  list(keys.items()))
+            for fp in keys:
+                self.visited.discard(fp)
+                self.known.add(fp)
+        return len(keys)
+
+    def frontier_by_depth(self):
+        """{depth: URLs pending or leased} (the metrics' frontier gauge)."""
+        with self._lock:
+            return dict(self.conn.execute("SELECT depth, COUNT(*) FROM pending_urls GROUP BY depth").fetchall())
+
+    def release_leases(self):
+        """Put every unfinished lease back in the queue (clean shutdown)."""
+        with self._lock, self.conn:
+            self._leased.clear()
+            self.conn.execute("UPDATE pending_urls SET status = 'pending', lease_expires = NULL WHERE status = 'leased'")
+
+    # ---- run metrics ----
+    def save_stats(self, run, rows):
+        """Upsert crawl_stats rows [(kind, name, labels, value, count, max, p50, p90, p99)] of `run`."""
+        with self._lock, self.conn:
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO crawl_stats (run, kind, name, labels, value, count, max, p50, p90, p99, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', [(run, *row) for row in rows])
+
+    # ---- articles ----
+    def hash_exists(self, content_hash):
+        with self._lock:
+            if content_hash in self._buffered_hashes:
+                return True
+            row = self.conn.execute("SELECT 1 FROM articles WHERE hash = ?", (content_hash,)).fetchone()
+        return row is not None
+
+    def near_duplicate_of(self, fingerprint, exclude_url=None):
+        """URL of a stored article whose SimHash is within the similarity threshold, or None."""
+        if fingerprint:
+            with self._lock:
+                for url, row in self._buffer.items():
+                    if url != exclude_url and row[4] and hamming(fingerprint, row[4]) <= self.near_dups.max_distance:
+                        return url
+        return self.near_dups.find(fingerprint, exclude_url)
+
+    def store_article(self, url, title, content, category, content_hash, fingerprint=None):
+        """Buffer the article; it is written by the next flush()."""
+        with self._lock:
+            old = self._buffer.pop(url, None)
+            if old is not None:
+                self._buffered_hashes.pop(old[3], None)
+            self._buffer[url] = (title, content, category, content_hash, fingerprint)
+            self._buffered_hashes[content_hash] = url
+            if self._buffer_since is None:
+                self._buffer_since = time.monotonic()
+            if len(self._buffer) >= self.flush_rows:
+                self.flush()
+
+    def add_flush_hook(self, hook):
+        """hook(rows) runs after each flush commit with [(url, title, content, codec, category, hash)], content as stored."""
+        self._flush_hooks.append(hook)
+
+    def flush(self):
+        """Write buffered articles, their fingerprints and deferred visited marks in one transaction."""
+        with self._lock:
+            if not self._buffer and not self._deferred:
+                return 0
+            rows = [(url, title, *self.codec.encode(content), category, content_hash)
+                    for url, (title, content, category, content_hash, _) in self._buffer.items()]
+            done = [(fp,) for fp in self._deferred]
+            with self.conn:
+                self.conn.executemany('''
+                    INSERT OR REPLACE INTO articles (url, title, content, codec, category, hash)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', rows)
+                for url, row in self._buffer.items():
+                    if row[4] is not None:
+                        self.near_dups.add(url, row[4])
+                self.conn.executemany("INSERT OR IGNORE INTO visited_urls (fp) VALUES (?)", done)
+                self.conn.executemany("DELETE FROM pending_urls WHERE fp = ?", done)
+            # Committed: the buffer can go even if a hook fails
+            self._buffer.clear()
+            self._buffered_hashes.clear()
+            self._deferred.clear()
+            self._buffer_since = None
+            self.flushes += 1
+            for hook in self._flush_hooks:
+                try:
+                    hook(rows)
+                except Exception as e:
+                    print(f"Error in flush hook {getattr(hook, '__name__', hook)}: {e}")
+        return len(rows)
+
+    def _flush_timer(self):
+        # Flushes a buffer that has waited flush_interval seconds when no new article arrives to trigger it
+        tick = min(self.flush_interval, 0.5)
+        while not self._closed.wait(tick):
+            with self._lock:
+                due = self._buffer_since is not None and time.monotonic() - self._buffer_since >= self.flush_interval
+                if due:
+                    try:
+                        self.flush()
+                    except Exception as e:
+                        print(f"Error flushing articles: {e}")
+
+    def close(self):
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        with self._lock:
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing articles on close: {e}")
+            try:
+                self.release_leases()
+                self.conn.commit()
+                self.conn.close()
+            except Exception:
+                pass
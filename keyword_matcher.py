@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+keyword_matcher.py
+
+Single-pass multi-keyword matching for classification.
+
+KeywordMatcher compiles a {group: [keywords]} table (e.g. CATEGORIES) into an
+Aho-Corasick automaton over words rather than characters. The text is split
+into words once and walked in one linear pass, so every occurrence of every
+keyword (including multi-word ones like "climate change") is found with word
+boundaries for free: "farm" no longer matches inside "farmonaut", nor "mill"
+inside "million". Cost grows with the text, not with the number of keywords.
+"""
+
+import re
+from collections import deque
+
+# Word tokens; keywords and text are split the same way
+_WORD_RE = re.compile(r'\w+')
+
+class KeywordMatcher:
+    """Word-level Aho-Corasick automaton over the keywords of several groups."""
+
+    def __init__(self, groups):
+        self.groups = list(groups)
+        self.keywords = []       # keyword strings, in table order
+        self.keyword_group = []   # keyword index -> group index
+        self._goto = [{}]        # state -> {word: next state}
+        self._fail = [0]
+        self._out = [()]         # state -> keyword indexes ending here
+        for gi, group in enumerate(self.groups):
+            for kw in groups[group]:
+                words = _WORD_RE.findall(kw.lower())
+                if not words:
+                    continue
+                state = 0
+                for w in words:
+                    nxt = self._goto[state].get(w)
+                    if nxt is None:
+                        nxt = len(self._goto)
+                        self._goto[state][w] = nxt
+                        self._goto.append({})
+                        self._fail.append(0)
+                        self._out.append(())
+                    state = nxt
+                self._out[state] += (len(self.keywords),)
+                self.keywords.append(kw)
+                self.keyword_group.append(gi)
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        # BFS from the root: a state's failure link is the longest proper word
+        # suffix that is also a trie path; outputs are inherited along it
+        queue = deque(self._goto[0].values())
+        while queue:
+            s = queue.popleft()
+            for w, t in self._goto[s].items():
+                queue.append(t)
+                f = self._fail[s]
+                while f and w not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[t] = self._goto[f].get(w, 0)
+                self._out[t] += self._out[self._fail[t]]
+
+    def keyword_counts(self, text):
+        """Occurrences of each keyword in `text` (list aligned with self.keywords)."""
+        counts = [0] * len(self.keywords)
+        goto, fail, out = self._goto, self._fail, self._out
+        root = goto[0]
+        state = 0
+        for w in _WORD_RE.findall(text.lower()):
+            if not state and w not in root:
+                continue  # Most words start no keyword: one dict probe
+            while state and w not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(w, 0)
+            for ki in out[state]:
+                counts[ki] += 1
+        return counts
+
+    def scores(self, text):
+        """{group: total keyword occurrences} for `text`."""
+        totals = [0] * len(self.groups)
+        for ki, n in enumerate(self.keyword_counts(text)):
+            totals[self.keyword_group[ki]] += n
+        return dict(zip(self.groups, totals))
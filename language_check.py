@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+language_check.py
+
+Language verdicts for quality_assurance, cheap and reproducible.
+
+LanguageDetector.detect() answers in this order:
+ 1. the page's declared language (<html lang> or the Content-Language header),
+ 2. langdetect on a bounded, evenly spaced sample of the text (a few spans
+    from start to end rather than the whole document or only its header),
+    with DetectorFactory seeded so the same text always gets the same answer.
+
+Every page is judged on its own text: the verdict does not depend on which
+pages were crawled before it, or on which --cpu-workers process checked it
+(a per-site cache would reject an English page on a bilingual site because
+the pages before it happened to be Indonesian).
+
+Undetectable text (no letters, only numbers/URLs) returns None; callers treat
+that as "unknown" and let the page through, as before.
+"""
+
+import threading
+
+from langdetect import DetectorFactory, detect
+from langdetect.detector_factory import init_factory
+from langdetect.lang_detect_exception import LangDetectException
+
+# ----------------- Config -----------------
+LANG_SEED = 0                 # langdetect is randomized; a fixed seed makes it deterministic
+LANG_SAMPLE_CHARS = 2000      # characters handed to langdetect per page
+LANG_SAMPLE_SPANS = 6         # evenly spaced spans the sample is built from
+# ------------------------------------------
+
+DetectorFactory.seed = LANG_SEED
+
+def primary_language(tag):
+    """'en-US' / 'EN_gb' -> 'en'; None for empty, multi-valued ('en, fr') or wildcard tags."""
+    if not tag:
+        return None
+    tag = str(tag).strip()
+    if not tag or ',' in tag or tag == '*':
+        return None
+    return tag.replace('_', '-').split('-')[0].lower() or None
+
+def sample_text(text, max_chars=LANG_SAMPLE_CHARS, spans=LANG_SAMPLE_SPANS):
+    """At most ~max_chars of `text`: `spans` slices spread evenly from start to end, cut at spaces."""
+    if len(text) <= max_chars:
+        return text
+    span = max_chars // spans
+    step = len(text) // spans
+    parts = []
+    for i in range(spans):
+        start = i * step
+        if start:
+            space = text.find(' ', start, start + 50)
+            start = space + 1 if space != -1 else start
+        end = start + span
+        space = text.rfind(' ', start, end)
+        parts.append(text[start:space if space > start else end])
+    return ' '.join(parts)
+
+class LanguageDetector:
+    """Thread-safe; one per process."""
+
+    def __init__(self):
+        init_factory()  # load the language profiles once, up front
+        self._lock = threading.Lock()
+        self.stats = {'declared': 0, 'detected': 0, 'unknown': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def detect(self, url, text, declared=None):
+        """ISO 639-1 code of `text` (fetched from `url`), or None if unknown."""
+        lang = primary_language(declared)
+        if lang:
+            self._count('declared')
+            return lang
+        try:
+            lang = detect(sample_text(text))
+        except LangDetectException:
+            self._count('unknown')
+            return None
+        self._count('detected')
+        return lang
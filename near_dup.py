@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+near_dup.py
+
+Near-duplicate detection for quality_assurance.
+
+Each stored article gets a 64-bit SimHash over its word 3-shingles. Two texts
+whose SimHashes differ in at most d bits are treated as near-duplicates, with
+d = floor((1 - similarity) * 64); at the default 0.95 that is 3 bits.
+
+Lookup is banded: the 64 bits are cut into d + 1 bands, and by pigeonhole any
+fingerprint within d bits of a stored one matches it exactly in at least one
+band. Band keys live in an indexed table, so a lookup is d + 1 index probes
+plus a Hamming check of the few candidates; no scan of the stored articles.
+
+Both tables (article_simhash, simhash_bands) sit next to `articles` in the
+main DB and can be rebuilt from the stored rows at any time. Content is
+read through content_text() (registered by CrawlStateStore), so compressed
+rows are fingerprinted on their text.
+"""
+
+import hashlib
+import re
+from collections import Counter
+
+# ----------------- Config -----------------
+NEAR_DUP_SIMILARITY = 0.95      # flag pages at least this similar to a stored article
+MIN_SIMILARITY = 0.8            # below this the bands get too narrow to be selective
+SHINGLE_SIZE = 3                # words per shingle
+REBUILD_BATCH = 1000
+# ------------------------------------------
+
+SIMHASH_BITS = 64
+_MASK = (1 << SIMHASH_BITS) - 1
+_WORD_RE = re.compile(r'\w+')
+
+NEAR_DUP_SCHEMA = [
+    # One fingerprint per stored article (unsigned 64-bit value stored as signed INTEGER)
+    '''
+    CREATE TABLE IF NOT EXISTS article_simhash (
+        url TEXT PRIMARY KEY,
+        simhash INTEGER NOT NULL
+    )
+    ''',
+    # Band keys for the lookup: (band, bkey) -> url
+    '''
+    CREATE TABLE IF NOT EXISTS simhash_bands (
+        url TEXT,
+        band INTEGER,
+        bkey INTEGER,
+        PRIMARY KEY (url, band)
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_simhash_bands_key ON simhash_bands (band, bkey)",
+]
+
+def _word_hash(word, cache):
+    h = cache.get(word)
+    if h is None:
+        h = cache[word] = int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+    return h
+
+def _mix(h):
+    # 64-bit finalizer (splitmix64) so combined word hashes spread over all bits
+    h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & _MASK
+    return h ^ (h >> 31)
+
+def simhash(text, shingle=SHINGLE_SIZE):
+    """64-bit SimHash of `text` over word shingles (unsigned int; 0 for empty text)."""
+    cache = {}
+    words = [_word_hash(w, cache) for w in _WORD_RE.findall(text.lower())]
+    if len(words) < shingle:
+        shingles = Counter([_mix(sum(words) & _MASK)]) if words else Counter()
+    else:
+        shingles = Counter()
+        for i in range(len(words) - shingle + 1):
+            h = 0
+            for w in words[i:i + shingle]:
+                h = ((h * 0x9E3779B97F4A7C15) ^ w) & _MASK
+            shingles[_mix(h)] += 1
+    if not shingles:
+        return 0
+    # Tally weights per byte value, then per bit: 8 updates per shingle instead of 64
+    tallies = [[0] * 256 for _ in range(8)]
+    for h, weight in shingles.items():
+        for j, byte in enumerate(h.to_bytes(8, 'little')):
+            tallies[j][byte] += weight
+    total = sum(shingles.values())
+    fp = 0
+    for j in range(8):
+        tally = tallies[j]
+        for bit in range(8):
+            on = sum(tally[v] for v in range(256) if v >> bit & 1)
+            if on * 2 > total:
+                fp |= 1 << (8 * j + bit)
+    return fp
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+def max_distance(similarity):
+    """Largest Hamming distance still counted as `similarity` (0..1) alike."""
+    return int((1.0 - similarity) * SIMHASH_BITS + 1e-9)
+
+def band_keys(fp, bands):
+    """[(band, key)]: `fp` cut into `bands` contiguous bit ranges."""
+    keys = []
+    start = 0
+    for band in range(bands):
+        width = SIMHASH_BITS // bands + (1 if band < SIMHASH_BITS % bands else 0)
+        keys.append((band, (fp >> start) & ((1 << width) - 1)))
+        start += width
+    return keys
+
+def _to_signed(fp):
+    return fp - (1 << SIMHASH_BITS) if fp >= 1 << (SIMHASH_BITS - 1) else fp
+
+def _to_unsigned(value):
+    return value & _MASK
+
+class NearDupIndex:
+    """
+    Banded SimHash index on an existing connection (the caller's lock guards
+    it). add() runs inside the caller's transaction so a stored article and
+    its fingerprint commit together.
+    """
+
+    def __init__(self, conn, lock, similarity=NEAR_DUP_SIMILARITY):
+        if not MIN_SIMILARITY <= similarity <= 1.0:
+            raise ValueError(f"near-duplicate similarity must be between {MIN_SIMILARITY} and 1.0")
+        self.conn = conn
+        self._lock = lock
+        self.similarity = similarity
+        self.max_distance = max_distance(similarity)
+        self.bands = self.max_distance + 1
+        with self._lock, self.conn:
+            for stmt in NEAR_DUP_SCHEMA:
+                self.conn.execute(stmt)
+            stored = self.conn.execute("SELECT MAX(band) + 1 FROM simhash_bands").fetchone()[0]
+            if stored and stored != self.bands:
+                # Similarity threshold changed: re-band the stored fingerprints
+                self._reband()
+        self.catch_up()
+
+    def _reband(self):
+        self.conn.execute("DELETE FROM simhash_bands")
+        rows = self.conn.execute("SELECT url, simhash FROM article_simhash").fetchall()
+        self.conn.executemany("INSERT INTO simhash_bands (url, band, bkey) VALUES (?, ?, ?)",
+                              ((url, band, key) for url, value in rows
+                               for band, key in band_keys(_to_unsigned(value), self.bands)))
+        print(f"[near-dup] re-banded {len(rows)} fingerprint(s) for {self.bands} bands")
+
+    def add(self, url, fp):
+        """Record `url`'s fingerprint (replacing any previous one); caller holds the lock."""
+        self.conn.execute("DELETE FROM simhash_bands WHERE url = ?", (url,))
+        self.conn.execute("INSERT OR REPLACE INTO article_simhash (url, simhash) VALUES (?, ?)", (url, _to_signed(fp)))
+        self.conn.executemany("INSERT INTO simhash_bands (url, band, bkey) VALUES (?, ?, ?)",
+                              [(url, band, key) for band, key in band_keys(fp, self.bands)])
+
+    def find(self, fp, exclude_url=None):
+        """URL of a stored article within max_distance bits of `fp`, or None."""
+        if fp == 0:
+            return None
+        with self._lock:
+            seen = set()
+            for band, key in band_keys(fp, self.bands):
+                for url, value in self.conn.execute('''
+                    SELECT b.url, s.simhash FROM simhash_bands b JOIN article_simhash s ON s.url = b.url
+                    WHERE b.band = ? AND b.bkey = ?
+                ''', (band, key)):
+                    if url == exclude_url or url in seen:
+                        continue
+                    seen.add(url)
+                    if hamming(fp, _to_unsigned(value)) <= self.max_distance:
+                        return url
+        return None
+
+    def catch_up(self, rebuild=False):
+        """
+        Fingerprint stored articles that have none yet (all of them with
+        rebuild=True). Returns the number of articles fingerprinted.
+        """
+        with self._lock:
+            if rebuild:
+                with self.conn:
+                    self.conn.execute("DELETE FROM simhash_bands")
+                    self.conn.execute("DELETE FROM article_simhash")
+            missing = [row[0] for row in self.conn.execute(
+                "SELECT rowid FROM articles WHERE url NOT IN (SELECT url FROM article_simhash)")]
+            if not missing:
+                return 0
+            print(f"[near-dup] fingerprinting {len(missing)} stored article(s)...")
+            for i in range(0, len(missing), REBUILD_BATCH):
+                batch = missing[i:i + REBUILD_BATCH]
+                marks = ",".join("?" * len(batch))
+                rows = self.conn.execute(f"SELECT url, content_text(content, codec) FROM articles WHERE rowid IN ({marks})",
+                                         batch).fetchall()
+                with self.conn:
+                    for url, content in rows:
+                        self.add(url, simhash(content or ''))
+            print(f"[near-dup] index ready: {len(missing)} article(s) added")
+            return len(missing)
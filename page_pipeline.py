@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+page_pipeline.py
+
+Single-fetch, single-parse page stage shared by the scraper entry points.
+
+fetch_page() downloads a URL once, parses it once and returns the title, the
+visible text and the normalized outlinks together, so the crawl loop no longer
+re-downloads stored pages just to collect their <a href> links.
+
+HTML goes through StreamingHtmlExtractor: the raw bytes are fed to an lxml
+parser target chunk by chunk as they arrive (no str decode, no tree), and the
+title, text and hrefs are collected in that one pass with script/style/nav
+text skipped and the text already normalized the way preprocess_data() would.
+parse_html() is the older BeautifulSoup path, kept as the fallback and as
+the baseline for bench_extract.py.
+"""
+
+import codecs
+import re
+import threading
+import time
+from urllib.parse import urljoin
+
+import requests
+from bs4 import BeautifulSoup
+from lxml import etree
+
+from url_canon import canonicalize
+
+# ----------------- Config -----------------
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+REQUEST_TIMEOUT = 10
+# Anchor text kept per outlink (used to prioritize the frontier)
+ANCHOR_TEXT_MAX = 200
+# Subtrees whose text is not page content (their links are still collected)
+SKIP_TEXT_TAGS = frozenset(('script', 'style', 'nav', 'noscript', 'template'))
+STREAM_CHUNK = 64 * 1024
+# ------------------------------------------
+
+# One requests.Session per thread: keep-alive connection reuse per host without
+# sharing a Session across the concurrent engine's workers.
+_local = threading.local()
+
+def _session():
+    sess = getattr(_local, 'session', None)
+    if sess is None:
+        sess = requests.Session()
+        sess.headers.update(HEADERS)
+        _local.session = sess
+    return sess
+
+def pop_last_response():
+    """(status, Retry-After) of the last fetch_page() on this thread, then reset; (None, None) if none."""
+    last = getattr(_local, 'last', (None, None))
+    _local.last = (None, None)
+    return last
+
+def normalize_link(base_url, href):
+    """Resolve href against base_url and canonicalize it (url_canon); None for non-http(s) links."""
+    if not href:
+        return None
+    link = canonicalize(urljoin(base_url, href.strip()))
+    return link if link.startswith(('http://', 'https://')) else None
+
+def parse_html(html, base_url):
+    """
+    Parse one HTML document into {'title', 'raw_text', 'links', 'anchors', 'lang'}.
+    `links` is deduplicated in page order; `anchors` maps each link to its anchor text;
+    `lang` is the <html lang> attribute (None if absent).
+    """
+    soup = BeautifulSoup(html, 'lxml')
+    title = soup.title.string.strip() if soup.title and soup.title.string else ''
+    lang = (soup.html.get('lang') or soup.html.get('xml:lang')) if soup.html else None
+    anchors = {}
+    for a in soup.find_all('a', href=True):
+        link = normalize_link(base_url, a.get('href'))
+        if link:
+            text = a.get_text(' ', strip=True)
+            prev = anchors.get(link)
+            anchors[link] = (f"{prev} {text}" if prev else text)[:ANCHOR_TEXT_MAX]
+    # Extract raw text (body, ignore scripts/styles)
+    for script in soup(["script", "style"]):
+        script.decompose()
+    return {'title': title, 'raw_text': soup.get_text(), 'links': list(anchors), 'anchors': anchors, 'lang': lang}
+
+def _read_capped(response, max_bytes):
+    """Body of a streamed response, or None (connection closed) once it exceeds max_bytes."""
+    length = response.headers.get('Content-Length')
+    if length and length.isdigit() and int(length) > max_bytes:
+        response.close()
+        return None
+    chunks = []
+    size = 0
+    for chunk in response.iter_content(64 * 1024):
+        size += len(chunk)
+        if size > max_bytes:
+            response.close()
+            return None
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+def _fetch_pdf(url, response, cache, pdf):
+    empty = {'title': '', 'raw_text': '', 'links': [], 'anchors': {}}
+    if pdf is None:
+        response.close()
+        return empty
+    body = _read_capped(response, pdf.max_bytes)
+    if body is None:
+        print(f"Skipping PDF over {pdf.max_bytes / (1024 * 1024):.1f} MB: {url}")
+        return empty
+    if cache is not None:
+        cache.put(url, response, body)
+    empty['bytes'] = len(body)
+    extracted = pdf.extract(body, url)
+    if not extracted:
+        return empty
+    return {'title': extracted['title'], 'raw_text': extracted['raw_text'], 'links': [], 'anchors': {},
+            'lang': response.headers.get('Content-Language'), 'bytes': len(body)}
+
+# Same cleanup as preprocess_data(): keep word characters, whitespace and . , ! ?
+_CLEAN_RE = re.compile(r'[^\w\s\.\,\!\?]')
+_META_CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+
+def _known_encoding(name):
+    # A declared charset Python cannot decode text with (typo, 'none', rot13, ...) is treated as undeclared
+    try:
+        info = codecs.lookup(name)
+    except LookupError:
+        return None
+    return name if getattr(info, '_is_text_encoding', True) else None
+
+def sniff_encoding(content_type, head):
+    """
+    Charset from the Content-Type header, else from a <meta> in the first
+    bytes, else utf-8. Unknown charset names are skipped.
+    """
+    for param in content_type.split(';')[1:]:
+        key, _, value = param.partition('=')
+        if key.strip().lower() == 'charset' and value.strip():
+            name = _known_encoding(value.strip().strip('"\''))
+            if name:
+                return name
+    m = _META_CHARSET_RE.search(head[:2048])
+    name = _known_encoding(m.group(1).decode('ascii', 'ignore')) if m else None
+    return name or 'utf-8'
+
+class _ExtractTarget:
+    # lxml parser target: receives SAX-style events, never builds a tree
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.skip = 0          # depth inside SKIP_TEXT_TAGS
+        self.in_title = False
+        self.title = []
+        self.words = []
+        self.anchors = {}
+        self.link = None
+        self.link_text = []
+        self.lang = None
+        self._buf = []         # text node pieces since the last tag (entities split them)
+
+    def _flush(self):
+        if not self._buf:
+            return
+        text = ''.join(self._buf)
+        self._buf = []
+        if self.in_title:
+            self.title.append(text)
+        if self.link is not None:
+            self.link_text.append(text)
+        if not self.skip:
+            self.words.extend(_CLEAN_RE.sub('', text).lower().split())
+
+    def start(self, tag, attrib):
+        self._flush()
+        if tag in SKIP_TEXT_TAGS:
+            self.skip += 1
+        elif tag == 'a':
+            self._end_link()
+            self.link = normalize_link(self.base_url, attrib.get('href'))
+            self.link_text = []
+        elif tag == 'title':
+            self.in_title = True
+        elif tag == 'html':
+            self.lang = attrib.get('lang') or attrib.get('{http://www.w3.org/XML/1998/namespace}lang')
+
+    def end(self, tag):
+        self._flush()
+        if tag in SKIP_TEXT_TAGS:
+            self.skip = max(0, self.skip - 1)
+        elif tag == 'a':
+            self._end_link()
+        elif tag == 'title':
+            self.in_title = False
+
+    def _end_link(self):
+        if self.link is None:
+            return
+        text = ' '.join(' '.join(self.link_text).split())
+        prev = self.anchors.get(self.link)
+        self.anchors[self.link] = (f"{prev} {text}" if prev else text)[:ANCHOR_TEXT_MAX]
+        self.link = None
+
+    def data(self, text):
+        if self.skip and self.link is None and not self.in_title:
+            return
+        self._buf.append(text)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        self._flush()
+        self._end_link()
+        return {'title': ' '.join(''.join(self.title).split()), 'raw_text': ' '.join(self.words),
+                'links': list(self.anchors), 'anchors': self.anchors, 'lang': self.lang, 'normalized': True}
+
+class StreamingHtmlExtractor:
+    """
+    feed() raw HTML bytes as they arrive, close() for {'title', 'raw_text',
+    'links', 'anchors', 'lang', 'normalized'}. raw_text is already cleaned and
+    lowercased ('normalized': True) so preprocess_data() passes it through.
+    """
+
+    def __init__(self, base_url, encoding=None):
+        self._target = _ExtractTarget(base_url)
+        self._parser = etree.HTMLParser(target=self._target, encoding=encoding,
+                                        remove_comments=True, no_network=True)
+
+    def feed(self, chunk):
+        self._parser.feed(chunk)
+
+    def close(self):
+        return self._parser.close()
+
+def parse_html_fast(body, base_url, content_type=''):
+    """One-shot StreamingHtmlExtractor over a complete body (bytes)."""
+    extractor = StreamingHtmlExtractor(base_url, sniff_encoding(content_type, body))
+    extractor.feed(body)
+    return extractor.close()
+
+def _soup_fallback(body, base_url, content_type):
+    # Unparseable for the fast path (or a charset lxml does not know): decode and take the BeautifulSoup route
+    encoding = sniff_encoding(content_type, body)
+    return parse_html(body.decode(encoding, errors='replace'), base_url)
+
+def parse_fetched(raw):
+    """
+    Parse a page returned by fetch_page(parse=False) into the same dict
+    fetch_page() returns. Pages that are already parsed (PDFs) pass through.
+    """
+    if 'body' not in raw:
+        return raw
+    try:
+        page = parse_html_fast(raw['body'], raw['base_url'], raw['content_type'])
+    except (etree.LxmlError, LookupError):
+        page = _soup_fallback(raw['body'], raw['base_url'], raw['content_type'])
+    page['lang'] = page['lang'] or raw.get('lang')
+    return page
+
+def _stream_html(url, response):
+    # Feed the parser while the body downloads; returns (page, body)
+    chunks = []
+    extractor = None
+    content_type = response.headers.get('Content-Type', '')
+    # Links resolve against the final URL so redirects don't break relative hrefs
+    base_url = response.url or url
+    failed = False
+    for chunk in response.iter_content(STREAM_CHUNK):
+        if not chunk:
+            continue
+        chunks.append(chunk)
+        if failed:
+            continue
+        try:
+            if extractor is None:
+                extractor = StreamingHtmlExtractor(base_url, sniff_encoding(content_type, chunk))
+            extractor.feed(chunk)
+        except (etree.LxmlError, LookupError):
+            failed = True  # keep downloading, then parse the whole body the slow way
+    body = b''.join(chunks)
+    if extractor is None and not failed:
+        return {'title': '', 'raw_text': '', 'links': [], 'anchors': {}, 'lang': None}, body
+    try:
+        if not failed:
+            return extractor.close(), body
+    except (etree.LxmlError, LookupError):
+        pass
+    return _soup_fallback(body, base_url, content_type), body
+
+def fetch_page(url, delay=0, cache=None, pdf=None, parse=True):
+    """
+    Download `url` once and parse it once.
+
+    Returns {'title', 'raw_text', 'links', 'anchors', 'lang', 'bytes'} or None
+    on fetch errors ('bytes' is the downloaded body size, for the metrics).
+    PDFs (by .pdf suffix or Content-Type) are downloaded up to pdf.max_bytes
+    and handed to `pdf`, a pdf_extract.PdfExtractor; they never have links.
+    Without an extractor, or if extraction fails, PDFs come back with empty text.
+
+    With a response_cache.ResponseCache the request is conditional
+    (If-None-Match / If-Modified-Since); an unchanged page comes back as
+    {'not_modified': True, ...} without being parsed.
+
+    With parse=False HTML is only downloaded: the result is {'body',
+    'content_type', 'base_url', 'lang', 'bytes'} for parse_fetched() to finish later
+    (in another process, for the staged pipeline).
+    """
+    try:
+        if delay:
+            time.sleep(delay)  # Polite delay (the concurrent engine throttles per host instead)
+        _local.last = (None, None)
+        conditional = cache.validators(url) if cache is not None else {}
+        response = _session().get(url, timeout=REQUEST_TIMEOUT, headers=conditional, stream=True)
+        # Status/Retry-After feed the per-host rate limiter's adaptive backoff
+        _local.last = (response.status_code, response.headers.get('Retry-After'))
+        if response.status_code == 304 and conditional:
+            cache.touch(url)
+            return {'title': '', 'raw_text': '', 'links': [], 'anchors': {}, 'not_modified': True}
+        response.raise_for_status()
+        content_type = response.headers.get('Content-Type', '').lower()
+        if url.lower().endswith('.pdf') or 'application/pdf' in content_type:
+            return _fetch_pdf(url, response, cache, pdf)
+        if not parse:
+            body = response.content
+            if cache is not None:
+                cache.put(url, response, body)
+            return {'body': body, 'content_type': response.headers.get('Content-Type', ''),
+                    'base_url': response.url or url, 'lang': response.headers.get('Content-Language'),
+                    'bytes': len(body)}
+        page, body = _stream_html(url, response)
+        if cache is not None:
+            cache.put(url, response, body)
+        # Declared language: <html lang>, else the Content-Language header
+        page['lang'] = page['lang'] or response.headers.get('Content-Language')
+        page['bytes'] = len(body)
+        return page
+    except Exception as e:
+        print(f"Fetch error for {url}: {e}")
+        return None
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+pdf_extract.py
+
+PDF text extraction off the crawl threads.
+
+PdfExtractor runs pdfplumber in worker processes so CPU-heavy PDF parsing
+never stalls the crawl loop. Each document is read page by page: pages are
+parsed lazily from the page tree, only up to the page limit (pdfplumber's
+pdf.pages would build all 5,000 pages of a huge report first), each page's
+caches are released once its text is out, and extraction stops at the
+character limit.
+
+Every worker is its own single-process pool, and a caller takes an idle one
+before submitting, so the wall-clock timeout only counts time spent on the
+document, never time queued behind others. A worker that overruns (or dies
+on the memory cap) is killed and replaced on its own; documents running on
+the other workers are not affected. On POSIX each worker also gets an
+address-space cap.
+"""
+
+import io
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+
+# ----------------- Config -----------------
+PDF_WORKERS = 2
+PDF_MAX_PAGES = 60
+PDF_MAX_BYTES = 25 * 1024 * 1024        # download cap per document
+PDF_MAX_CHARS = 2_000_000               # stop extracting after this much text
+PDF_TIMEOUT = 60.0                      # seconds per document
+PDF_WORKER_MAX_MEMORY = 1536 * 1024 * 1024   # RLIMIT_AS per worker (POSIX only)
+# ------------------------------------------
+
+def _worker_init(max_memory):
+    # Best-effort memory cap; the resource module only exists on POSIX
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+    except Exception:
+        pass
+
+def extract_pdf_text(data, max_pages=PDF_MAX_PAGES, max_chars=PDF_MAX_CHARS):
+    """
+    Runs in a pool worker. Returns {'title', 'raw_text', 'pages'} for the
+    first `max_pages` pages of the PDF in `data` (bytes).
+    """
+    # Optional dependencies, only needed in the workers
+    import pdfplumber
+    from pdfplumber.page import Page
+    from pdfminer.pdfpage import PDFPage
+
+    parts = []
+    chars = 0
+    pages_read = 0
+    # No `with pdfplumber.open()`: PDF.close() walks pdf.pages, which builds every page of the document
+    with io.BytesIO(data) as stream:
+        pdf = pdfplumber.open(stream)
+        title = (pdf.metadata or {}).get('Title') or ''
+        if isinstance(title, bytes):
+            title = title.decode('utf-8', errors='ignore')
+        # Walk the page tree lazily (pdf.pages would also build them all up front)
+        for number, page_obj in enumerate(islice(PDFPage.create_pages(pdf.doc), max_pages), 1):
+            page = Page(pdf, page_obj, page_number=number)
+            try:
+                text = page.extract_text() or ''
+            finally:
+                page.close()  # release this page's parsed objects before moving on
+            parts.append(text)
+            chars += len(text)
+            pages_read += 1
+            if chars >= max_chars:
+                break
+        pdf.flush_cache()
+    return {'title': str(title).strip(), 'raw_text': '\n'.join(parts)[:max_chars], 'pages': pages_read}
+
+class PdfExtractor:
+    """PDF extraction in worker processes with a per-document timeout; safe to call from many threads."""
+
+    def __init__(self, workers=PDF_WORKERS, max_pages=PDF_MAX_PAGES, max_bytes=PDF_MAX_BYTES,
+                 timeout=PDF_TIMEOUT, max_chars=PDF_MAX_CHARS):
+        self.workers = workers
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.max_chars = max_chars
+        self._lock = threading.Lock()
+        self._closed = False
+        # Idle workers (single-process pools); a caller holds one while its document runs
+        self._idle = queue.Queue()
+        for _ in range(max(1, workers)):
+            self._idle.put(self._new_worker())
+
+    def _new_worker(self):
+        return ProcessPoolExecutor(max_workers=1, initializer=_worker_init, initargs=(PDF_WORKER_MAX_MEMORY,))
+
+    def _replace(self, worker):
+        # Kill one stuck/dead worker and start a fresh one in its place
+        for proc in list(getattr(worker, '_processes', {}).values()):
+            proc.terminate()
+        worker.shutdown(wait=False, cancel_futures=True)
+        return self._new_worker()
+
+    def extract(self, data, url=''):
+        """{'title', 'raw_text', 'pages'} for PDF bytes, or None on error/timeout."""
+        worker = self._idle.get()
+        fut = None
+        try:
+            fut = worker.submit(extract_pdf_text, data, self.max_pages, self.max_chars)
+            return fut.result(timeout=self.timeout)
+        except FutureTimeout:
+            if fut.cancel():
+                # Never started (the worker process was still spawning): nothing to kill
+                print(f"PDF timeout ({self.timeout}s) for {url} before a worker picked it up")
+            else:
+                print(f"PDF timeout ({self.timeout}s) for {url}; restarting its PDF worker")
+                worker = self._replace(worker)
+        except BrokenProcessPool:
+            print(f"PDF worker died for {url} (memory cap?); restarting it")
+            worker = self._replace(worker)
+        except Exception as e:
+            print(f"PDF extract error for {url}: {e}")
+        finally:
+            with self._lock:
+                if self._closed:
+                    worker.shutdown(wait=False, cancel_futures=True)
+                else:
+                    self._idle.put(worker)
+        return None
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    self._idle.get_nowait().shutdown(wait=False, cancel_futures=True)
+                except queue.Empty:
+                    break
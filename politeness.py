@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+politeness.py
+
+Per-host politeness for the crawl engine.
+
+ - HostRateLimiter: a token bucket per host. At most one request per host is
+   in flight; tokens refill at 1 / interval, where interval is the larger of
+   the configured host delay and the site's robots.txt Crawl-delay. A 429 or
+   503 doubles the host's interval (and honours Retry-After); successes decay
+   it back. Only the offending host slows down; other hosts keep going.
+ - RobotsCache: fetches and parses robots.txt once per host and answers
+   Disallow / Crawl-delay questions from the cache.
+"""
+
+import threading
+import time
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+import requests
+
+# ----------------- Config -----------------
+# Agent name matched against robots.txt groups (falls back to the '*' group)
+ROBOTS_AGENT = 'OilPalmCrawler'
+ROBOTS_TIMEOUT = 10
+# Upper bound on a site's Crawl-delay (seconds) so one host can't park its URLs for hours
+ROBOTS_MAX_CRAWL_DELAY = 60.0
+
+# Token bucket: requests a host may burst after being idle
+BUCKET_CAPACITY = 1.0
+# Adaptive backoff on 429/503: interval multiplier bounds and decay per success
+BACKOFF_STATUSES = (429, 503)
+MAX_BACKOFF = 32.0
+BACKOFF_DECAY = 0.5
+# ------------------------------------------
+
+def _retry_after_seconds(value):
+    # Retry-After is either delta-seconds or an HTTP date; only the former is handled
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+class _HostBucket:
+    __slots__ = ('tokens', 'updated', 'min_interval', 'backoff', 'busy', 'blocked_until')
+
+    def __init__(self, now, min_interval):
+        self.tokens = BUCKET_CAPACITY
+        self.updated = now
+        self.min_interval = min_interval
+        self.backoff = 1.0
+        self.busy = False
+        self.blocked_until = 0.0
+
+class HostRateLimiter:
+    """
+    Token-bucket limiter keyed by host. Not thread-safe: the crawl engine calls
+    it from its dispatcher thread only.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self._hosts = {}
+
+    def _bucket(self, host, now):
+        b = self._hosts.get(host)
+        if b is None:
+            b = self._hosts[host] = _HostBucket(now, self.delay)
+        return b
+
+    def interval(self, host):
+        b = self._hosts.get(host)
+        if b is None:
+            return self.delay
+        return max(self.delay, b.min_interval) * b.backoff
+
+    def _refill(self, b, host, now):
+        interval = self.interval(host)
+        if interval <= 0:
+            b.tokens = BUCKET_CAPACITY
+        else:
+            b.tokens = min(BUCKET_CAPACITY, b.tokens + (now - b.updated) / interval)
+        b.updated = now
+
+    def wait_time(self, host, now=None):
+        """Seconds until `host` may be contacted again (inf while a request is in flight)."""
+        now = time.monotonic() if now is None else now
+        b = self._bucket(host, now)
+        if b.busy:
+            return float('inf')
+        self._refill(b, host, now)
+        wait = 0.0 if b.tokens >= 1.0 else (1.0 - b.tokens) * self.interval(host)
+        return max(wait, b.blocked_until - now)
+
+    def acquire(self, host):
+        now = time.monotonic()
+        b = self._bucket(host, now)
+        self._refill(b, host, now)
+        b.tokens -= 1.0
+        b.busy = True
+
+    def release(self, host, status=None, retry_after=None, crawl_delay=None):
+        """
+        Request to `host` finished. `status` is the HTTP status (None if no
+        response), `retry_after` the Retry-After header, `crawl_delay` the
+        host's robots.txt Crawl-delay if known.
+        """
+        now = time.monotonic()
+        b = self._bucket(host, now)
+        b.busy = False
+        if crawl_delay:
+            b.min_interval = min(float(crawl_delay), ROBOTS_MAX_CRAWL_DELAY)
+        if status in BACKOFF_STATUSES:
+            b.backoff = min(b.backoff * 2.0, MAX_BACKOFF)
+            b.tokens = min(b.tokens, 0.0)
+            pause = _retry_after_seconds(retry_after)
+            if pause:
+                b.blocked_until = now + pause
+            print(f"[politeness] {host} answered {status}; interval now {self.interval(host):.1f}s")
+        elif status is not None and status < 400:
+            b.backoff = max(1.0, b.backoff * BACKOFF_DECAY)
+        b.updated = now
+
+class RobotsCache:
+    """robots.txt per host, fetched once and kept for the run (thread-safe)."""
+
+    def __init__(self, agent=ROBOTS_AGENT, headers=None, timeout=ROBOTS_TIMEOUT):
+        self.agent = agent
+        self.headers = headers or {}
+        self.timeout = timeout
+        self._parsers = {}
+        self._lock = threading.Lock()
+
+    def _parser(self, url):
+        parsed = urlparse(url)
+        host = parsed.netloc.lower()
+        with self._lock:
+            if host in self._parsers:
+                return self._parsers[host]
+        rp = RobotFileParser()
+        try:
+            resp = requests.get(f"{parsed.scheme}://{host}/robots.txt", headers=self.headers, timeout=self.timeout)
+            if resp.status_code in (401, 403):
+                rp.disallow_all = True
+            elif resp.status_code >= 400:
+                rp.allow_all = True
+            else:
+                rp.parse(resp.text.splitlines())
+        except Exception as e:
+            # Unreachable robots.txt: allow, like a missing one
+            print(f"robots.txt error for {host}: {e}")
+            rp.allow_all = True
+        with self._lock:
+            self._parsers[host] = rp
+        return rp
+
+    def allowed(self, url):
+        return self._parser(url).can_fetch(self.agent, url)
+
+    def crawl_delay(self, url):
+        """Crawl-delay (or Request-rate) for the URL's host, or None if unknown/unset."""
+        with self._lock:
+            rp = self._parsers.get(urlparse(url).netloc.lower())
+        if rp is None:
+            return None
+        delay = rp.crawl_delay(self.agent)
+        if delay is None:
+            rate = rp.request_rate(self.agent)
+            if rate and rate.requests:
+                delay = rate.seconds / rate.requests
+        return float(delay) if delay is not None else None
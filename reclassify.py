@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+reclassify.py
+
+Offline bulk reclassification of stored articles after CATEGORIES changes.
+
+Streams the articles table in rowid-ordered chunks, turns each chunk into a
+keyword term-count matrix (KeywordMatcher.keyword_counts per row) and scores
+every category for the whole chunk with one matrix product against the
+keyword -> category membership matrix. Only rows whose category actually
+changed are written back, one transaction per chunk. With workers > 1 the
+chunks are scored in a process pool while the parent writes.
+
+Picks the same category as classify_text(): highest score, ties go to the
+alphabetically last category, zero scores are 'Uncategorized'. Stored content
+is already preprocessed, so scores match what the crawler computed.
+
+NumPy is optional; without it rows are scored one at a time (same results).
+"""
+
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from keyword_matcher import KeywordMatcher
+from content_codec import ensure_schema, register_functions
+
+try:
+    import numpy as np
+except ImportError:  # Optional: pure-Python scoring fallback
+    np = None
+
+# ----------------- Config -----------------
+RECLASSIFY_CHUNK = 2000
+UNCATEGORIZED = 'Uncategorized'
+# ------------------------------------------
+
+# Per-process scorer state (set by _init_scorer in the parent or in each pool worker)
+_MATCHER = None
+_CATEGORY_NAMES = None
+_MEMBERSHIP = None
+
+def _init_scorer(categories):
+    global _MATCHER, _CATEGORY_NAMES, _MEMBERSHIP
+    # Columns in sorted order so "last max" reproduces classify_text's tie-break
+    names = sorted(categories)
+    _MATCHER = KeywordMatcher({name: categories[name] for name in names})
+    _CATEGORY_NAMES = names
+    if np is not None:
+        _MEMBERSHIP = np.zeros((len(_MATCHER.keywords), len(names)), dtype=np.int32)
+        _MEMBERSHIP[np.arange(len(_MATCHER.keywords)), _MATCHER.keyword_group] = 1
+
+def _pick(scores):
+    best = max(scores.values()) if scores else 0
+    if best == 0:
+        return UNCATEGORIZED
+    return max(cat for cat, score in scores.items() if score == best)
+
+def _classify_chunk(rows):
+    """rows: [(rowid, url, content, category)] -> [(rowid, url, old, new)] for changed rows only."""
+    if np is not None and rows:
+        counts = np.array([_MATCHER.keyword_counts(r[2] or '') for r in rows], dtype=np.int32)
+        scores = counts @ _MEMBERSHIP                         # (rows x categories) in one product
+        n = scores.shape[1]
+        best = n - 1 - np.argmax(scores[:, ::-1], axis=1)    # last max = alphabetically last tie
+        top = scores[np.arange(len(rows)), best]
+        labels = [UNCATEGORIZED if t == 0 else _CATEGORY_NAMES[b] for b, t in zip(best.tolist(), top.tolist())]
+    else:
+        labels = [_pick(_MATCHER.scores(r[2] or '')) for r in rows]
+    return [(r[0], r[1], r[3], new) for r, new in zip(rows, labels) if new != r[3]]
+
+def _chunks(conn, chunk_size):
+    # Keyset pagination: no read cursor stays open across the write transactions
+    last = 0
+    while True:
+        rows = conn.execute(
+            "SELECT rowid, url, content_text(content, codec), category FROM articles WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (last, chunk_size)).fetchall()
+        if not rows:
+            return
+        last = rows[-1][0]
+        yield rows
+
+def reclassify_articles(db_path, categories, chunk_size=RECLASSIFY_CHUNK, workers=1, on_changes=None):
+    """
+    Relabel every article in `db_path` with `categories`. `on_changes(conn,
+    changes)` is called after each chunk's commit with [(rowid, url, old, new)]
+    (used to move rows between mirrored category DBs).
+    Returns {'scanned', 'changed', 'seconds'}.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    ensure_schema(conn)
+    register_functions(conn)  # compressed content is decoded in the SELECT
+    start = time.perf_counter()
+    scanned = changed = 0
+
+    def write(rows, changes):
+        nonlocal scanned, changed
+        scanned += len(rows)
+        if changes:
+            with conn:
+                conn.executemany("UPDATE articles SET category = ? WHERE rowid = ?",
+                                 [(new, rowid) for rowid, _url, _old, new in changes])
+            changed += len(changes)
+            if on_changes:
+                on_changes(conn, changes)
+        elapsed = time.perf_counter() - start
+        print(f"[reclassify] {scanned} rows scanned, {changed} changed "
+              f"({scanned / elapsed if elapsed > 0 else 0.0:.0f} rows/sec)")
+
+    try:
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_scorer, initargs=(categories,)) as pool:
+                # Bounded look-ahead: at most 2 chunks per worker in flight
+                in_flight = deque()
+                for rows in _chunks(conn, chunk_size):
+                    in_flight.append((rows, pool.submit(_classify_chunk, rows)))
+                    if len(in_flight) >= workers * 2:
+                        done_rows, fut = in_flight.popleft()
+                        write(done_rows, fut.result())
+                while in_flight:
+                    done_rows, fut = in_flight.popleft()
+                    write(done_rows, fut.result())
+        else:
+            _init_scorer(categories)
+            for rows in _chunks(conn, chunk_size):
+                write(rows, _classify_chunk(rows))
+    finally:
+        conn.close()
+    return {'scanned': scanned, 'changed': changed, 'seconds': time.perf_counter() - start}
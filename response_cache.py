@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+response_cache.py
+
+On-disk HTTP response cache for conditional revalidation.
+
+Stores, per URL, the zlib-compressed body plus the ETag / Last-Modified
+validators in a SQLite file next to the main DB (http_cache.db). On a recrawl
+fetch_page() sends If-None-Match / If-Modified-Since from the cache; a 304
+means the page is unchanged and the crawl skips parse, classify and store.
+
+Responses with neither an ETag nor a Last-Modified header are not stored:
+they can never be revalidated, so they would only take space from entries
+that can.
+
+The cache is bounded: once the stored (compressed) bytes exceed max_bytes the
+least recently used entries are evicted down to EVICT_TO of the limit.
+"""
+
+import sqlite3
+import threading
+import time
+import zlib
+
+# ----------------- Config -----------------
+CACHE_FILENAME = "http_cache.db"
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024   # 1 GB of compressed bodies
+EVICT_TO = 0.9                           # evict down to 90% of max_bytes
+MAX_ENTRY_BYTES = 32 * 1024 * 1024       # don't cache bodies larger than this (raw)
+ZLIB_LEVEL = 6
+# ------------------------------------------
+
+class ResponseCache:
+    """URL -> (validators, compressed body); thread-safe, one persistent connection."""
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL;")
+        self.conn.execute("PRAGMA synchronous = NORMAL;")
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_type TEXT,
+                    body BLOB,
+                    size INTEGER,
+                    fetched REAL,
+                    last_access REAL
+                )
+            ''')
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_access ON responses (last_access)")
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.hits_304 = 0
+
+    def validators(self, url):
+        """Conditional request headers for `url` ({} if nothing cached)."""
+        with self._lock:
+            row = self.conn.execute("SELECT etag, last_modified FROM responses WHERE url = ?", (url,)).fetchone()
+        headers = {}
+        if row:
+            if row[0]:
+                headers['If-None-Match'] = row[0]
+            if row[1]:
+                headers['If-Modified-Since'] = row[1]
+        return headers
+
+    def get_body(self, url):
+        """Decompressed cached body, or None."""
+        with self._lock:
+            row = self.conn.execute("SELECT body FROM responses WHERE url = ?", (url,)).fetchone()
+        return zlib.decompress(row[0]) if row and row[0] is not None else None
+
+    def touch(self, url):
+        """Record a 304 (entry still valid) so LRU eviction keeps it."""
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE url = ?", (time.time(), url))
+            self.hits_304 += 1
+
+    def put(self, url, response, body=None):
+        """
+        Store a 200 response (body + validators); pass `body` if the response
+        was streamed. Without validators nothing is stored, and an older entry
+        for `url` is dropped.
+        """
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not (etag or last_modified):
+            self._forget(url)
+            return
+        if body is None:
+            body = response.content
+        if len(body) > MAX_ENTRY_BYTES:
+            return
+        packed = zlib.compress(body, ZLIB_LEVEL)
+        now = time.time()
+        with self._lock, self.conn:
+            old = self.conn.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            self.conn.execute('''
+                INSERT OR REPLACE INTO responses (url, etag, last_modified, content_type, body, size, fetched, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (url, etag, last_modified, response.headers.get('Content-Type'), packed, len(packed), now, now))
+            self.total_bytes += len(packed) - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _forget(self, url):
+        with self._lock, self.conn:
+            old = self.conn.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            if old:
+                self.conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self.total_bytes -= old[0]
+
+    def _evict(self):
+        # Drop least recently used entries until under EVICT_TO * max_bytes (caller holds the lock)
+        target = self.max_bytes * EVICT_TO
+        cur = self.conn.execute("SELECT url, size FROM responses ORDER BY last_access ASC")
+        doomed = []
+        while self.total_bytes > target:
+            row = cur.fetchone()
+            if row is None:
+                break
+            doomed.append((row[0],))
+            self.total_bytes -= row[1]
+        cur.close()
+        self.conn.executemany("DELETE FROM responses WHERE url = ?", doomed)
+        print(f"[cache] evicted {len(doomed)} entries; {self.total_bytes / 1e6:.1f} MB kept")
+
+    def close(self):
+        with self._lock:
+            try:
+                self.conn.commit()
+                self.conn.close()
+            except Exception:
+                pass
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+run_profiler.py
+
+--profile support for the scrapers and split_sqlite_by_category.py: profiles a
+window of the first N pages (or rows), then switches itself off, so the rest
+of the run goes at full speed. Without --profile nothing here is loaded into
+the hot path (the scripts only wrap their page functions when profiling).
+
+Two modes:
+ - 'cprofile' (default): deterministic cProfile of the wrapped calls on every
+   thread that runs them (one Profile per thread, merged in the report). Exact
+   call counts, but it slows pure-Python code down noticeably.
+ - 'sample': a background thread takes a wall-clock stack sample of every
+   thread each SAMPLE_INTERVAL seconds. Low overhead, and it also sees threads
+   that are not wrapped (the splitter's category writers, the staged
+   pipeline's writer) and time spent blocked on the network or on SQLite.
+
+Either way tracemalloc runs over the same window: the report lists the top
+allocation sites at the end of the window and what grew since its start.
+(tracemalloc makes allocation-heavy code look slower in the timings.)
+
+Reports go to a new profile_YYYYmmdd_HHMMSS folder under the chosen directory:
+ - profile.pstats + profile.txt        cprofile mode (load the .pstats in
+                                       snakeviz / pstats for more views)
+ - samples.txt + samples.folded        sample mode (the .folded file feeds
+                                       flamegraph.pl or speedscope)
+ - memory.txt + memory.snapshot        tracemalloc (the snapshot reloads with
+                                       tracemalloc.Snapshot.load)
+
+With --cpu-workers the parse/classify/QA stages run in other processes and
+are not profiled; profile without it to see them.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# ----------------- Config -----------------
+PROFILE_MODES = ('cprofile', 'sample')
+# Default window: pages for the scrapers, rows for the splitter
+PROFILE_PAGES = 200
+PROFILE_ROWS = 100_000
+# Folder (next to the DB / in the output folder) the reports go to unless --profile-dir
+PROFILE_DIRNAME = 'profiles'
+# Lines per table in the text reports
+PROFILE_TOP = 40
+# Sampler: seconds between samples and deepest stack kept
+SAMPLE_INTERVAL = 0.005
+SAMPLE_MAX_DEPTH = 64
+# A sample whose innermost frame is in one of these files is a thread waiting for work or a lock
+IDLE_FILES = ('threading.py', 'queue.py', 'thread.py')
+# Frames kept per allocation by tracemalloc
+TRACEMALLOC_FRAMES = 1
+# ------------------------------------------
+
+def _func_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class _Sampler(threading.Thread):
+    """Wall-clock stack samples of every other thread until stopped."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.interval = interval
+        self.samples = 0
+        self.self_counts = Counter()     # leaf function -> samples
+        self.busy_counts = Counter()     # the same, without idle waits (IDLE_FILES)
+        self.total_counts = Counter()    # function anywhere on the stack -> samples
+        self.stacks = Counter()          # 'thread;outer;...;leaf' -> samples
+        self._halt = threading.Event()
+
+    def run(self):
+        me = threading.get_ident()
+        while not self._halt.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                idle = os.path.basename(frame.f_code.co_filename) in IDLE_FILES
+                stack = []
+                while frame is not None and len(stack) < SAMPLE_MAX_DEPTH:
+                    stack.append(_func_label(frame.f_code))
+                    frame = frame.f_back
+                if not stack:
+                    continue
+                self.samples += 1
+                self.self_counts[stack[0]] += 1
+                if not idle:
+                    self.busy_counts[stack[0]] += 1
+                self.total_counts.update(set(stack))
+                stack.reverse()
+                self.stacks[';'.join([names.get(ident, str(ident))] + stack)] += 1
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+
+class RunProfiler:
+    """
+    Profiles the first `window` units of a run (pages or rows, counted with
+    tick() or by the wrap()ped calls) and writes the reports when the window
+    is full, or at stop() if the run ends first.
+    """
+
+    def __init__(self, out_dir, window=PROFILE_PAGES, mode='cprofile', unit='pages', top=PROFILE_TOP):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode!r} (expected one of {PROFILE_MODES})")
+        self.out_dir = out_dir
+        self.window = max(1, int(window))
+        self.mode = mode
+        self.unit = unit
+        self.top = top
+        self.done = 0
+        self.active = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiles = []       # every thread's cProfile.Profile
+        self._busy = set()        # profiles enabled right now (their thread is inside a wrapped call)
+        self._pinned = None       # (thread ident, Profile) from start(this_thread=True)
+        self._sampler = None
+        self._baseline = None
+        self._started = None
+        self._elapsed = None
+        self._reported = False
+
+    # ---- lifecycle ----
+    def start(self, this_thread=False):
+        """
+        Begin the window. this_thread=True also profiles the calling thread
+        from now until the window ends (the splitter's reader loop).
+        """
+        if self.mode == 'sample':
+            self._sampler = _Sampler()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._baseline = tracemalloc.take_snapshot()
+        self._started = time.perf_counter()
+        self.active = True
+        if self._sampler is not None:
+            self._sampler.start()
+        if this_thread and self.mode == 'cprofile':
+            prof = self._thread_profile()
+            try:
+                prof.enable()
+                self._pinned = (threading.get_ident(), prof)
+            except ValueError as e:  # another profiler/debugger owns the hook
+                print(f"Profile: cProfile unavailable on this thread: {e}")
+        print(f"Profiling the first {self.window} {self.unit} ({self.mode}, tracemalloc on)")
+
+    def tick(self, n=1):
+        """Count `n` finished units; ends the window once `window` is reached."""
+        with self._lock:
+            if not self.active:
+                return
+            self.done += n
+            if self.done < self.window:
+                return
+        self._end_window()
+
+    def stop(self):
+        """End of the run: close the window if still open and write whatever was collected."""
+        self._end_window()
+        with self._lock:
+            if self._reported:
+                return
+            self._reported = True
+        self._report()
+
+    # ---- wrapping ----
+    def wrap(self, fn, count=True):
+        """fn, profiled on the calling thread while the window is open; count=True ticks once per call."""
+        def profiled(*args, **kwargs):
+            prof = self._enter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                if prof is not None:
+                    self._leave(prof)
+                if count:
+                    self.tick()
+        profiled.__name__ = getattr(fn, '__name__', 'profiled')
+        return profiled
+
+    def _thread_profile(self):
+        prof = getattr(self._local, 'profile', None)
+        if prof is None:
+            prof = self._local.profile = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(prof)
+        return prof
+
+    def _enter(self):
+        if not self.active or self.mode != 'cprofile':
+            return None
+        prof = self._thread_profile()
+        with self._lock:
+            if not self.active or prof in self._busy:
+                return None
+            self._busy.add(prof)
+        try:
+            prof.enable()
+        except ValueError:
+            # Python 3.12+: one cProfile at a time; this call goes unprofiled
+            with self._lock:
+                self._busy.discard(prof)
+            return None
+        return prof
+
+    def _leave(self, prof):
+        prof.disable()
+        with self._lock:
+            self._busy.discard(prof)
+            ready = not self.active and not self._busy and not self._reported and self._elapsed is not None
+            if ready:
+                self._reported = True
+        if ready:
+            self._report()
+
+    def _end_window(self):
+        with self._lock:
+            if not self.active:
+                return
+            self.active = False
+            self._elapsed = time.perf_counter() - self._started
+            pinned, self._pinned = self._pinned, None
+            ready = not self._busy and not self._reported
+            if ready:
+                self._reported = True
+        if pinned is not None and pinned[0] == threading.get_ident():
+            pinned[1].disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+        # Calls still inside a wrapped function write the report when the last one returns
+        if ready:
+            self._report()
+
+    # ---- reports ----
+    def _report(self):
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        tracemalloc.stop()
+        folder = os.path.join(self.out_dir, time.strftime('profile_%Y%m%d_%H%M%S'))
+        try:
+            os.makedirs(folder, exist_ok=True)
+            header = (f"{self.done} {self.unit} profiled in {self._elapsed or 0:.1f}s "
+                      f"(window {self.window}, mode {self.mode})\n")
+            if self.mode == 'cprofile':
+                self._write_cprofile(folder, header)
+            elif self._sampler is not None:
+                self._write_samples(folder, header)
+            if snapshot is not None:
+                self._write_memory(folder, header, snapshot, current, peak)
+        except OSError as e:
+            print(f"Profile: could not write the report to {folder}: {e}")
+            return
+        print(f"Profile: {header.strip()}; report in {folder}")
+
+    def _write_cprofile(self, folder, header):
+        with self._lock:
+            profiles = [p for p in self._profiles if p not in self._busy]
+        stats = None
+        for prof in profiles:
+            prof.create_stats()
+            if not prof.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(prof)
+            else:
+                stats.add(prof)
+        with open(os.path.join(folder, 'profile.txt'), 'w', encoding='utf-8') as f:
+            f.write(header)
+            if stats is None:
+                f.write("No calls were profiled.\n")
+                return
+            stats.dump_stats(os.path.join(folder, 'profile.pstats'))
+            stats.strip_dirs()
+            for key, title in (('cumulative', 'By cumulative time'), ('tottime', 'By own time')):
+                stats.stream = io.StringIO()
+                stats.sort_stats(key).print_stats(self.top)
+                f.write(f"\n===== {title} =====\n{stats.stream.getvalue()}")
+
+    def _write_samples(self, folder, header):
+        s = self._sampler
+        total = s.samples or 1
+        with open(os.path.join(folder, 'samples.txt'), 'w', encoding='utf-8') as f:
+            f.write(header)
+            f.write(f"{s.samples} thread samples every {SAMPLE_INTERVAL * 1000:g} ms (wall clock: "
+                    f"blocked and idle threads are counted too)\n")
+            for title, counts in (('Own samples, idle waits left out', s.busy_counts),
+                                  ('Own samples (leaf frame)', s.self_counts),
+                                  ('Samples on the stack (inclusive)', s.total_counts)):
+                f.write(f"\n===== {title} =====\n")
+                for func, n in counts.most_common(self.top):
+                    f.write(f"{n:>8} {n / total:>6.1%}  {func}\n")
+        with open(os.path.join(folder, 'samples.folded'), 'w', encoding='utf-8') as f:
+            for stack, n in s.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+
+    def _write_memory(self, folder, header, snapshot, current, peak):
+        # Leave out the profiler's own allocations (sampler counters, tracemalloc itself)
+        snapshot = snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),
+                                           tracemalloc.Filter(False, __file__)))
+        snapshot.dump(os.path.join(folder, 'memory.snapshot'))
+        with open(os.path.join(folder, 'memory.txt'), 'w', encoding='utf-8') as f:
+            f.write(header)
+            f.write(f"Traced memory: {current / 1e6:.1f} MB now, {peak / 1e6:.1f} MB peak\n")
+            f.write("\n===== Top allocation sites (live at the end of the window) =====\n")
+            for stat in snapshot.statistics('lineno')[:self.top]:
+                f.write(f"{stat}\n")
+            if self._baseline is not None:
+                f.write("\n===== Growth since the start of the window =====\n")
+                for stat in snapshot.compare_to(self._baseline, 'lineno')[:self.top]:
+                    f.write(f"{stat}\n")
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+search_index.py
+
+Full-text search over stored articles (SQLite FTS5).
+
+articles_fts is an external-content FTS5 table over the articles_text view
+(title plus content): it stores only the index, the text stays in `articles`.
+Triggers keep it in sync with every INSERT / UPDATE / DELETE on `articles`,
+whoever writes (the crawler's group commit, the category mirrors, the
+splitter). Writers must run with PRAGMA recursive_triggers = ON so rows
+removed by INSERT OR REPLACE are also removed from the index.
+
+While every row is plain text the view and triggers read `content` directly,
+so other SQLite tools (the sqlite3 shell, DB Browser for SQLite) can still
+edit and delete articles. Once compressed rows exist (--content-codec
+zlib/zstd), they decode through content_codec's content_text(), which only
+exists on connections that registered it: outside the scrapers and these
+scripts, writes to `articles` then fail with "no such function:
+content_text". enable_fts() picks the mode, and switches it when the DB
+changes (content_codec.py --codec plain switches back).
+
+Results are ranked with BM25 (title hits weigh more than content hits) and
+come with a highlighted snippet. --rebuild re-indexes an existing DB (also
+needed after a VACUUM, which may renumber rowids); --optimize merges the
+index segments.
+
+Usage examples:
+    python search_index.py "smallholder yield gap"
+    python search_index.py "deforestation" --category Sustainability --since 2024-01-01
+    python search_index.py --db "C:\\Users\\Roy\\Documents\\DBOilPalmmiro\\Processing.db" "mill effluent"
+    python search_index.py --rebuild --optimize
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+
+from content_codec import ensure_schema, register_functions
+
+# ----------------- Config -----------------
+DEFAULT_DB_PATH = r"C:/Users/Roy/Documents/DBOilPalmmiro/oilpalmdbmiro.db"
+SEARCH_LIMIT = 20
+# BM25 column weights (title, content)
+TITLE_WEIGHT = 5.0
+CONTENT_WEIGHT = 1.0
+SNIPPET_TOKENS = 16
+# ------------------------------------------
+
+FTS_TABLE_SQL = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+        title, content,
+        content='articles_text', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+'''
+
+def _fts_schema(decode):
+    # decode=False: plain rows only, no SQL function needed; True: content through content_text()
+    def text(row):
+        return f"content_text({row}content, {row}codec)" if decode else f"{row}content"
+    return [
+        # Text of every article (the index's content table)
+        f'''
+        CREATE VIEW IF NOT EXISTS articles_text AS
+            SELECT rowid AS id, title, {text("")} AS content FROM articles
+        ''',
+        FTS_TABLE_SQL,
+        f'''
+        CREATE TRIGGER IF NOT EXISTS articles_fts_insert AFTER INSERT ON articles BEGIN
+            INSERT INTO articles_fts (rowid, title, content) VALUES (new.rowid, new.title, {text("new.")});
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS articles_fts_delete AFTER DELETE ON articles BEGIN
+            INSERT INTO articles_fts (articles_fts, rowid, title, content)
+            VALUES ('delete', old.rowid, old.title, {text("old.")});
+        END
+        ''',
+        # Category-only updates (reclassify) don't touch the index
+        f'''
+        CREATE TRIGGER IF NOT EXISTS articles_fts_update AFTER UPDATE OF title, content, codec ON articles BEGIN
+            INSERT INTO articles_fts (articles_fts, rowid, title, content)
+            VALUES ('delete', old.rowid, old.title, {text("old.")});
+            INSERT INTO articles_fts (rowid, title, content) VALUES (new.rowid, new.title, {text("new.")});
+        END
+        ''',
+    ]
+
+# The index table last: the view and triggers can be swapped without re-indexing
+FTS_OBJECTS = [('TRIGGER', 'articles_fts_insert'), ('TRIGGER', 'articles_fts_delete'),
+               ('TRIGGER', 'articles_fts_update'), ('VIEW', 'articles_text'), ('TABLE', 'articles_fts')]
+
+_WORD_RE = re.compile(r'\w+')
+
+def fts_available(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+def has_fts(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'articles_fts'").fetchone() is not None
+
+def _current(conn):
+    # An index created by an older version (plain `articles` as content table) is rebuilt
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'articles_fts'").fetchone()
+    return row is not None and "content='articles_text'" in row[0]
+
+def _decoding(conn):
+    # True if the existing triggers go through content_text()
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'articles_fts_insert'").fetchone()
+    return row is not None and 'content_text(' in row[0]
+
+def has_compressed(conn):
+    """True if any article is stored with a codec (zlib/zstd) rather than as plain text."""
+    return conn.execute("SELECT 1 FROM articles WHERE codec IS NOT NULL LIMIT 1").fetchone() is not None
+
+def enable_fts(conn, compressed=False):
+    """
+    Create articles_fts, its view and triggers on `conn` (which must have an
+    articles table) and index the rows already there. compressed=True (the
+    caller is about to write zlib/zstd rows) or compressed rows in the DB
+    install the content_text() triggers, otherwise the plain ones; an index in
+    the other mode has its triggers swapped. Returns False if this SQLite build
+    has no FTS5.
+    """
+    if not fts_available(conn):
+        print("WARNING: this SQLite build has no FTS5; full-text index not created.")
+        return False
+    conn.execute("PRAGMA recursive_triggers = ON;")
+    ensure_schema(conn)
+    register_functions(conn)
+    decode = compressed or has_compressed(conn)
+    existed = has_fts(conn) and _current(conn)
+    with conn:
+        if not existed:
+            for kind, name in FTS_OBJECTS:
+                conn.execute(f"DROP {kind} IF EXISTS {name}")
+        elif _decoding(conn) != decode:
+            # Same text either way, so the index itself stays
+            for kind, name in FTS_OBJECTS[:-1]:
+                conn.execute(f"DROP {kind} IF EXISTS {name}")
+        for stmt in _fts_schema(decode):
+            conn.execute(stmt)
+    if not existed:
+        rebuild(conn)
+    return True
+
+def rebuild(conn):
+    """Re-index every article from scratch."""
+    with conn:
+        conn.execute("INSERT INTO articles_fts (articles_fts) VALUES ('rebuild')")
+
+def optimize(conn):
+    """Merge the index b-trees into one (smaller, faster queries)."""
+    with conn:
+        conn.execute("INSERT INTO articles_fts (articles_fts) VALUES ('optimize')")
+
+def to_match_query(text):
+    """Plain words -> FTS5 query matching all of them ('oil-palm yields' -> '"oil" "palm" "yields"')."""
+    return " ".join(f'"{w}"' for w in _WORD_RE.findall(text))
+
+def search(conn, query, category=None, since=None, until=None, limit=SEARCH_LIMIT, raw=False):
+    """
+    Articles matching `query`, best first: [{'url', 'title', 'category',
+    'scraped_date', 'score', 'snippet'}]. `since` / `until` are dates
+    (YYYY-MM-DD, inclusive) on scraped_date; raw=True passes `query` through
+    as FTS5 syntax (phrases, OR, NEAR, prefix*). `conn` needs content_text()
+    (content_codec.register_functions) for the snippets.
+    """
+    match = query if raw else to_match_query(query)
+    if not match:
+        return []
+    sql = f'''
+        SELECT a.url, a.title, a.category, a.scraped_date,
+               bm25(articles_fts, ?, ?) AS score,
+               snippet(articles_fts, 1, '[', ']', ' ... ', ?) AS snip
+        FROM articles_fts JOIN articles a ON a.rowid = articles_fts.rowid
+        WHERE articles_fts MATCH ?
+    '''
+    params = [TITLE_WEIGHT, CONTENT_WEIGHT, SNIPPET_TOKENS, match]
+    if category:
+        sql += " AND a.category = ?"
+        params.append(category)
+    if since:
+        sql += " AND a.scraped_date >= ?"
+        params.append(since)
+    if until:
+        sql += " AND a.scraped_date < date(?, '+1 day')"
+        params.append(until)
+    sql += " ORDER BY score LIMIT ?"
+    params.append(limit)
+    return [{'url': url, 'title': title, 'category': cat, 'scraped_date': date, 'score': -score, 'snippet': snip}
+            for url, title, cat, date, score, snip in conn.execute(sql, params)]
+
+def main(db_path, query, category, since, until, limit, raw, do_rebuild, do_optimize):
+    if not os.path.isfile(db_path):
+        print("ERROR: DB not found:", db_path)
+        sys.exit(1)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    register_functions(conn)
+    try:
+        if do_rebuild or do_optimize:
+            if not (has_fts(conn) and _current(conn)):
+                if not enable_fts(conn):
+                    sys.exit(1)
+                print(f"Created full-text index in {db_path}")
+            elif do_rebuild:
+                rebuild(conn)
+                print(f"Rebuilt full-text index in {db_path}")
+            if do_optimize:
+                optimize(conn)
+                print("Optimized full-text index")
+            n = conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+            print(f"{n} article(s) indexed")
+        if query:
+            if not has_fts(conn):
+                print("No full-text index in this DB yet; run with --rebuild first (or crawl with --fts).")
+                sys.exit(1)
+            results = search(conn, query, category, since, until, limit, raw)
+            if not results:
+                print("No matches.")
+            for i, r in enumerate(results, 1):
+                print(f"{i:>3}. [{r['score']:.2f}] {r['title'] or '(no title)'}")
+                print(f"     {r['url']}  ({r['category']}, {r['scraped_date']})")
+                print(f"     {r['snippet']}")
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="BM25-ranked full-text search over stored articles.")
+    parser.add_argument('query', nargs='?', help='Words to search for (all must match)')
+    parser.add_argument('--db', help='Main DB or a category DB', default=DEFAULT_DB_PATH)
+    parser.add_argument('--category', help='Only articles in this category', default=None)
+    parser.add_argument('--since', help='Only articles scraped on/after this date (YYYY-MM-DD)', default=None)
+    parser.add_argument('--until', help='Only articles scraped on/before this date (YYYY-MM-DD)', default=None)
+    parser.add_argument('--limit', type=int, default=SEARCH_LIMIT, help='Maximum number of results')
+    parser.add_argument('--raw', action='store_true', help='Treat the query as FTS5 syntax ("exact phrase", OR, NEAR, prefix*)')
+    parser.add_argument('--rebuild', action='store_true', help='Create or rebuild the full-text index of --db')
+    parser.add_argument('--optimize', action='store_true', help='Merge the full-text index segments')
+    args = parser.parse_args()
+    if not (args.query or args.rebuild or args.optimize):
+        parser.error("give a query, --rebuild or --optimize")
+    main(args.db, args.query, args.category, args.since, args.until, args.limit, args.raw, args.rebuild, args.optimize)
@@ -8,10 +8,40 @@ Usage examples:
     python split_sqlite_by_category.py
     python split_sqlite_by_category.py --db "C:\\Users\\Roy\\Documents\\DBOilPalmmiro\\oilpalmdbmiro.db"
     python split_sqlite_by_category.py --db "C:\\path\\to\\oilpalmdbmiro.db" --outdir "." --include-noncategory
+    python split_sqlite_by_category.py --incremental
+    python split_sqlite_by_category.py --workers 8
+    python split_sqlite_by_category.py --profile --profile-window 200000 --no-fast-path
 
 By default:
  - Source DB: C:\\Users\\Roy\\Documents\\DBOilPalmmiro\\oilpalmdbmiro.db
  - Only tables with a detected category column are processed (safer).
+
+Tables whose category column holds one plain value per row (e.g. articles.category)
+are copied inside SQLite: each category DB is ATTACHed and filled with one
+INSERT OR REPLACE ... SELECT ... WHERE category = ?. Multi-valued or JSON tag
+columns go through the row-by-row Python path (--no-fast-path forces it everywhere).
+
+--incremental keeps a per-table rowid watermark and the category/key of every
+row already split in a sidecar DB (SPLIT_STATE_FILENAME in the output folder).
+Later runs copy only rows past the watermark, plus rows whose category changed
+(e.g. after --reclassify) or that were replaced; their old copies are removed
+from the category DBs they left. Tables without a rowid or primary key are
+always copied in full.
+
+Compressed article content (see content_codec.py) is copied as stored; the
+zstd dictionaries it refers to (CONTENT_DICTS_TABLE) go into every category DB
+that receives rows. The crawl's run metrics (CRAWL_STATS_TABLE) stay in the
+source DB: its `labels` column is not a category.
+
+Category DBs are written in parallel (--workers, default SPLIT_WORKERS): the
+fast path runs its per-category INSERT ... SELECTs on a thread pool, and the
+row path streams fetchmany() chunks, shards them by category and hands each
+shard to that DB file's writer thread through a bounded queue.
+
+--profile profiles the first --profile-window rows (see run_profiler.py). In
+the default cprofile mode only the reading thread is profiled; the writer
+threads and the fast path's INSERT ... SELECT jobs show up with
+--profile-mode sample.
 """
 
 import sqlite3
@@ -19,8 +49,16 @@ import os
 import argparse
 import re
 import json
+import queue
 import sys
+import threading
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from content_codec import CONTENT_DICTS_TABLE, ensure_schema, register_functions
+from crawl_metrics import CRAWL_STATS_TABLE
+from run_profiler import RunProfiler, PROFILE_MODES, PROFILE_ROWS, PROFILE_DIRNAME
+from search_index import enable_fts, has_compressed, has_fts
 
 # ----------------- Config -----------------
 DEFAULT_DB_PATH = r"C:/Users/Roy/Documents/DBOilPalmmiro/oilpalmdbmiro.db"
@@ -40,6 +78,19 @@ SPLIT_REGEX = re.compile(r'[,\|;/]')
 # How many rows to fetch per batch
 FETCH_BATCH = 1000
 
+# Characters str.strip() removes; a category value with any of them at either end needs the Python path
+STRIP_CHARS = " \t\n\r\x0b\x0c"
+
+# Sidecar DB (in the output folder) with the --incremental watermarks
+SPLIT_STATE_FILENAME = "_split_state.db"
+
+# Parallel writers: default --workers, chunks a category DB's writer may have
+# queued, rows per writer transaction, and seconds to wait on a locked DB
+SPLIT_WORKERS = min(8, os.cpu_count() or 1)
+WRITER_QUEUE_CHUNKS = 8
+WRITER_COMMIT_ROWS = 50000
+WRITER_BUSY_TIMEOUT = 60
+
 # ------------------------------------------
 
 def sanitize_filename(name: str) -> str:
@@ -117,10 +168,384 @@ def open_target_db_for_category(out_dir, category_name, cache):
     conn.execute("PRAGMA journal_mode = WAL;")
     conn.execute("PRAGMA synchronous = NORMAL;")
     conn.execute("PRAGMA foreign_keys = OFF;")
+    # Category DBs made by the mirror script may carry full-text index triggers
+    conn.execute("PRAGMA recursive_triggers = ON;")
+    register_functions(conn)
     cache[category_name] = {'conn': conn, 'created_tables': set(), 'path': out_path}
     return conn, cache[category_name]['created_tables']
 
-def main(source_db_path, out_dir, include_noncategory_tables):
+def ensure_target_table(conn, created, tname, create_sql, src_conn, cat):
+    """Create table `tname` in a category DB (once). Returns False if it could not be created."""
+    if tname in created:
+        return True
+    if create_sql:
+        try:
+            conn.executescript(create_sql if "IF NOT EXISTS" in create_sql.upper() else re.sub(r'CREATE\s+TABLE', 'CREATE TABLE IF NOT EXISTS', create_sql, flags=re.IGNORECASE, count=1))
+        except Exception as e:
+            alt_sql = build_create_table_sql(tname, None, src_conn)
+            if alt_sql:
+                conn.executescript(alt_sql)
+            else:
+                print(f"WARNING: Could not create table {tname} in target DB for category '{cat}': {e}")
+                return False
+    else:
+        alt_sql = build_create_table_sql(tname, None, src_conn)
+        if alt_sql:
+            conn.executescript(alt_sql)
+        else:
+            print(f"WARNING: No CREATE SQL available for table {tname}. Skipping.")
+            return False
+    # A table left by an older run may lack columns added since (e.g. articles.codec)
+    have = {row[1] for row in conn.execute(f'PRAGMA table_info({quote_ident(tname)})')}
+    for col in src_conn.execute(f'PRAGMA table_info({quote_ident(tname)})').fetchall():
+        if col[1] not in have:
+            conn.execute(f'ALTER TABLE {quote_ident(tname)} ADD COLUMN {quote_ident(col[1])} {col[2]}')
+    if CONTENT_DICTS_TABLE not in created:
+        # Once per category DB: the dictionaries compressed content may refer to
+        created.add(CONTENT_DICTS_TABLE)
+        if src_conn.execute("SELECT 1 FROM main.sqlite_master WHERE name = ?", (CONTENT_DICTS_TABLE,)).fetchone():
+            ensure_schema(conn)
+            conn.executemany(f"INSERT OR IGNORE INTO {CONTENT_DICTS_TABLE} (id, data, created) VALUES (?, ?, ?)",
+                             [tuple(row) for row in src_conn.execute(f"SELECT id, data, created FROM main.{CONTENT_DICTS_TABLE}")])
+        if has_fts(conn):
+            # Compressed source rows need the index triggers that decode them
+            enable_fts(conn, compressed=has_compressed(src_conn))
+    created.add(tname)
+    return True
+
+def table_key_columns(src_conn, tname):
+    """Primary-key columns of `tname` in key order ([] if it has none)."""
+    info = src_conn.execute(f'PRAGMA table_info({quote_ident(tname)})').fetchall()
+    return [c[1] for c in sorted((c for c in info if c[5]), key=lambda c: c[5])]
+
+def has_rowid(src_conn, tname):
+    try:
+        src_conn.execute(f'SELECT rowid FROM {quote_ident(tname)} LIMIT 0')
+        return True
+    except sqlite3.OperationalError:  # WITHOUT ROWID table
+        return False
+
+def open_split_state(src_conn, out_dir, source_db_path):
+    """
+    ATTACH the sidecar state DB (SPLIT_STATE_FILENAME in out_dir) as `state` to
+    the source connection. State recorded for a different source DB is discarded.
+    """
+    path = os.path.join(out_dir, SPLIT_STATE_FILENAME)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS split_watermarks (
+            tbl TEXT PRIMARY KEY,
+            source TEXT,
+            last_rowid INTEGER,
+            updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        -- Rowids to copy in the current run (read by the parallel copy connections too)
+        CREATE TABLE IF NOT EXISTS split_todo (
+            rid INTEGER PRIMARY KEY
+        );
+        -- One row per source row already split: where it went and how to find it again
+        CREATE TABLE IF NOT EXISTS split_rows (
+            tbl TEXT,
+            rid INTEGER,
+            category,
+            key TEXT,
+            PRIMARY KEY (tbl, rid)
+        ) WITHOUT ROWID;
+    ''')
+    source = os.path.abspath(source_db_path)
+    other = conn.execute("SELECT source FROM split_watermarks WHERE source != ? LIMIT 1", (source,)).fetchone()
+    if other:
+        print(f"Split state was recorded for {other[0]}; starting over for {source}.")
+        conn.execute("DELETE FROM split_watermarks")
+        conn.execute("DELETE FROM split_rows")
+    conn.commit()
+    conn.close()
+    src_conn.execute("ATTACH DATABASE ? AS state", (path,))
+    return source
+
+def prepare_incremental(src_conn, t, out_dir, category_cache):
+    """
+    Fill state.split_todo with the rowids of `t` that must be (re)copied: rows past
+    the watermark, rows whose category or key changed since they were split, and
+    rows below the watermark that were never split. Stale copies of changed or
+    deleted rows are removed from their old category DBs.
+    Returns (rows to copy, stale copies removed).
+    """
+    tname, cat_col, keys = t['name'], t['category_column'], t['key_columns']
+    qt = quote_ident(tname)
+    cat_expr = f's.{quote_ident(cat_col)}' if cat_col else 'NULL'
+    key_expr = 'json_array(' + ", ".join(f's.{quote_ident(k)}' for k in keys) + ')'
+    row = src_conn.execute("SELECT last_rowid FROM state.split_watermarks WHERE tbl = ?", (tname,)).fetchone()
+    watermark = row[0] if row else 0
+    src_conn.execute("DELETE FROM state.split_todo")
+
+    # Rows split before whose category (reclassify) or key (INSERT OR REPLACE, VACUUM) changed, or that are gone
+    stale = src_conn.execute(f'''
+        SELECT m.rid, m.category, m.key, s.rowid IS NOT NULL
+        FROM state.split_rows m LEFT JOIN main.{qt} s ON s.rowid = m.rid
+        WHERE m.tbl = ? AND (s.rowid IS NULL OR {cat_expr} IS NOT m.category OR {key_expr} != m.key)
+    ''', (tname,)).fetchall()
+    removed = 0
+    if stale:
+        where = " AND ".join(f'{quote_ident(k)} IS ?' for k in keys)
+        for rid, old_category, key, exists in stale:
+            old_cats = (extract_categories_from_value(old_category) or ["Uncategorized"]) if cat_col else ["Uncategorized"]
+            for cat in old_cats:
+                conn, created = open_target_db_for_category(out_dir, cat, category_cache)
+                try:
+                    removed += conn.execute(f'DELETE FROM {qt} WHERE {where}', json.loads(key)).rowcount
+                except sqlite3.OperationalError:
+                    pass  # table never created in that DB
+        for info in category_cache.values():
+            info['conn'].commit()
+        with src_conn:
+            src_conn.executemany("DELETE FROM state.split_rows WHERE tbl = ? AND rid = ?",
+                                 [(tname, rid) for rid, _, _, exists in stale if not exists])
+            src_conn.executemany("INSERT OR IGNORE INTO state.split_todo (rid) VALUES (?)",
+                                 [(rid,) for rid, _, _, exists in stale if exists])
+
+    # Rows at or below the watermark that were never split (rowid reuse, renumbering)
+    below = src_conn.execute(f'SELECT COUNT(*) FROM main.{qt} WHERE rowid <= ?', (watermark,)).fetchone()[0]
+    tracked = src_conn.execute("SELECT COUNT(*) FROM state.split_rows WHERE tbl = ?", (tname,)).fetchone()[0]
+    with src_conn:
+        if below != tracked:
+            src_conn.execute(f'''
+                INSERT OR IGNORE INTO state.split_todo (rid)
+                SELECT s.rowid FROM main.{qt} s
+                WHERE s.rowid <= ? AND NOT EXISTS (SELECT 1 FROM state.split_rows m WHERE m.tbl = ? AND m.rid = s.rowid)
+            ''', (watermark, tname))
+        src_conn.execute(f'INSERT OR IGNORE INTO state.split_todo (rid) SELECT rowid FROM main.{qt} WHERE rowid > ?', (watermark,))
+    todo = src_conn.execute("SELECT COUNT(*) FROM state.split_todo").fetchone()[0]
+    return todo, removed
+
+def record_incremental(src_conn, t, source):
+    """Remember where the rows in state.split_todo went and advance the table's watermark."""
+    tname, cat_col, keys = t['name'], t['category_column'], t['key_columns']
+    qt = quote_ident(tname)
+    cat_expr = quote_ident(cat_col) if cat_col else 'NULL'
+    key_expr = 'json_array(' + ", ".join(quote_ident(k) for k in keys) + ')'
+    with src_conn:
+        src_conn.execute(f'''
+            INSERT OR REPLACE INTO state.split_rows (tbl, rid, category, key)
+            SELECT ?, rowid, {cat_expr}, {key_expr} FROM main.{qt} WHERE rowid IN (SELECT rid FROM state.split_todo)
+        ''', (tname,))
+        src_conn.execute('''
+            INSERT OR REPLACE INTO state.split_watermarks (tbl, source, last_rowid, updated)
+            VALUES (?, ?, MAX(COALESCE((SELECT last_rowid FROM state.split_watermarks WHERE tbl = ?), 0),
+                              COALESCE((SELECT MAX(rid) FROM state.split_todo), 0)), CURRENT_TIMESTAMP)
+        ''', (tname, source, tname))
+
+def is_single_valued(src_conn, tname, cat_col, row_filter=None):
+    """
+    True if every category value is a plain string that extract_categories_from_value()
+    would return unchanged: text, already stripped, no SPLIT_REGEX separator, no JSON list.
+    """
+    q = quote_ident(cat_col)
+    row = src_conn.execute(f'''
+        SELECT 1 FROM {quote_ident(tname)}
+        WHERE {row_filter or 1} AND {q} IS NOT NULL AND {q} != ''
+          AND (typeof({q}) != 'text' OR {q} != TRIM({q}, ?) OR {q} GLOB '*[,|;/]*' OR {q} GLOB '[[]*')
+        LIMIT 1
+    ''', (STRIP_CHARS,)).fetchone()
+    return row is None
+
+def insert_select(conn, target_path, qt, col_list, select_sql, params):
+    """INSERT OR REPLACE the rows of `select_sql` into table `qt` of the DB at `target_path`; returns the row count."""
+    conn.execute("ATTACH DATABASE ? AS target", (target_path,))
+    try:
+        try:
+            with conn:
+                return conn.execute(f'INSERT OR REPLACE INTO target.{qt} ({col_list}) {select_sql}', params).rowcount
+        except sqlite3.IntegrityError:
+            # Same fallback as the row path: keep the rows that fit, skip the rest
+            with conn:
+                return conn.execute(f'INSERT OR IGNORE INTO target.{qt} ({col_list}) {select_sql}', params).rowcount
+    finally:
+        conn.execute("DETACH DATABASE target")
+
+def _insert_select_job(source_db_path, state_path, target_path, qt, col_list, select_sql, params):
+    # Runs on a pool thread: sqlite3 connections can't be shared, so each job opens its own
+    conn = sqlite3.connect(source_db_path, timeout=WRITER_BUSY_TIMEOUT)
+    conn.execute("PRAGMA recursive_triggers = ON;")
+    register_functions(conn)
+    try:
+        if state_path:
+            conn.execute("ATTACH DATABASE ? AS state", (state_path,))
+        return insert_select(conn, target_path, qt, col_list, select_sql, params)
+    finally:
+        conn.close()
+
+def split_table_fast(src_conn, t, out_dir, category_cache, inserted_counts, row_counts_by_category, row_filter=None,
+                     workers=1, source_db_path=None):
+    """
+    Copy a single-valued table category by category with INSERT ... SELECT into the ATTACHed
+    target DB; with workers > 1 the categories are copied concurrently, one connection each.
+    """
+    tname = t['name']
+    cat_col = t['category_column']
+    qt = quote_ident(tname)
+    col_list = ", ".join(quote_ident(c) for c in t['columns'])
+    rows = row_filter or 1
+    select_sql = f'SELECT {col_list} FROM main.{qt} WHERE {rows}'
+
+    # (category, condition, params); NULL / empty values go to Uncategorized as in the Python path
+    groups = []
+    if cat_col:
+        q = quote_ident(cat_col)
+        for (value,) in src_conn.execute(f"SELECT DISTINCT {q} FROM {qt} WHERE {rows} AND {q} IS NOT NULL AND {q} != ''").fetchall():
+            groups.append((value, f' AND {q} = ?', (value,)))
+        if src_conn.execute(f"SELECT 1 FROM {qt} WHERE {rows} AND ({q} IS NULL OR {q} = '') LIMIT 1").fetchone():
+            groups.append(("Uncategorized", f" AND ({q} IS NULL OR {q} = '')", ()))
+    elif src_conn.execute(f"SELECT 1 FROM {qt} WHERE {rows} LIMIT 1").fetchone():
+        groups.append(("Uncategorized", "", ()))
+
+    jobs = []
+    for cat, where, params in groups:
+        conn, created = open_target_db_for_category(out_dir, cat, category_cache)
+        if not ensure_target_table(conn, created, tname, t['create_sql'], src_conn, cat):
+            continue
+        conn.commit()
+        jobs.append((cat, category_cache[cat]['path'], select_sql + where, params))
+
+    if workers > 1 and len(jobs) > 1:
+        state_path = os.path.join(out_dir, SPLIT_STATE_FILENAME) if row_filter else None
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(cat, pool.submit(_insert_select_job, source_db_path, state_path, path, qt, col_list, sql, params))
+                       for cat, path, sql, params in jobs]
+        results = []
+        for cat, fut in futures:
+            try:
+                results.append((cat, fut.result()))
+            except Exception as e:
+                print(f"Error inserting into {cat}/{tname}: {e}")
+    else:
+        results = []
+        for cat, path, sql, params in jobs:
+            try:
+                results.append((cat, insert_select(src_conn, path, qt, col_list, sql, params)))
+            except Exception as e:
+                print(f"Error inserting into {cat}/{tname}: {e}")
+    for cat, n in results:
+        inserted_counts[cat][tname] += n
+        row_counts_by_category[cat] += n
+
+class CategoryWriter(threading.Thread):
+    """
+    Writes the rows sharded to one category DB file on its own thread and
+    connection: executemany per chunk, WRITER_COMMIT_ROWS rows per transaction.
+    The queue is bounded, so the reader waits when this file falls behind.
+    """
+
+    def __init__(self, path):
+        super().__init__(name=f"writer-{os.path.basename(path)}", daemon=True)
+        self.path = path
+        self.queue = queue.Queue(maxsize=WRITER_QUEUE_CHUNKS)
+        self.counts = defaultdict(lambda: defaultdict(int))  # category -> table -> rows
+        self.start()
+
+    def put(self, cat, tname, cols, rows):
+        self.queue.put((cat, tname, cols, rows))
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        try:
+            conn = sqlite3.connect(self.path, timeout=WRITER_BUSY_TIMEOUT)
+            conn.execute("PRAGMA synchronous = NORMAL;")
+            conn.execute("PRAGMA recursive_triggers = ON;")
+            register_functions(conn)
+        except Exception as e:
+            print(f"ERROR: could not open {self.path}: {e}")
+            while self.queue.get() is not None:  # keep draining so the reader never blocks
+                pass
+            return
+        uncommitted = 0
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                cat, tname, cols, rows = item
+                self.counts[cat][tname] += self._insert(conn, cat, tname, cols, rows)
+                uncommitted += len(rows)
+                if uncommitted >= WRITER_COMMIT_ROWS:
+                    conn.commit()
+                    uncommitted = 0
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _insert(self, conn, cat, tname, cols, rows):
+        col_list = ", ".join(quote_ident(c) for c in cols)
+        placeholders = ", ".join("?" for _ in cols)
+        try:
+            conn.executemany(f'INSERT OR REPLACE INTO {quote_ident(tname)} ({col_list}) VALUES ({placeholders})', rows)
+            return len(rows)
+        except sqlite3.IntegrityError:
+            pass
+        except Exception as e:
+            print(f"Error inserting into {cat}/{tname}: {e}")
+            return 0
+        # A row in the chunk broke a constraint: redo it row by row, as the single-threaded path does
+        n = 0
+        for vals in rows:
+            try:
+                conn.execute(f'INSERT OR REPLACE INTO {quote_ident(tname)} ({col_list}) VALUES ({placeholders})', vals)
+                n += 1
+            except sqlite3.IntegrityError:
+                try:
+                    conn.execute(f'INSERT OR IGNORE INTO {quote_ident(tname)} ({col_list}) VALUES ({placeholders})', vals)
+                    n += 1
+                except Exception as e:
+                    print(f"Error inserting into {cat}/{tname}: {e}")
+        return n
+
+def split_rows_parallel(src_conn, t, out_dir, category_cache, inserted_counts, row_counts_by_category, row_filter=None,
+                        profiler=None):
+    """Row path with one CategoryWriter per category DB file; this thread only reads and shards."""
+    tname, cols, cat_col = t['name'], t['columns'], t['category_column']
+    writers = {}  # target path -> CategoryWriter
+    try:
+        sel_cur = src_conn.execute(f'SELECT * FROM {quote_ident(tname)} WHERE {row_filter or 1};')
+        while True:
+            rows = sel_cur.fetchmany(FETCH_BATCH)
+            if not rows:
+                break
+            shards = defaultdict(list)
+            for row in rows:
+                if cat_col:
+                    categories = extract_categories_from_value(row[cat_col]) or ["Uncategorized"]
+                else:
+                    categories = ["Uncategorized"]
+                vals = row_to_tuple(row, cols)
+                for cat in categories:
+                    shards[cat].append(vals)
+            for cat, shard in shards.items():
+                conn, created = open_target_db_for_category(out_dir, cat, category_cache)
+                if not ensure_target_table(conn, created, tname, t['create_sql'], src_conn, cat):
+                    continue
+                conn.commit()
+                path = category_cache[cat]['path']
+                if path not in writers:
+                    writers[path] = CategoryWriter(path)
+                writers[path].put(cat, tname, cols, shard)
+            if profiler is not None:
+                profiler.tick(len(rows))
+    finally:
+        for writer in writers.values():
+            writer.close()
+        for writer in writers.values():
+            for cat, tables in writer.counts.items():
+                for tbl, n in tables.items():
+                    inserted_counts[cat][tbl] += n
+                    row_counts_by_category[cat] += n
+
+
+def main(source_db_path, out_dir, include_noncategory_tables, fast_path=True, incremental=False, workers=SPLIT_WORKERS,
+         profile=False, profile_window=PROFILE_ROWS, profile_mode='cprofile', profile_dir=None):
     if not os.path.isfile(source_db_path):
         print("ERROR: source DB not found:", source_db_path)
         sys.exit(1)
@@ -130,6 +555,8 @@ def main(source_db_path, out_dir, include_noncategory_tables):
 
     src_conn = sqlite3.connect(source_db_path)
     src_conn.row_factory = sqlite3.Row
+    src_conn.execute("PRAGMA recursive_triggers = ON;")  # for the ATTACHed targets (fast path)
+    register_functions(src_conn)
     cur = src_conn.cursor()
 
     cur.execute("SELECT name, sql FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
@@ -138,8 +565,12 @@ def main(source_db_path, out_dir, include_noncategory_tables):
         print("No user tables found in the DB.")
         return
 
+    # Virtual tables (the full-text index) and their shadow tables belong to the source DB only
+    virtual = [name for name, create_sql in all_tables if (create_sql or '').upper().startswith('CREATE VIRTUAL TABLE')]
     tables = []
     for name, create_sql in all_tables:
+        if any(name == v or name.startswith(v + '_') for v in virtual) or name in (CONTENT_DICTS_TABLE, CRAWL_STATS_TABLE):
+            continue
         cols_info = src_conn.execute(f'PRAGMA table_info({quote_ident(name)})').fetchall()
         cols = [c[1] for c in cols_info]
         cat_col = find_category_column(cols)
@@ -151,7 +582,8 @@ def main(source_db_path, out_dir, include_noncategory_tables):
             'name': name,
             'columns': cols,
             'category_column': cat_col,
-            'create_sql': create_stmt
+            'create_sql': create_stmt,
+            'key_columns': table_key_columns(src_conn, name),
         })
 
     if not tables:
@@ -160,6 +592,12 @@ def main(source_db_path, out_dir, include_noncategory_tables):
         return
 
     print(f"Processing {len(tables)} table(s)...")
+    profiler = None
+    if profile:
+        profiler = RunProfiler(profile_dir or os.path.join(out_dir, PROFILE_DIRNAME), profile_window, profile_mode,
+                               unit='rows')
+        profiler.start(this_thread=True)
+    source = open_split_state(src_conn, out_dir, source_db_path) if incremental else None
     category_cache = {}
     row_counts_by_category = defaultdict(int)
     inserted_counts = defaultdict(lambda: defaultdict(int))
@@ -175,11 +613,41 @@ def main(source_db_path, out_dir, include_noncategory_tables):
             print(f'  Skipping table "{tname}" (no columns).')
             continue
 
+        row_filter = None
+        tracked = incremental and t['key_columns'] and has_rowid(src_conn, tname)
+        if incremental and not tracked:
+            print("  No rowid/primary key to track: copying the whole table")
+        if tracked:
+            todo, removed = prepare_incremental(src_conn, t, out_dir, category_cache)
+            print(f"  Incremental: {todo} row(s) to copy, {removed} stale copy(ies) removed")
+            if not todo:
+                continue
+            row_filter = "rowid IN (SELECT rid FROM state.split_todo)"
+
+        if fast_path and (cat_col is None or is_single_valued(src_conn, tname, cat_col, row_filter)):
+            print("  Single-valued category column: copying in SQL (ATTACH + INSERT ... SELECT)")
+            copied = sum(row_counts_by_category.values())
+            split_table_fast(src_conn, t, out_dir, category_cache, inserted_counts, row_counts_by_category, row_filter,
+                             workers=workers, source_db_path=source_db_path)
+            if profiler is not None:
+                profiler.tick(sum(row_counts_by_category.values()) - copied)
+            if tracked:
+                record_incremental(src_conn, t, source)
+            continue
+        if fast_path:
+            print("  Multi-valued/JSON category values found: copying row by row")
+        if workers > 1:
+            split_rows_parallel(src_conn, t, out_dir, category_cache, inserted_counts, row_counts_by_category, row_filter,
+                                profiler)
+            if tracked:
+                record_incremental(src_conn, t, source)
+            continue
+
         col_list = ", ".join(quote_ident(c) for c in cols)
         placeholders = ", ".join("?" for _ in cols)
         insert_stmt_template = f'INSERT OR REPLACE INTO {quote_ident(tname)} ({col_list}) VALUES ({placeholders})'
 
-        sel_cur = src_conn.execute(f'SELECT * FROM {quote_ident(tname)};')
+        sel_cur = src_conn.execute(f'SELECT * FROM {quote_ident(tname)} WHERE {row_filter or 1};')
         while True:
             rows = sel_cur.fetchmany(FETCH_BATCH)
             if not rows:
@@ -196,25 +664,8 @@ def main(source_db_path, out_dir, include_noncategory_tables):
 
                 for cat in categories:
                     conn, created = open_target_db_for_category(out_dir, cat, category_cache)
-                    if tname not in created:
-                        if create_sql:
-                            try:
-                                conn.executescript(create_sql if "IF NOT EXISTS" in create_sql.upper() else re.sub(r'CREATE\s+TABLE', 'CREATE TABLE IF NOT EXISTS', create_sql, flags=re.IGNORECASE, count=1))
-                            except Exception as e:
-                                alt_sql = build_create_table_sql(tname, None, src_conn)
-                                if alt_sql:
-                                    conn.executescript(alt_sql)
-                                else:
-                                    print(f"WARNING: Could not create table {tname} in target DB for category '{cat}': {e}")
-                                    continue
-                        else:
-                            alt_sql = build_create_table_sql(tname, None, src_conn)
-                            if alt_sql:
-                                conn.executescript(alt_sql)
-                            else:
-                                print(f"WARNING: No CREATE SQL available for table {tname}. Skipping.")
-                                continue
-                        created.add(tname)
+                    if not ensure_target_table(conn, created, tname, create_sql, src_conn, cat):
+                        continue
 
                     vals = row_to_tuple(row, cols)
                     try:
@@ -233,6 +684,10 @@ def main(source_db_path, out_dir, include_noncategory_tables):
                     info['conn'].commit()
                 except Exception:
                     pass
+            if profiler is not None:
+                profiler.tick(len(rows))
+        if tracked:
+            record_incremental(src_conn, t, source)
 
     for cat, info in category_cache.items():
         try:
@@ -242,6 +697,8 @@ def main(source_db_path, out_dir, include_noncategory_tables):
             pass
 
     src_conn.close()
+    if profiler is not None:
+        profiler.stop()
 
     print("\nDone. Summary:")
     total_files = len(category_cache)
@@ -262,5 +719,14 @@ if __name__ == '__main__':
     parser.add_argument('--db', help='Path to source sqlite DB', default=DEFAULT_DB_PATH)
     parser.add_argument('--outdir', help='Output directory for category DBs (default: same folder as source DB)', default=None)
     parser.add_argument('--include-noncategory', help='Also include tables that do NOT have a detected category column (they go to Uncategorized.db)', action='store_true')
+    parser.add_argument('--no-fast-path', help='Copy every table row by row in Python, even when its category column is single-valued', action='store_true')
+    parser.add_argument('--incremental', help='Only copy rows added or re-categorized since the last --incremental run (state kept in the output folder)', action='store_true')
+    parser.add_argument('--workers', type=int, default=SPLIT_WORKERS, help='Category DBs written concurrently (1 = one thread, one DB at a time)')
+    parser.add_argument('--profile', help='Profile the first --profile-window rows (cProfile or stack sampling, plus tracemalloc) and write reports', action='store_true')
+    parser.add_argument('--profile-window', type=int, default=PROFILE_ROWS, help='Rows to profile with --profile')
+    parser.add_argument('--profile-mode', choices=PROFILE_MODES, default='cprofile', help="'cprofile' (reading thread, exact call counts) or 'sample' (stack samples of every thread)")
+    parser.add_argument('--profile-dir', help=f'Folder for the profile reports (default: {PROFILE_DIRNAME}/ in the output folder)', default=None)
     args = parser.parse_args()
-    main(args.db, args.outdir, args.include_noncategory)
+    main(args.db, args.outdir, args.include_noncategory, fast_path=not args.no_fast_path, incremental=args.incremental,
+         workers=args.workers, profile=args.profile, profile_window=args.profile_window,
+         profile_mode=args.profile_mode, profile_dir=args.profile_dir)
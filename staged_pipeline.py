@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+staged_pipeline.py
+
+Fetch -> CPU -> write pipeline for the crawl (--cpu-workers N).
+
+ - fetch: the crawl engine's I/O threads download pages (fetch_stage) and
+   hand the raw bytes over; they no longer parse, so a host is released as
+   soon as its response has arrived.
+ - cpu:   a process pool parses, cleans, classifies and content-checks
+   (analyze) on all cores.
+ - write: one thread does everything that writes SQLite (dedup lookups,
+   store, queue outlinks, mark the URL done).
+
+Stages are joined by bounded queues. A slow writer fills the CPU slots, the
+feeder stops submitting, the fetch queue fills and the fetch threads block:
+backpressure instead of unbounded memory. Per-stage counters (items, items/sec,
+busy share, queue depth) are printed as the crawl runs; the stage with the
+highest busy share is the bottleneck.
+
+A URL is only marked done by the writer, so a crash or Ctrl+C leaves the
+in-flight URLs leased in pending_urls and the next run picks them up again.
+"""
+
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# ----------------- Config -----------------
+# Fetched pages that may wait for the CPU pool, per CPU worker
+CPU_QUEUE_PER_WORKER = 4
+# Pages that may be in the pool or waiting for the writer, per CPU worker
+WRITE_SLOTS_PER_WORKER = 4
+# Print the stage counters every N written pages
+STAGE_REPORT_EVERY = 25
+# How often blocked stages re-check for shutdown (seconds)
+STOP_POLL = 0.5
+# ------------------------------------------
+
+class StageCounter:
+    """Items through one stage and the time spent working on them (thread-safe)."""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = max(1, workers)
+        self.count = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.busy += seconds
+
+    def utilization(self, elapsed):
+        return self.busy / (max(elapsed, 1e-9) * self.workers)
+
+    def line(self, elapsed, queued=None):
+        q = f", q={queued}" if queued is not None else ""
+        return (f"{self.name} {self.count} ({self.count / max(elapsed, 1e-9):.1f}/s, "
+                f"{self.utilization(elapsed):.0%} busy{q})")
+
+def _ignore_sigint():
+    # Ctrl+C is handled by the parent, which drains the pipeline; workers keep going
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _noop():
+    return None
+
+def _timed(analyze, args):
+    # Runs in a pool worker: the analysis result plus its CPU time
+    start = time.perf_counter()
+    result = analyze(*args)
+    return result, time.perf_counter() - start
+
+class StagedPipeline:
+    """
+    fetch(url, depth)         -> fetched page (picklable) or None to drop the URL
+    analyze(url, depth, page) -> result; top-level function, runs in the process pool
+    write(result)             -> True if stored; runs on the single writer thread
+    complete(url)             -> marks the URL done (visited + dequeued)
+
+    Plug into run_concurrent as process_url=fetch_stage, finish=finish,
+    busy=busy; call close() afterwards.
+    """
+
+    def __init__(self, fetch, analyze, write, complete, cpu_workers, fetch_workers=1, rate=None):
+        self._fetch = fetch
+        self._analyze = analyze
+        self._write = write
+        self._complete = complete
+        self.rate = rate
+        self.cpu_q = queue.Queue(maxsize=cpu_workers * CPU_QUEUE_PER_WORKER)
+        self.write_q = queue.Queue()  # bounded by _slots
+        self._slots = threading.BoundedSemaphore(cpu_workers * WRITE_SLOTS_PER_WORKER)
+        self._handed = set()          # URLs owned by the cpu/write stages
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stopping = False
+        self.started = time.monotonic()
+        self.counters = {
+            'fetch': StageCounter('fetch', fetch_workers),
+            'cpu': StageCounter('cpu', cpu_workers),
+            'write': StageCounter('write', 1),
+        }
+        self.pool = ProcessPoolExecutor(max_workers=cpu_workers, initializer=_ignore_sigint)
+        # Start the pool's processes now, before any fetch thread exists
+        self.pool.submit(_noop).result()
+        self._feeder = threading.Thread(target=self._feed, name='cpu-feeder', daemon=True)
+        self._writer = threading.Thread(target=self._write_loop, name='writer', daemon=True)
+        self._feeder.start()
+        self._writer.start()
+
+    # ---- fetch stage (crawl engine worker threads) ----
+    def fetch_stage(self, url, depth):
+        self._local.handed = None
+        start = time.perf_counter()
+        page = self._fetch(url, depth)
+        self.counters['fetch'].add(time.perf_counter() - start)
+        if page is None:
+            return False
+        with self._lock:
+            self._handed.add(url)
+        self._local.handed = url
+        while True:
+            try:
+                # Blocks while the CPU stage is behind (backpressure on fetching)
+                self.cpu_q.put((url, depth, page), timeout=STOP_POLL)
+                return False
+            except queue.Full:
+                if self._stopping:
+                    return False
+
+    def finish(self, url):
+        """Engine callback (same thread as fetch_stage): complete URLs that were not handed over."""
+        if getattr(self._local, 'handed', None) == url:
+            self._local.handed = None
+            return  # the writer completes it
+        self._complete(url)
+
+    def busy(self):
+        """True while fetched pages are still being analyzed or written (they may add links)."""
+        with self._lock:
+            return bool(self._handed)
+
+    # ---- cpu stage ----
+    def _feed(self):
+        while not self._stopping:
+            try:
+                item = self.cpu_q.get(timeout=STOP_POLL)
+            except queue.Empty:
+                continue
+            while not self._slots.acquire(timeout=STOP_POLL):
+                if self._stopping:
+                    return
+            try:
+                fut = self.pool.submit(_timed, self._analyze, item)
+            except RuntimeError:  # pool shut down
+                return
+            fut.add_done_callback(lambda f, item=item: self.write_q.put((item, f)))
+
+    # ---- write stage ----
+    def _write_loop(self):
+        while True:
+            entry = self.write_q.get()
+            if entry is None:
+                return
+            (url, _depth, _page), fut = entry
+            if fut.cancelled():
+                continue  # shutting down: leave the URL leased for the next run
+            try:
+                result, cpu_secs = fut.result()
+                self.counters['cpu'].add(cpu_secs)
+                start = time.perf_counter()
+                stored = self._write(result)
+                self.counters['write'].add(time.perf_counter() - start)
+                if stored and self.rate is not None:
+                    self.rate.record_stored()
+                if self.counters['write'].count % STAGE_REPORT_EVERY == 0:
+                    print(f"[stages] {self.summary()}")
+            except Exception as e:
+                print(f"Pipeline error for {url}: {e}")
+            finally:
+                self._complete(url)
+                with self._lock:
+                    self._handed.discard(url)
+                self._slots.release()
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        fetch, cpu, write = self.counters['fetch'], self.counters['cpu'], self.counters['write']
+        bottleneck = max(self.counters.values(), key=lambda c: c.utilization(elapsed)).name
+        return (f"{fetch.line(elapsed)} | {cpu.line(elapsed, self.cpu_q.qsize())} | "
+                f"{write.line(elapsed, self.write_q.qsize())} | bottleneck: {bottleneck}")
+
+    def close(self):
+        """Stop the stages. Pages already analyzed are still written; queued ones stay leased."""
+        self._stopping = True
+        self._feeder.join()
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        self.write_q.put(None)
+        self._writer.join()
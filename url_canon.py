@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+url_canon.py
+
+URL canonicalization and 64-bit URL fingerprints for the crawl frontier.
+
+canonicalize() turns a URL into the form that is queued and fetched:
+ - scheme and host lowercased, default ports (:80 / :443) and a trailing
+   host dot dropped, an empty path written as '/'
+ - the #fragment dropped
+ - tracking parameters (utm_*, gclid, fbclid, ...) and session parameters
+   (PHPSESSID, jsessionid, ...; also ;jsessionid=... path parameters)
+   removed, the remaining query parameters sorted (their encoding is kept)
+
+Only unambiguous names are dropped everywhere. Short generic names such as
+`sid` name page content on some sites, and since the query is part of the
+fingerprint, dropping them would merge distinct pages into one key: they are
+dropped only when the value looks like a session token (SESSION_TOKEN_RE),
+or for the hosts listed in HOST_DROP_PARAMS.
+
+url_key() folds the differences that still name the same page but must stay
+in a fetchable URL: http vs https, a leading 'www.' and a trailing slash.
+url_fingerprint() hashes that key to a signed 64-bit integer (blake2b), the
+key of visited_urls / pending_urls in crawl_state.py. Collisions are possible
+but negligible at crawl sizes (about 1 in 10^7 at ten million URLs).
+"""
+
+import hashlib
+import re
+from urllib.parse import urlsplit, urlunsplit, unquote
+
+# ----------------- Config -----------------
+# Query parameters dropped from every URL (compared lowercased)
+TRACKING_PARAM_PREFIXES = ('utm_',)
+TRACKING_PARAMS = frozenset((
+    'gclid', 'dclid', 'fbclid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi',
+    'mkt_tok',
+))
+SESSION_PARAMS = frozenset((
+    'phpsessid', 'jsessionid', 'sessionid', 'session_id', 'sessid', 'aspsessionid', 'cfid', 'cftoken',
+    'zenid', 'oscsid',
+))
+# Generic names dropped only when their value looks like a session token
+TOKEN_PARAMS = frozenset(('sid', 's_id'))
+# Long hex, or long letters+digits mix (a page id like sid=42 or sid=news is kept)
+SESSION_TOKEN_RE = re.compile(r'^(?:[0-9a-f]{16,}|(?=[a-z0-9_-]*[0-9])(?=[a-z0-9_-]*[a-z])[a-z0-9_-]{20,})$', re.IGNORECASE)
+# Extra parameters dropped on specific hosts (host without 'www.' -> names), e.g. {'example.com': {'spm', 'ref_src'}}
+HOST_DROP_PARAMS = {}
+# ------------------------------------------
+
+_DEFAULT_PORTS = {'http': '80', 'https': '443'}
+_DROP_PARAMS = TRACKING_PARAMS | SESSION_PARAMS
+# ;jsessionid=ABC inside the path (Java servlet containers)
+_PATH_SESSION_RE = re.compile(r';(?:jsessionid|phpsessid)=[^/?#]*', re.IGNORECASE)
+
+def _keep_param(piece, host_drop):
+    name, _, value = piece.partition('=')
+    name = unquote(name).strip().lower()
+    if not name or name in _DROP_PARAMS or name in host_drop or name.startswith(TRACKING_PARAM_PREFIXES):
+        return False
+    return not (name in TOKEN_PARAMS and SESSION_TOKEN_RE.match(unquote(value)))
+
+def canonicalize(url):
+    """Canonical, still fetchable form of `url` (see the module docstring); non-http(s) URLs only lose the fragment."""
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+    except ValueError:  # e.g. a malformed IPv6 host
+        return url.split('#')[0]
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS:
+        return url.split('#')[0]
+    userinfo, at, host = parts.netloc.rpartition('@')
+    host = host.lower()
+    port = ''
+    if host.startswith('['):  # IPv6 literal
+        end = host.find(']') + 1
+        host, port = host[:end], host[end + 1:]
+    elif ':' in host:
+        host, _, port = host.partition(':')
+    host = host.rstrip('.')
+    if port == _DEFAULT_PORTS[scheme]:
+        port = ''
+    netloc = userinfo + at + host + (':' + port if port else '')
+    path = parts.path or '/'
+    if ';' in path:
+        path = _PATH_SESSION_RE.sub('', path)
+    query = parts.query
+    if query:
+        host_drop = HOST_DROP_PARAMS.get(host[4:] if host.startswith('www.') else host, ())
+        query = '&'.join(sorted(p for p in query.split('&') if _keep_param(p, host_drop)))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+def url_key(canonical_url):
+    """Identity of a canonical URL: no scheme, no leading 'www.', no trailing slash."""
+    rest = canonical_url.partition('://')[2] or canonical_url
+    if rest.startswith('www.'):
+        rest = rest[4:]
+    path, q, query = rest.partition('?')
+    path = path.rstrip('/')
+    return path + q + query
+
+def _fingerprint(key):
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+def canonical_fingerprint(url):
+    """(canonicalize(url), its 64-bit fingerprint) in one go."""
+    canonical = canonicalize(url)
+    return canonical, _fingerprint(url_key(canonical))
+
+def url_fingerprint(url):
+    """Signed 64-bit fingerprint of `url` (canonicalized first), fits an SQLite INTEGER."""
+    return _fingerprint(url_key(canonicalize(url)))